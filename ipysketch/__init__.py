@@ -1 +1,6 @@
-from .ipywidget import Sketch
+def __getattr__(name):
+    # Importing the widget pulls in ipywidgets, which the sketch pad itself does not need
+    if name == 'Sketch':
+        from .ipywidget import Sketch
+        return Sketch
+    raise AttributeError("module 'ipysketch' has no attribute %r" % name)
@@ -9,5 +9,6 @@ if __name__ == '__main__':
     except:
         print('Invalid or missing sketch name')
         sys.exit(1)
-    main(name)
+    # An image file to annotate can be given as second argument
+    main(name, sys.argv[2] if len(sys.argv) > 2 else None)
 
@@ -1,23 +1,32 @@
 import tkinter as tk
-import pkg_resources
 
-import pickle
 import os
-import io
-from PIL import Image, ImageTk
 
+from ipysketch.background import load_background
 from ipysketch.controller import ColorButtonGroupController, ActionButtonGroupController, \
     CanvasController, LineWidthButtonGroupController
 from ipysketch.canvas import ObjectVar
-from ipysketch.buttons import SimpleIconButton, SaveButton
+from ipysketch.catalog import Catalog
+from ipysketch.events import EventBus, CONTENT_EVENTS
+from ipysketch.buttons import SimpleIconButton, SaveButton, PageButton, PageIndicator
 from ipysketch.constants import *
-from ipysketch.model import Pen, SketchModel, History
+from ipysketch.document import Document
+from ipysketch.icons import asset_path
+from ipysketch.export import SavePipeline, DEFAULT_OUTPUTS
+from ipysketch.model import Pen, History
+from ipysketch.profiling import LatencyProfiler
+from ipysketch.recording import InputRecorder
+from ipysketch.storage import ChunkedSketch, ProgressiveLoader
+
+# Initial size of the window
+WINDOW_SIZE = (800, 600)
 
 
 class Application(tk.Tk):
     """ The Sketch Pad App """
 
-    def __init__(self, name, *args, **kwargs):
+    def __init__(self, name, *args, profile=None, record=None, outputs=None, png_effort=None, background=None,
+                 catalog=None, **kwargs):
         super().__init__(*args, **kwargs)
 
         # The name of the sketch. Used as basename for the image files.
@@ -25,33 +34,71 @@ class Application(tk.Tk):
             raise Exception('No sketch name given.')
         self.name = name
 
-        self.history = self._create_model_history()
+        # Latency profiling can be switched on by argument or environment variable
+        if profile is None:
+            profile = os.environ.get('IPYSKETCH_PROFILE', '0') not in ('', '0')
+        self.profiler = LatencyProfiler() if profile else None
+
+        # Optionally record the input session to a file (see ipysketch.recording)
+        if record is None:
+            record = os.environ.get('IPYSKETCH_RECORD')
+        self.record_file = record
+        self.recorder = InputRecorder() if record else None
+
+        # The files written on saving, by extension (see ipysketch.export)
+        if outputs is None:
+            env_outputs = os.environ.get('IPYSKETCH_OUTPUTS')
+            outputs = env_outputs.split(',') if env_outputs else DEFAULT_OUTPUTS
+        if png_effort is None:
+            png_effort = os.environ.get('IPYSKETCH_PNG_EFFORT', 'default')
+        # Saved sketches can be recorded in the catalog of the folder, switched on by
+        # argument or by setting IPYSKETCH_CATALOG=1 (see ipysketch.catalog)
+        if catalog is None:
+            catalog = os.environ.get('IPYSKETCH_CATALOG', '0') not in ('', '0')
+        self.catalog = Catalog(os.curdir) if catalog else None
+        self.save_pipeline = SavePipeline(outputs, png_effort=png_effort, catalog=self.catalog)
+
+        # Model changes are delivered to subscribers once per frame
+        self.events = EventBus(schedule=self.after_idle)
+        self.document = self._create_document()
 
         self._create_toolbar()
+        self.events.subscribe(lambda events: self.dirty.set(True), kinds=CONTENT_EVENTS)
         self._create_canvas()
         self._configure_window()
 
+        # Optionally show an image under the sketch, e.g. a plot to annotate
+        if background:
+            self.set_background(background)
+
+        if self.loader is not None:
+            self.after(1, self._load_next_chunk)
+
+        self.bind('<Prior>', self.previous_page)
+        self.bind('<Next>', self.next_page)
+        self.bind('<Control-n>', self.new_page)
+
         self.wait_visibility()
         self.attributes('-topmost', False)
-        icon = pkg_resources.resource_filename('ipysketch', os.path.join('assets', 'logo.ico'))
-        self.iconbitmap(icon)
-        png = pkg_resources.resource_filename('ipysketch', os.path.join('assets', 'logo.png'))
-        png = Image.open(png)
-        self.iconphoto(True, ImageTk.PhotoImage(png))
+        self.iconbitmap(asset_path('logo.ico'))
+        self.iconphoto(True, tk.PhotoImage(master=self, file=asset_path('logo.png')))
         self.title('ipysketch ' + name)
 
     def _configure_window(self):
         self.rowconfigure(0, weight=0)
         self.rowconfigure(1, weight=1)
         self.columnconfigure(0, weight=1)
-        self.geometry('800x600+100+100')
+        self.geometry('%dx%d+100+100' % WINDOW_SIZE)
         self.lift()
         self.attributes('-topmost', True)
 
     def _create_canvas(self):
         frame = tk.Frame(self, border=4)
         frame.grid(row=1, column=0, sticky='NWSE')
-        self.canvas_controller = CanvasController(self, frame)
+        self.canvas_controller = CanvasController(self, frame, profiler=self.profiler)
+        if self.profiler:
+            self.bind('<F12>', self.canvas_controller.toggle_overlay)
+            self.bind('<Control-F12>', self.dump_profile)
 
     def _create_toolbar(self):
         """Sets up the toolbar and its controllers."""
@@ -86,19 +133,51 @@ class Application(tk.Tk):
         self.linewidth_controller = LineWidthButtonGroupController(frame, self)
         self.linewidth_controller.onoffvars[0].set(True)
 
-    def _create_model_history(self):
-        """ Start a history of sketch models and optionally initialize it with a given sketch.
+        # Set up the page navigation
+        self.page_var = ObjectVar()
+        self.page_var.set((self.document.active, len(self.document)))
+        PageButton(frame, 'previous', self.page_var, self.previous_page).pack(side=tk.LEFT)
+        PageIndicator(frame, self.page_var).pack(side=tk.LEFT)
+        PageButton(frame, 'next', self.page_var, self.next_page).pack(side=tk.LEFT)
+        PageButton(frame, 'new', self.page_var, self.new_page).pack(side=tk.LEFT)
 
-        :return: History object of models
+    def _create_document(self):
+        """ Open the pages of the sketch, if it exists, or start a new one.
+
+        :return: Document
         """
         file_name = self.name + '.isk'
-        if os.path.exists(file_name):
-            with open(file_name, 'rb') as f:
-                model = pickle.load(f)
+        self.loader = None
+        document = Document(file_name, bus=self.events)
+        if not document.pages[0].loaded:
+            # Only the chunks in the initial view are loaded before the window is shown,
+            # the others are loaded piece by piece once the application is running
+            sketch = ChunkedSketch(file_name, 0)
+            history = History(sketch.empty_model(), bus=self.events)
+            self.loader = ProgressiveLoader(sketch, history, ((0, 0), WINDOW_SIZE))
+            document.pages[0].history = history
+        return document
+
+    def _load_next_chunk(self):
+        if self.loader is None:
+            return
+        if self.history.in_transaction:
+            # Do not change the model in the middle of a gesture
+            self.after(50, self._load_next_chunk)
+        elif self.loader.step():
+            self.after(1, self._load_next_chunk)
         else:
-            model = SketchModel()
+            self.loader = None
+
+    def _finish_loading(self):
+        if self.loader is not None:
+            self.loader.finish()
+            self.loader = None
 
-        return History(model)
+    @property
+    def history(self):
+        """ The undo history of the active page. """
+        return self.document.history()
 
     @property
     def model(self):
@@ -131,6 +210,15 @@ class Application(tk.Tk):
         elif value == ACTION_MOVE:
             self.action_controller.set(3)
 
+    @property
+    def erase_mode(self):
+        """ Return ERASE_PATHS or ERASE_SEGMENTS. """
+        return self.action_controller.erase_mode.get()
+
+    @erase_mode.setter
+    def erase_mode(self, value):
+        self.action_controller.erase_mode.set(value)
+
     @property
     def pen(self):
         """ Return a Pen object with the currently selected color and line width. """
@@ -138,57 +226,128 @@ class Application(tk.Tk):
         width = self.linewidth_controller.get()
         return Pen(color=color, width=width)
 
+    @pen.setter
+    def pen(self, value):
+        self._select_value(self.colors_controller, self.colors_controller.colorvars, value.color)
+        self._select_value(self.linewidth_controller, self.linewidth_controller.lwvars, value.width)
+
+    def _select_value(self, controller, variables, value):
+        """ Select the button in a group that holds the given value. If there is none,
+            the value is assigned to the currently selected button.
+        """
+        for idx, var in enumerate(variables):
+            if var.get() == value:
+                controller.set(idx)
+                return
+        idx, _ = controller.get_selected()
+        variables[idx].set(value)
+
     def save(self, event):
         """ Save the current model to files."""
+        self._finish_loading()
+        self.save_pipeline.save_document(self.document, os.path.join(os.curdir, self.name))
+        self.dirty.set(False)
 
-        with open(os.path.join(os.curdir, self.name + '.isk'), 'wb') as f:
-            pickle.dump(self.canvas_controller.model, f)
+    def set_background(self, file_name, origin=(0, 0)):
+        """ Show an image under the sketch on the active page.
 
-        png_name = os.path.join(os.curdir, self.name + '.png')
-        # If an empty model shall be saved, we should delete the PNG
-        # so that the Jupyter cell does not display an obsolete version:
-        if len(self.model.paths) == 0:
-            if os.path.exists(png_name):
-                os.remove(png_name)
-            self.dirty.set(False)
+        :param file_name: path of the PNG or JPEG file
+        :param origin: sketch coordinates of the upper left corner of the image
+        """
+        background = load_background(file_name, origin)
+        if background == self.model.background:
             return
+        self.trigger_dirty()
+        self.model.set_background(background)
 
-        ps = self._canvas_to_postscript_cropped()
-        img = Image.open(io.BytesIO(ps.encode('utf-8')))
+    def change_layers(self, change):
+        """ Change the layers of the active page as a separate undo step, e.g.
+            app.change_layers(lambda model: model.configure_layer(uuid, visible=False)).
 
-        img.resize(img.size, resample=3)
-        img.save(png_name)
-
-        self.dirty.set(False)
+        :param change: function taking the SketchModel; it may use all layer methods
+        :return: the result of the function
+        """
+        self.trigger_dirty()
+        return change(self.model)
 
+    def show_page(self, page):
+        """ Switch to another page.
 
-    def _canvas_to_postscript_cropped(self):
-        bbox = self.model.bbox()
-        w = bbox.lr.x - bbox.ul.x
-        h = bbox.lr.y - bbox.ul.y
-        ps = self.canvas_controller.canvas.postscript(colormode='color',
-                                                      x=bbox.ul.x - 20, y=bbox.ul.y - 20,
-                                                      width=w + 40, height=h + 40)
-        return ps
+        :param page: the index of the page
+        """
+        if page == self.document.active or not 0 <= page < len(self.document):
+            return
+        # The first page must be complete before it may be released from memory
+        self._finish_loading()
+        self.history.commit()
+        self.canvas_controller.transform = None
+        self.model.selection = []
+        self.document.activate(page)
+        self.page_var.set((page, len(self.document)))
+        self.after_idle(self._load_neighbours)
+
+    def _load_neighbours(self):
+        # Load one neighbour page at a time, so that the application stays responsive
+        for page in self.document.neighbours():
+            if not self.document.pages[page].loaded:
+                self.document.history(page)
+                self.after_idle(self._load_neighbours)
+                return
+
+    def previous_page(self, event=None):
+        self.show_page(self.document.active - 1)
+
+    def next_page(self, event=None):
+        self.show_page(self.document.active + 1)
+
+    def new_page(self, event=None):
+        """ Append an empty page and show it. """
+        page = self.document.add_page()
+        self.dirty.set(True)
+        self.show_page(page)
 
     def undo(self, event):
         """Callback for the undo button."""
+        if self.recorder:
+            self.recorder.record_command('undo')
         self.history.back()
-        self.canvas_controller.update_canvas()
+        self.document.touch()
 
     def redo(self, event):
         """Callback for the redo button."""
+        if self.recorder:
+            self.recorder.record_command('redo')
         self.history.forward()
-        self.canvas_controller.update_canvas()
+        self.document.touch()
+
+    def dump_profile(self, event=None):
+        """Write the latency histograms to <name>.profile.json."""
+        if self.profiler:
+            self.profiler.dump(os.path.join(os.curdir, self.name + '.profile.json'))
+
+    def save_recording(self):
+        """Write the recorded input session, if recording is switched on."""
+        if self.recorder:
+            self.recorder.save(self.record_file)
 
     def trigger_dirty(self):
-        """Callback for when a changing action has started."""
+        """Callback for when a changing action has started. The dirty flag itself is
+           set by the model change events.
+        """
         self.history.new()
-        self.dirty.set(True)
+        self.document.touch()
+
 
+def main(name, background=None):
+    """ The main function to start the app.
 
-def main(name):
-    """ The main function to start the app. """
-    app = Application(name)
+    :param name: the name of the sketch
+    :param background: optional image file to show under the sketch
+    """
+    app = Application(name, background=background)
     app.mainloop()
+    app.save_pipeline.close()
+    app.document.close()
+    app.dump_profile()
+    app.save_recording()
 
@@ -0,0 +1,276 @@
+import math
+import os
+import threading
+import tkinter as tk
+from collections import OrderedDict
+
+from ipysketch.model import Background
+from ipysketch.raster import TILE_SIZE
+
+# Number of TilePyramids kept by get_pyramid, e.g. for the backgrounds of several pages
+PYRAMID_CACHE_SIZE = 4
+
+
+def load_background(file_name, origin=(0, 0)):
+    """ Create a Background for an image file. Only the header of the image is read.
+
+    :param file_name: path of the PNG or JPEG file
+    :param origin: sketch coordinates of the upper left corner of the image
+    :return: Background
+    """
+    from PIL import Image
+
+    with Image.open(file_name) as image:
+        return Background(file_name, image.size, origin)
+
+
+class TilePyramid(object):
+    """
+    Multi-resolution tiles of an image. Level 0 has the full resolution, each further
+    level halves it, down to the level at which the image fits into a single tile.
+
+    The image is decoded on the first request and kept in memory, so that it is not
+    decoded again on every redraw. Coarser levels are computed once from the finer ones.
+    JPEG images are decoded directly at a reduced resolution as long as only coarse levels
+    are requested. Tiles are cut from the levels on demand and kept in an LRU cache.
+
+    A pyramid may be used by several threads, e.g. by the exporters of the SavePipeline.
+    """
+
+    def __init__(self, source, tile_size=TILE_SIZE, cache_size=256):
+        """
+
+        :param source: path of the image file
+        :param tile_size: edge length of the tiles in pixels
+        :param cache_size: maximum number of tiles kept in the cache
+        """
+        from PIL import Image
+
+        self.source = source
+        self.tile_size = tile_size
+        self.cache_size = cache_size
+        with Image.open(source) as image:
+            self.size = image.size
+        # level -> decoded PIL image of the level
+        self.levels = {}
+        # (level, col, row) -> PIL image of the tile
+        self.tiles = OrderedDict()
+        self._lock = threading.RLock()
+
+    @property
+    def num_levels(self):
+        return max(0, int(math.ceil(math.log(max(self.size) / self.tile_size, 2)))) + 1
+
+    def level_size(self, level):
+        """ Returns the size of the image at a level in pixels. """
+        f = 2 ** level
+        return -(-self.size[0] // f), -(-self.size[1] // f)
+
+    def level_for(self, scale):
+        """ Returns the coarsest level with at least the resolution needed at a scale.
+
+        :param scale: scale factor from image pixels to output pixels
+        """
+        if scale >= 1:
+            return 0
+        return min(int(math.floor(math.log(1. / scale, 2))), self.num_levels - 1)
+
+    def level_image(self, level):
+        """ Returns the image of a level, decoding or downscaling it if necessary.
+
+        :param level: the level
+        :return: PIL Image in RGB or RGBA mode
+        """
+        with self._lock:
+            image = self.levels.get(level)
+            if image is not None:
+                return image
+
+            finer = [k for k in self.levels if k < level]
+            if not finer:
+                image = self._decode(level)
+                if image.size == self.size:
+                    self.levels[0] = image
+                    finer = [0]
+            if finer:
+                image = self.levels[max(finer)]
+                for _ in range(level - max(finer)):
+                    image = image.reduce(2)
+            self.levels[level] = image
+            return image
+
+    def _decode(self, level):
+        from PIL import Image
+
+        with Image.open(self.source) as image:
+            if level > 0 and image.format == 'JPEG':
+                # Let the JPEG decoder skip the resolution that is not needed
+                image.draft('RGB', self.level_size(level))
+            mode = 'RGBA' if image.mode in ('RGBA', 'LA', 'PA') or 'transparency' in image.info else 'RGB'
+            image = image.convert(mode)
+        if image.size not in (self.size, self.level_size(level)):
+            image = image.resize(self.level_size(level), Image.BILINEAR)
+        return image
+
+    def tile(self, level, col, row):
+        """ Returns a tile of a level; tiles at the right and bottom edges may be smaller.
+
+        :return: PIL Image
+        """
+        key = (level, col, row)
+        with self._lock:
+            tile = self.tiles.get(key)
+            if tile is not None:
+                self.tiles.move_to_end(key)
+                return tile
+            size = self.tile_size
+            image = self.level_image(level)
+            tile = image.crop((col * size, row * size, min((col + 1) * size, image.size[0]),
+                               min((row + 1) * size, image.size[1])))
+            self.tiles[key] = tile
+            if len(self.tiles) > self.cache_size:
+                self.tiles.popitem(last=False)
+            return tile
+
+    def tiles_in(self, bounds, level=0):
+        """ Returns the keys (column, row) of the tiles of a level overlapping a region.
+
+        :param bounds: the region in full resolution pixels as ((minx, miny), (maxx, maxy))
+        :param level: the level
+        :return: list of tuples
+        """
+        (x0, y0), (x1, y1) = bounds
+        f, size = 0.5 ** level, self.tile_size
+        w, h = self.level_size(level)
+        cols = range(max(0, int(x0 * f // size)), min(-(-w // size), int(x1 * f // size) + 1))
+        rows = range(max(0, int(y0 * f // size)), min(-(-h // size), int(y1 * f // size) + 1))
+        return [(col, row) for col in cols for row in rows]
+
+
+_pyramids = OrderedDict()
+_pyramids_lock = threading.Lock()
+
+
+def get_pyramid(source):
+    """ Returns the TilePyramid of an image file. The pyramids of recently used files are
+        shared, so that the models of the undo history and the exporters do not decode
+        the same image again. A file that has been modified gets a new pyramid.
+
+    :param source: path of the image file
+    :return: TilePyramid
+    """
+    key = (os.path.abspath(source), os.path.getmtime(source))
+    with _pyramids_lock:
+        pyramid = _pyramids.get(key)
+        if pyramid is None:
+            pyramid = _pyramids[key] = TilePyramid(source)
+            if len(_pyramids) > PYRAMID_CACHE_SIZE:
+                _pyramids.popitem(last=False)
+        else:
+            _pyramids.move_to_end(key)
+        return pyramid
+
+
+def draw_background(image, background, offset=(0, 0), scale=1.):
+    """ Paste the overlapping part of a background onto a PIL image.
+
+    Only the needed region of the pyramid level closest to the scale is cropped and
+    resized. A missing image file is skipped, so that a moved image does not prevent
+    saving the sketch.
+
+    :param image: the PIL image to draw on
+    :param background: the Background
+    :param offset: sketch coordinates of the upper left corner of the image
+    :param scale: scale factor from sketch coordinates to image pixels
+    :return:
+    """
+    from PIL import Image
+
+    if not os.path.exists(background.source):
+        return
+    pyramid = get_pyramid(background.source)
+    bx, by = background.origin
+    x0, y0 = max(offset[0], bx), max(offset[1], by)
+    x1 = min(offset[0] + image.size[0] / scale, bx + pyramid.size[0])
+    y1 = min(offset[1] + image.size[1] / scale, by + pyramid.size[1])
+    if x0 >= x1 or y0 >= y1:
+        return
+
+    level = pyramid.level_for(scale)
+    f = 0.5 ** level
+    source = pyramid.level_image(level)
+    part = source.crop((int(math.floor((x0 - bx) * f)), int(math.floor((y0 - by) * f)),
+                        int(math.ceil((x1 - bx) * f)), int(math.ceil((y1 - by) * f))))
+    size = (max(1, int(round((x1 - x0) * scale))), max(1, int(round((y1 - y0) * scale))))
+    if part.size != size:
+        part = part.resize(size, Image.BILINEAR)
+    position = (int(round((x0 - offset[0]) * scale)), int(round((y0 - offset[1]) * scale)))
+    image.paste(part, position, part if part.mode == 'RGBA' else None)
+
+
+class BackgroundLayer(object):
+    """
+    The tiles of a background shown under all other items of a Tk canvas.
+
+    Only the tiles overlapping the viewport (plus a margin of one tile) are uploaded
+    to the canvas; tiles leaving that region are dropped from the canvas again.
+    """
+
+    def __init__(self, canvas):
+        self.canvas = canvas
+        self.background = None
+        self.pyramid = None
+        # (level, column, row) -> (PhotoImage, canvas item)
+        self.items = {}
+
+    def update(self, background, viewport, scale=1.):
+        """ Show the tiles of a background needed for a viewport.
+
+        The tiles are taken from the coarsest pyramid level with enough resolution for
+        the scale, so that zooming out does not decode and upload the full image.
+
+        :param background: the Background or None
+        :param viewport: the visible region as ((minx, miny), (maxx, maxy)) in sketch coordinates
+        :param scale: the zoom factor from sketch coordinates to canvas coordinates
+        :return:
+        """
+        if background != self.background:
+            self.clear()
+            self.background = background
+            self.pyramid = None
+            if background is not None and os.path.exists(background.source):
+                self.pyramid = get_pyramid(background.source)
+        if self.pyramid is None:
+            return
+
+        from PIL import Image, ImageTk
+
+        (x0, y0), (x1, y1) = viewport
+        bx, by = self.background.origin
+        level = self.pyramid.level_for(scale)
+        # Edge length of a tile of the level in sketch coordinates
+        size = self.pyramid.tile_size * 2 ** level
+        margin = size
+        keys = set((level, col, row) for col, row in self.pyramid.tiles_in(
+            ((x0 - bx - margin, y0 - by - margin), (x1 - bx + margin, y1 - by + margin)), level))
+        for key in [key for key in self.items if key not in keys]:
+            self.canvas.delete(self.items.pop(key)[1])
+
+        new_keys = [key for key in keys if key not in self.items]
+        for key in new_keys:
+            _, col, row = key
+            tile = self.pyramid.tile(*key)
+            f = 2 ** level * scale
+            if f != 1:
+                tile = tile.resize((max(1, int(round(tile.size[0] * f))), max(1, int(round(tile.size[1] * f)))),
+                                   Image.BILINEAR)
+            photo = ImageTk.PhotoImage(tile, master=self.canvas)
+            item = self.canvas.create_image((bx + col * size) * scale, (by + row * size) * scale, anchor=tk.NW,
+                                            image=photo, tags=('background',))
+            self.items[key] = photo, item
+        if new_keys:
+            self.canvas.tag_lower('background')
+
+    def clear(self):
+        self.canvas.delete('background')
+        self.items = {}
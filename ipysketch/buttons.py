@@ -1,11 +1,8 @@
-import os
 import tkinter as tk
 from tkinter import ttk
 
-import pkg_resources
-from PIL import Image, ImageTk
-
-from ipysketch.canvas import ICON_SIZE
+from ipysketch.icons import ICON_SIZE, icon
+from ipysketch.constants import ERASE_SEGMENTS
 
 
 class ToolbarButton(tk.Canvas):
@@ -85,16 +82,11 @@ class ImageButtonMixin(object):
     A mixin class to draw an image in the interior of a ToolbarButton
     """
 
-    def __init__(self, image_map):
-        self.images = {key: self.prepare_image(value) for key, value in image_map.items()}
+    def __init__(self, parent, image_map):
+        self.images = {key: self.prepare_image(parent, value) for key, value in image_map.items()}
 
-    def prepare_image(self, image, background='#FFFFFF'):
-        image_path = pkg_resources.resource_filename('ipysketch', os.path.join('assets', image))
-        png = Image.open(image_path).convert('RGBA')
-        background = Image.new('RGBA', png.size, background)
-        alpha_composite = Image.alpha_composite(background, png)
-        img = alpha_composite.resize((ICON_SIZE, ICON_SIZE), Image.ANTIALIAS)
-        return ImageTk.PhotoImage(img)
+    def prepare_image(self, parent, image):
+        return icon(parent, image)
 
 
 class ActionButton(SelectableButton, ImageButtonMixin):
@@ -104,7 +96,7 @@ class ActionButton(SelectableButton, ImageButtonMixin):
         if image is None:
             raise Exception('No image given')
 
-        ImageButtonMixin.__init__(self, {
+        ImageButtonMixin.__init__(self, parent, {
             'normal': image
         })
 
@@ -115,11 +107,28 @@ class ActionButton(SelectableButton, ImageButtonMixin):
         self.create_image(3, 3, anchor=tk.NW, image=self.images['normal'])
 
 
+class EraserButton(ActionButton):
+    """
+    The action button for the eraser. Marks the segment erase mode with a corner.
+    """
+
+    def __init__(self, parent, onoff, mode, image, callback=None, *args, **kwargs):
+        self.mode = mode
+        super().__init__(parent, onoff, image, callback, *args, **kwargs)
+        self.mode.register(self)
+
+    def draw_interior(self):
+        super().draw_interior()
+        if self.mode.get() == ERASE_SEGMENTS:
+            self.create_polygon((ICON_SIZE - 10, ICON_SIZE, ICON_SIZE, ICON_SIZE - 10, ICON_SIZE, ICON_SIZE),
+                                fill='red')
+
+
 class SimpleIconButton(ToolbarButton, ImageButtonMixin):
 
     def __init__(self, frame, image_map, statevar, callback):
 
-        ImageButtonMixin.__init__(self, image_map)
+        ImageButtonMixin.__init__(self, frame, image_map)
         self.statevar = statevar
 
         ToolbarButton.__init__(self, frame, statevar, callback)
@@ -223,3 +232,54 @@ class LineWidthChooser(tk.Canvas):
     def set(self, value):
         self.line_width = value
         self.draw()
+
+
+class PageButton(ToolbarButton):
+    """
+    The buttons for going to the previous or next page and for adding a page.
+    The page variable holds the tuple (index of the active page, number of pages).
+    """
+
+    def __init__(self, parent, kind, page, callback=None, *args, **kwargs):
+        """
+
+        :param kind: 'previous', 'next' or 'new'
+        :param page: the page variable
+        """
+        self.kind = kind
+        super().__init__(parent, page, callback, *args, **kwargs)
+        self.draw()
+
+    def enabled(self):
+        active, count = self.variable.get()
+        if self.kind == 'previous':
+            return active > 0
+        if self.kind == 'next':
+            return active < count - 1
+        return True
+
+    def draw_interior(self):
+        color = 'black' if self.enabled() else '#C0C0C0'
+        c, m = ICON_SIZE // 2, 8
+        if self.kind == 'previous':
+            self.create_polygon((ICON_SIZE - m, m, m, c, ICON_SIZE - m, ICON_SIZE - m), fill=color)
+        elif self.kind == 'next':
+            self.create_polygon((m, m, ICON_SIZE - m, c, m, ICON_SIZE - m), fill=color)
+        else:
+            self.create_line((c, m, c, ICON_SIZE - m), fill=color, width=3)
+            self.create_line((m, c, ICON_SIZE - m, c), fill=color, width=3)
+
+
+class PageIndicator(ToolbarButton):
+    """
+    Shows the number of the active page and the number of pages.
+    """
+
+    def __init__(self, parent, page, *args, **kwargs):
+        super().__init__(parent, page, lambda event: None, *args, **kwargs)
+        self.config(width=2 * ICON_SIZE)
+        self.draw()
+
+    def draw_interior(self):
+        active, count = self.variable.get()
+        self.create_text(ICON_SIZE, ICON_SIZE // 2 + 1, text='%d/%d' % (active + 1, count))
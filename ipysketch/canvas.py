@@ -1,13 +1,21 @@
 import tkinter as tk
+from contextlib import contextmanager
 
+from ipysketch.background import BackgroundLayer
+from ipysketch.icons import ICON_SIZE
 from ipysketch.model import flatten, Pen, Point
-
-ICON_SIZE = 30
+from ipysketch.profiling import profiled_canvas
+from ipysketch.raster import RasterLayer
+from ipysketch.render import Renderer, SELECTION_COLOR, SELECTION_EXTRA_WIDTH, apply_transform
 
 
 class ObjectVar(object):
     """
     Generalization of the tkinter classes StringVar, IntVar, etc. for general objects.
+
+    Observers are only notified if the value actually changes. The notifications
+    are collected and delivered once per observer, either when the Tk event loop
+    becomes idle or at the end of a batch() scope.
     """
 
     def __init__(self):
@@ -28,19 +36,150 @@ class ObjectVar(object):
 
     def set(self, value):
         """Set the current value."""
+        if value == self._value:
+            return
         self._value = value
-        for user in self._users:
+        _notify(self._users)
+
+
+# Observers waiting for their update (used as an ordered set)
+_pending_updates = {}
+# Tk root windows on which a flush of the pending updates has been scheduled
+_scheduled_roots = set()
+_batch_depth = 0
+
+
+@contextmanager
+def batch():
+    """ Context manager for changing several ObjectVars at once. Each affected observer
+        is updated once at the end of the outermost batch.
+    """
+    global _batch_depth
+    _batch_depth += 1
+    try:
+        yield
+    finally:
+        _batch_depth -= 1
+        if _batch_depth == 0:
+            flush_updates()
+
+
+def flush_updates():
+    """ Deliver all pending observer updates. """
+    _scheduled_roots.clear()
+    while _pending_updates:
+        user = next(iter(_pending_updates))
+        del _pending_updates[user]
+        try:
             user.update()
+        except tk.TclError:
+            # The widget has been destroyed in the meantime
+            pass
+
+
+def _notify(users):
+    for user in users:
+        _pending_updates[user] = None
+    if _batch_depth > 0:
+        return
+
+    for user in users:
+        if isinstance(user, tk.Misc):
+            root = user._root()
+            if root not in _scheduled_roots:
+                _scheduled_roots.add(root)
+                root.after_idle(flush_updates)
+        else:
+            # Observers outside of Tk are updated right away
+            flush_updates()
+            return
+
 
+def line_points(path, transform=None):
+    """ Returns the coordinates for drawing a path with create_line.
 
-class SketchCanvas(tk.Canvas):
-    """ Customization of the standard TK Canvas class """
+    Paths are drawn as the polylines of their cached tessellations with smooth=False,
+    so that Tk does not compute the spline again whenever a line item is created.
+
+    :param path: the Path
+    :param transform: optional Translation to apply
+    :return: tuple of the flattened coordinates
+    """
+    coords = path.tessellation()
+    if transform:
+        vector = transform.destination - transform.origin
+        coords = coords + (vector.x, vector.y)
+    return flatten(coords)
+
+
+class SketchCanvas(tk.Canvas, Renderer):
+    """ Customization of the standard TK Canvas class. This is the Tk render backend. """
 
     def __init__(self, *args, **kwargs):
         self._scroll_region = (-1500, -1500, 1500, 1500)
         super().__init__(*args, scrollregion=self._scroll_region, **kwargs)
         self.config(cursor='crosshair')
-
+        # Optional LatencyProfiler, see ipysketch.profiling
+        self.profiler = None
+        self._overlay_text = None
+        # Finished, unselected paths are baked into bitmap tiles, one RasterLayer per
+        # layer of the model (by layer uuid); all other paths are drawn as vector
+        # items with the tag 'vector'
+        self.rasters = {}
+        # Tags of the tiles of the layers from the bottom to the top layer
+        self._raster_tags = []
+        # Zoom factor from sketch to canvas coordinates; the view is not zoomable yet, but
+        # the background already picks its pyramid level from it
+        self.scale = 1.
+        # The background image, below everything else
+        self.background = BackgroundLayer(self)
+        self.bind('<Configure>', lambda event: self._update_background(), add='+')
+
+    def create_line(self, *args, **kwargs):
+        if self.profiler:
+            self.profiler.count_items()
+        return super().create_line(*args, **kwargs)
+
+    def delete(self, *tags):
+        if self.profiler:
+            self.profiler.count_items(sum(len(self.find_withtag(tag)) for tag in tags))
+        super().delete(*tags)
+
+    def _raster(self, layer):
+        raster = self.rasters.get(layer.uuid)
+        if raster is None:
+            raster = RasterLayer(self, tag='raster-' + layer.uuid, restack=self._restack_rasters)
+            self.rasters[layer.uuid] = raster
+        return raster
+
+    def _restack_rasters(self):
+        # Lowering the layers from the top one down leaves the bottom layer lowest
+        for tag in reversed(self._raster_tags):
+            self.tag_lower(tag)
+        self.tag_lower('background')
+
+    def _viewport(self):
+        origin = self.origin()
+        return (origin.x, origin.y), (origin.x + self.winfo_width(), origin.y + self.winfo_height())
+
+    def _update_background(self):
+        # Upload the background tiles which have come into view
+        self.background.update(self.background.background, self._viewport(), self.scale)
+
+    def show_overlay(self, text):
+        """ Show a debug text overlay in the upper left corner of the visible area.
+
+        :param text: the text to show or None to remove the overlay
+        :return:
+        """
+        self._overlay_text = text
+        super().delete('debug-overlay')
+        if text:
+            origin = self.origin()
+            self.create_text(origin.x + 5, origin.y + 5, anchor=tk.NW, text=text,
+                             fill='#808080', font=('TkFixedFont', 8), tag='debug-overlay')
+
+    @profiled_canvas
     def update_paths(self, *paths, transform=None, selected=False):
         """ Update one or more paths on the canvas.
 
@@ -53,19 +192,21 @@ class SketchCanvas(tk.Canvas):
         if isinstance(paths[0], list):
             paths = paths[0]
 
+        # Paths that are changing are shown as vector items
+        for raster in self.rasters.values():
+            raster.remove(paths)
+
         for path in paths:
-            if transform:
-                path = self.apply_transform(path, transform)
             self.delete(path.uuid)
-            points = flatten(path.points)
+            points = line_points(path, transform)
+            tags = (path.uuid, 'vector')
             if selected:
-                pen = Pen(width=path.pen.width + 4, color='#00FFFF')
-                if len(points) == 2:
-                    points = (points[0], points[1], points[0], points[1])
-                self.create_line(points, fill=pen.color, smooth=True, width=pen.width, tag=path.uuid)
+                pen = Pen(width=path.pen.width + SELECTION_EXTRA_WIDTH, color=SELECTION_COLOR)
+                self.create_line(points, fill=pen.color, width=pen.width, tags=tags)
 
-            self.create_line(points, fill=path.pen.color, smooth=True, width=path.pen.width, tag=path.uuid)
+            self.create_line(points, tags=tags, **path.pen.line_options)
 
+    @profiled_canvas
     def delete_paths(self, *paths):
         """ Delete one or more paths from the canvas.
 
@@ -74,9 +215,34 @@ class SketchCanvas(tk.Canvas):
         """
         if isinstance(paths[0], list):
             paths = paths[0]
+        for raster in self.rasters.values():
+            raster.remove(paths)
         for p in paths:
             self.delete(p.uuid)
 
+    @profiled_canvas
+    def bake_paths(self, model, paths):
+        """ Move finished paths into the raster tiles of their layers and delete their
+            vector items, so that the strokes of a drawing session do not pile up as
+            Tk lines.
+
+        :param model: the SketchModel of the paths
+        :param paths: list of finished, unselected Path objects on visible layers
+        :return:
+        """
+        tags = ['raster-' + layer.uuid for layer in model.layers]
+        if tags != self._raster_tags:
+            # Tiles created here are stacked in the order of the layers like those of draw()
+            self._raster_tags = tags
+        by_layer = {}
+        for path in paths:
+            by_layer.setdefault(model.layer_of(path), []).append(path)
+        for layer, layer_paths in by_layer.items():
+            self._raster(layer).add(layer_paths)
+        for path in paths:
+            self.delete(path.uuid)
+
+    @profiled_canvas
     def draw(self, model, selection=None, transform=None):
         """ Redraw the complete model.
 
@@ -87,28 +253,49 @@ class SketchCanvas(tk.Canvas):
         """
 
         selection = selection or []
-        self.delete('all')
-
-        for selected_path in selection:
-            path = self.apply_transform(selected_path, transform)
-            points = flatten(path.points)
-            pen = Pen(width=path.pen.width+4, color='#00FFFF')
-            self.create_line(points, fill=pen.color, smooth=True, width=pen.width, tag=path.uuid)
+        self.delete('vector')
+        self.background.update(model.background, self._viewport(), self.scale)
 
+        selected = set(id(path) for path in selection)
+        layer_paths = {layer.uuid: [] for layer in model.layers}
         for path in model.paths:
-            if path in selection:
-                path = self.apply_transform(path, transform)
-            points = flatten(path.points)
-            pen = path.pen
-            self.create_line(points, fill=pen.color, smooth=True, width=pen.width, tag=path.uuid)
+            if path.finished and id(path) not in selected:
+                layer_paths[model.layer_of(path).uuid].append(path)
+
+        # The caches of hidden layers are kept as they are until the layer is shown again
+        tags = ['raster-' + layer.uuid for layer in model.layers]
+        restack = tags != self._raster_tags
+        self._raster_tags = tags
+        baked = set()
+        for layer in model.layers:
+            raster = self._raster(layer)
+            if layer.visible:
+                raster.update(layer_paths[layer.uuid])
+                baked.update(raster.paths)
+            raster.show(layer.visible)
+        for uuid in [uuid for uuid in self.rasters if uuid not in layer_paths]:
+            self.rasters.pop(uuid).clear()
+        if restack:
+            self._restack_rasters()
+
+        for path in selection:
+            points = line_points(path, transform)
+            pen = Pen(width=path.pen.width + SELECTION_EXTRA_WIDTH, color=SELECTION_COLOR)
+            self.create_line(points, fill=pen.color, width=pen.width, tags=(path.uuid, 'vector'))
+
+        for path in model.visible_paths():
+            if id(path) in baked:
+                continue
+            points = line_points(path, transform if id(path) in selected else None)
+            self.create_line(points, tags=(path.uuid, 'vector'), **path.pen.line_options)
 
         lasso = model.lasso
         if lasso:
-            points = flatten(lasso.points)
-            pen = lasso.pen
-            if len(points) == 2:
-                points = (points[0], points[1], points[0], points[1])
-            self.create_line(points, fill=pen.color, smooth=True, width=pen.width, dash=pen.dash, tag=path.uuid)
+            points = line_points(lasso)
+            self.create_line(points, tags=(lasso.uuid, 'vector'), **lasso.pen.line_options)
+
+        if self._overlay_text:
+            self.show_overlay(self._overlay_text)
 
     def apply_transform(self, selected_path, transform):
         """ Apply a transformation to the given path.
@@ -117,12 +304,7 @@ class SketchCanvas(tk.Canvas):
         :param transform: Transformation object
         :return:
         """
-        if transform:
-            path = selected_path.clone()
-            path.translate(transform.destination - transform.origin)
-        else:
-            path = selected_path
-        return path
+        return apply_transform(selected_path, transform)
 
     def shift(self, translation):
         """ Shift the visible part of the canvas
@@ -146,7 +328,11 @@ class SketchCanvas(tk.Canvas):
         self.yview_moveto(yv_new_0)
         translation.origin = translation.destination
         translation.destination = None
+        self._update_background()
+
+        if self._overlay_text:
+            self.show_overlay(self._overlay_text)
 
     def origin(self):
         """ Returns the origin of the window in canvas coordinates """
-        return Point(self.canvasx(0), self.canvasy(0))
\ No newline at end of file
+        return Point(self.canvasx(0), self.canvasy(0))
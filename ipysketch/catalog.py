@@ -0,0 +1,356 @@
+import hashlib
+import io
+import json
+import os
+import sqlite3
+import sys
+import threading
+
+from ipysketch.model import SketchModel, load_model
+from ipysketch.storage import PageRef, count_pages
+
+# File name of the catalog database in the folder of the sketches
+CATALOG_NAME = '.ipysketch-catalog.sqlite'
+# Maximum edge length of the thumbnails in pixels
+THUMBNAIL_SIZE = 128
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS sketches (
+    name TEXT PRIMARY KEY,
+    file TEXT NOT NULL,
+    pages INTEGER NOT NULL,
+    minx REAL, miny REAL, maxx REAL, maxy REAL,
+    strokes INTEGER NOT NULL,
+    samples INTEGER NOT NULL,
+    pens TEXT NOT NULL,
+    mtime REAL NOT NULL,
+    size INTEGER NOT NULL,
+    hash TEXT NOT NULL,
+    thumbnail BLOB
+);
+CREATE INDEX IF NOT EXISTS sketches_mtime ON sketches (mtime);
+CREATE TABLE IF NOT EXISTS pages (
+    name TEXT NOT NULL,
+    page INTEGER NOT NULL,
+    minx REAL, miny REAL, maxx REAL, maxy REAL,
+    strokes INTEGER NOT NULL,
+    samples INTEGER NOT NULL,
+    pens TEXT NOT NULL,
+    PRIMARY KEY (name, page)
+);
+"""
+
+# Columns of the sketches table which may be used for ordering the results of find
+ORDER_COLUMNS = ('name', 'mtime', 'strokes', 'samples', 'pages')
+
+
+class CatalogEntry(object):
+    """ The catalog record of a sketch. """
+
+    def __init__(self, name, file, pages, bbox, strokes, samples, pens, mtime, size, hash, thumbnail):
+        """
+
+        :param name: the name of the sketch, i.e. the path of its file relative to the
+                     catalog folder without extension
+        :param file: the absolute path of the sketch file
+        :param pages: the number of pages
+        :param bbox: (minx, miny, maxx, maxy) of the paths of all pages; None if there are none
+        :param strokes: the number of paths of all pages
+        :param samples: the number of points of all paths
+        :param pens: list of the distinct pens as tuples (width, color, dash)
+        :param mtime: the modification time of the sketch file
+        :param size: the size of the sketch file in bytes
+        :param hash: SHA-256 hex digest of the sketch file
+        :param thumbnail: PNG image of the first page as bytes; None for an empty first page
+        """
+        self.name = name
+        self.file = file
+        self.pages = pages
+        self.bbox = bbox
+        self.strokes = strokes
+        self.samples = samples
+        self.pens = pens
+        self.mtime = mtime
+        self.size = size
+        self.hash = hash
+        self.thumbnail = thumbnail
+
+    @classmethod
+    def from_row(cls, row):
+        bbox = None if row['minx'] is None else (row['minx'], row['miny'], row['maxx'], row['maxy'])
+        pens = [(width, color, tuple(dash) if dash else None) for width, color, dash in json.loads(row['pens'])]
+        return cls(row['name'], row['file'], row['pages'], bbox, row['strokes'], row['samples'], pens,
+                   row['mtime'], row['size'], row['hash'], row['thumbnail'])
+
+    def thumbnail_image(self):
+        """ Returns the thumbnail as PIL Image or None. """
+        if self.thumbnail is None:
+            return None
+        from PIL import Image
+
+        return Image.open(io.BytesIO(self.thumbnail))
+
+    def __repr__(self):
+        return 'CatalogEntry(%r, pages=%d, strokes=%d)' % (self.name, self.pages, self.strokes)
+
+
+class Catalog(object):
+    """
+    SQLite index of the sketches in a folder, so that sketches can be listed, filtered
+    and previewed without reading the sketch files.
+
+    The record of a sketch is updated whenever it is saved by a SavePipeline with
+    this catalog. Sketches saved otherwise are picked up by refresh(), which only reads
+    the files whose modification time or size has changed.
+
+    The statistics of each page are kept as well, so that pages which were not loaded
+    for editing need not be read again when the sketch is saved.
+
+    Every call opens its own database connection, so a catalog can be used from the
+    worker threads of the SavePipeline and by several processes at once.
+    """
+
+    def __init__(self, directory=os.curdir, file_name=None):
+        """
+
+        :param directory: the folder of the sketches
+        :param file_name: path of the database; by default CATALOG_NAME in the folder
+        """
+        self.directory = os.path.abspath(directory)
+        self.file_name = file_name or os.path.join(self.directory, CATALOG_NAME)
+        self._lock = threading.Lock()
+        with self._connect() as db:
+            db.executescript(_SCHEMA)
+
+    def _connect(self):
+        db = sqlite3.connect(self.file_name, timeout=10)
+        db.row_factory = sqlite3.Row
+        return _closing(db)
+
+    def name_of(self, file_name):
+        """ Returns the name of a sketch file in the catalog. """
+        name = os.path.relpath(os.path.abspath(file_name), self.directory)
+        return os.path.splitext(name)[0].replace(os.sep, '/')
+
+    def update(self, file_name, pages=None):
+        """ Record a sketch file in the catalog.
+
+        :param file_name: path of the .isk file
+        :param pages: optional list with the SketchModel of each page as written to the file,
+                      so that the pages need not be read again; the statistics of PageRef
+                      objects for pages which were not loaded are taken from the stored record
+                      of their file if there is one, all other pages are read from the file
+        :return: the CatalogEntry
+        """
+        stat = os.stat(file_name)
+        if pages is None:
+            pages = [None] * count_pages(file_name)
+        stored, thumbnails = self._stored_pages([page for page in pages if isinstance(page, PageRef)])
+        models, stats = {}, []
+        for k, page in enumerate(pages):
+            key = (self.name_of(page.file_name), page.page) if isinstance(page, PageRef) else None
+            if key in stored:
+                stats.append(stored[key])
+                continue
+            models[k] = page if isinstance(page, SketchModel) else load_model(file_name, k)
+            stats.append(_page_stats(models[k]))
+
+        if not pages:
+            thumbnail = None
+        elif 0 not in models and pages[0].page == 0:
+            thumbnail = thumbnails[self.name_of(pages[0].file_name)]
+        else:
+            thumbnail = render_thumbnail(models[0] if 0 in models else load_model(file_name, 0))
+        boxes = [bbox for bbox, _, _, _ in stats if bbox is not None]
+        bbox = (min(box[0] for box in boxes), min(box[1] for box in boxes),
+                max(box[2] for box in boxes), max(box[3] for box in boxes)) if boxes else None
+        pens = []
+        for pen in (pen for _, _, _, page_pens in stats for pen in page_pens):
+            if pen not in pens:
+                pens.append(pen)
+        entry = CatalogEntry(self.name_of(file_name), os.path.abspath(file_name), len(pages), bbox,
+                             sum(strokes for _, strokes, _, _ in stats), sum(samples for _, _, samples, _ in stats),
+                             [(width, color, tuple(dash) if dash else None) for width, color, dash in pens],
+                             stat.st_mtime, stat.st_size, file_hash(file_name), thumbnail)
+        row = (entry.name, entry.file, entry.pages) + (entry.bbox or (None,) * 4) + (
+            entry.strokes, entry.samples, json.dumps(pens), entry.mtime, entry.size, entry.hash,
+            entry.thumbnail)
+        page_rows = [(entry.name, k) + (page_bbox or (None,) * 4) + (strokes, samples, json.dumps(page_pens))
+                     for k, (page_bbox, strokes, samples, page_pens) in enumerate(stats)]
+        with self._lock, self._connect() as db:
+            db.execute('INSERT OR REPLACE INTO sketches VALUES (%s)' % ','.join('?' * len(row)), row)
+            db.execute('DELETE FROM pages WHERE name = ?', (entry.name,))
+            db.executemany('INSERT INTO pages VALUES (?,?,?,?,?,?,?,?,?)', page_rows)
+        return entry
+
+    def _stored_pages(self, refs):
+        # Returns the stored page statistics by (name, page) and the thumbnails by name
+        # of the sketches referred to
+        stored, thumbnails = {}, {}
+        names = set(self.name_of(ref.file_name) for ref in refs)
+        if not names:
+            return stored, thumbnails
+        with self._connect() as db:
+            for name in names:
+                row = db.execute('SELECT thumbnail FROM sketches WHERE name = ?', (name,)).fetchone()
+                if row is None:
+                    continue
+                thumbnails[name] = row['thumbnail']
+                for row in db.execute('SELECT * FROM pages WHERE name = ?', (name,)):
+                    bbox = None if row['minx'] is None else (row['minx'], row['miny'], row['maxx'], row['maxy'])
+                    stored[name, row['page']] = bbox, row['strokes'], row['samples'], json.loads(row['pens'])
+        return stored, thumbnails
+
+    def remove(self, name):
+        """ Remove the record of a sketch. """
+        with self._lock, self._connect() as db:
+            db.execute('DELETE FROM sketches WHERE name = ?', (name,))
+            db.execute('DELETE FROM pages WHERE name = ?', (name,))
+
+    def refresh(self):
+        """ Bring the catalog up to date with the sketch files in the folder and its subfolders.
+
+        :return: tuple (names of the added or updated sketches, names of the removed sketches)
+        """
+        with self._connect() as db:
+            known = {row['name']: (row['mtime'], row['size'])
+                     for row in db.execute('SELECT name, mtime, size FROM sketches')}
+        found, updated = set(), []
+        for folder, _, files in os.walk(self.directory):
+            for f in sorted(files):
+                if not f.endswith('.isk'):
+                    continue
+                file_name = os.path.join(folder, f)
+                name = self.name_of(file_name)
+                found.add(name)
+                stat = os.stat(file_name)
+                if known.get(name) != (stat.st_mtime, stat.st_size):
+                    self.update(file_name)
+                    updated.append(name)
+        removed = sorted(name for name in known if name not in found)
+        for name in removed:
+            self.remove(name)
+        return sorted(updated), removed
+
+    def get(self, name):
+        """ Returns the CatalogEntry of a sketch or None. """
+        with self._connect() as db:
+            row = db.execute('SELECT * FROM sketches WHERE name = ?', (name,)).fetchone()
+        return None if row is None else CatalogEntry.from_row(row)
+
+    def find(self, pattern=None, color=None, min_strokes=None, modified_since=None, order_by='name',
+             descending=False, limit=None):
+        """ Query the catalog.
+
+        :param pattern: glob pattern for the names, e.g. 'lecture3/*'
+        :param color: only sketches with a pen of this color (e.g. '#ff0000')
+        :param min_strokes: only sketches with at least this number of paths
+        :param modified_since: only sketches modified after this time (seconds since the epoch)
+        :param order_by: the column to sort by, see ORDER_COLUMNS
+        :param descending: sort in descending order
+        :param limit: maximum number of results
+        :return: list of CatalogEntry objects
+        """
+        if order_by not in ORDER_COLUMNS:
+            raise Exception('Cannot order by %s' % order_by)
+        conditions, args = [], []
+        if pattern is not None:
+            conditions.append('name GLOB ?')
+            args.append(pattern)
+        if color is not None:
+            conditions.append("EXISTS (SELECT 1 FROM json_each(pens) WHERE json_extract(value, '$[1]') = ?)")
+            args.append(color)
+        if min_strokes is not None:
+            conditions.append('strokes >= ?')
+            args.append(min_strokes)
+        if modified_since is not None:
+            conditions.append('mtime > ?')
+            args.append(modified_since)
+        query = 'SELECT * FROM sketches'
+        if conditions:
+            query += ' WHERE ' + ' AND '.join(conditions)
+        query += ' ORDER BY %s %s' % (order_by, 'DESC' if descending else 'ASC')
+        if limit is not None:
+            query += ' LIMIT %d' % limit
+        with self._connect() as db:
+            return [CatalogEntry.from_row(row) for row in db.execute(query, args)]
+
+    def __len__(self):
+        with self._connect() as db:
+            return db.execute('SELECT COUNT(*) FROM sketches').fetchone()[0]
+
+
+class _closing(object):
+    # Commits on success like sqlite3.Connection as context manager, but also closes the connection
+
+    def __init__(self, db):
+        self.db = db
+
+    def __enter__(self):
+        return self.db
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        try:
+            if exc_type is None:
+                self.db.commit()
+            else:
+                self.db.rollback()
+        finally:
+            self.db.close()
+
+
+def file_hash(file_name):
+    """ Returns the SHA-256 hex digest of a file. """
+    digest = hashlib.sha256()
+    with open(file_name, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def _page_stats(model):
+    # Returns the bounding box, the number of paths and points and the distinct pens of a page
+    bbox = None
+    if model.paths:
+        box = model.bbox()
+        bbox = (box.ul.x, box.ul.y, box.lr.x, box.lr.y)
+    pens = []
+    for path in model.paths:
+        pen = [path.pen.width, path.pen.color, list(path.pen.dash) if path.pen.dash else None]
+        if pen not in pens:
+            pens.append(pen)
+    return bbox, len(model.paths), sum(len(path.coords) for path in model.paths), pens
+
+
+def render_thumbnail(model, size=THUMBNAIL_SIZE):
+    """ Render the visible paths of a sketch scaled down to fit into a square.
+
+    The background image is left out, as it may be much larger than the sketch.
+
+    :param model: the SketchModel
+    :param size: maximum edge length of the thumbnail in pixels
+    :return: PNG image as bytes; None if there are no visible paths
+    """
+    from PIL import Image
+    from ipysketch.raster import draw_paths, save_png
+
+    paths = model.visible_paths()
+    if not paths:
+        return None
+    bbox = model.bbox(paths)
+    margin = 5
+    w, h = bbox.lr.x - bbox.ul.x + 2 * margin, bbox.lr.y - bbox.ul.y + 2 * margin
+    scale = min(1., float(size) / max(w, h))
+    image = Image.new('RGB', (max(1, int(w * scale)), max(1, int(h * scale))), 'white')
+    draw_paths(image, paths, (bbox.ul.x - margin, bbox.ul.y - margin), scale)
+    buffer = io.BytesIO()
+    save_png(image, buffer, effort='fast')
+    return buffer.getvalue()
+
+
+if __name__ == '__main__':
+    catalog = Catalog(sys.argv[1] if len(sys.argv) > 1 else os.curdir)
+    updated, removed = catalog.refresh()
+    print('Updated %d and removed %d sketches' % (len(updated), len(removed)))
+    for entry in catalog.find():
+        print('%-40s %3d pages %6d strokes %8d samples' % (entry.name, entry.pages, entry.strokes, entry.samples))
@@ -2,4 +2,14 @@
 ACTION_DRAW = 'draw'
 ACTION_ERASE = 'erase'
 ACTION_LASSO = 'lasso'
-ACTION_MOVE = 'move'
\ No newline at end of file
+ACTION_MOVE = 'move'
+
+# Approximate number of bytes the undo history may keep in memory
+HISTORY_MEMORY_BUDGET = 256 * 1024 * 1024
+
+# Radius of the eraser in pixels
+ERASER_RADIUS = 7
+
+# Eraser modes: erase whole paths or only the touched segments
+ERASE_PATHS = 'paths'
+ERASE_SEGMENTS = 'segments'
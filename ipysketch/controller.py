@@ -1,12 +1,21 @@
 import tkinter as tk
 from tkinter import colorchooser
 
-from ipysketch.canvas import ObjectVar, SketchCanvas
-from ipysketch.buttons import ColorButton, LineWidthButton, ActionButton, LineWidthChooserDialog
-from ipysketch.model import Translation, Point, filter_paths
+from ipysketch.canvas import ObjectVar, SketchCanvas, batch
+from ipysketch.buttons import ColorButton, LineWidthButton, ActionButton, EraserButton, LineWidthChooserDialog
+from ipysketch.events import PATHS_REMOVED, PATHS_LOADED, PATHS_TRANSFORMED, SELECTION_CHANGED, \
+    LAYERS_CHANGED, BACKGROUND_CHANGED, MODEL_REPLACED
+from ipysketch.index import PathIndex
+from ipysketch.model import Translation, Point, cut_paths, filter_paths, filter_paths_swept
+from ipysketch.profiling import profiled_event
 from ipysketch.constants import *
 
 
+# Model events upon which the canvas is redrawn completely
+REDRAW_EVENTS = (PATHS_LOADED, PATHS_TRANSFORMED, SELECTION_CHANGED, LAYERS_CHANGED, BACKGROUND_CHANGED,
+                 MODEL_REPLACED)
+
+
 class ButtonGroupController(object):
 
     def __init__(self, frame, num_buttons):
@@ -30,15 +39,14 @@ class ButtonGroupController(object):
         :param idx: the index of the button
         :return:
         """
-        for k, btn in enumerate(self.buttons):
-            self.onoffvars[k].set(False)
-        self.onoffvars[idx].set(True)
+        with batch():
+            for k, btn in enumerate(self.buttons):
+                self.onoffvars[k].set(k == idx)
 
     def on_button_click(self, event):
-        for k, btn in enumerate(self.buttons):
-            self.onoffvars[k].set(False)
-            if btn == event.widget:
-                self.onoffvars[k].set(True)
+        with batch():
+            for k, btn in enumerate(self.buttons):
+                self.onoffvars[k].set(btn == event.widget)
 
     def get_selected(self):
         """ Returns a tuple indicating which button in the group is active.
@@ -59,15 +67,30 @@ class ActionButtonGroupController(ButtonGroupController):
     """Controller for the action buttons 'draw', 'erase', 'lasso' and 'shift'"""
 
     def __init__(self, frame):
+        self.erase_mode = ObjectVar()
+        self.erase_mode.set(ERASE_PATHS)
         super().__init__(frame, num_buttons=4)
 
     def init_buttons(self, frame):
         self.buttons = [ActionButton(frame, self.onoffvars[0], 'pen-60.png', self.on_button_click),
-                        ActionButton(frame, self.onoffvars[1], 'eraser-60.png', self.on_button_click),
+                        EraserButton(frame, self.onoffvars[1], self.erase_mode, 'eraser-60.png',
+                                     self.on_button_click),
                         ActionButton(frame, self.onoffvars[2], 'lasso-80.png', self.on_button_click),
                         ActionButton(frame, self.onoffvars[3], 'move-60.png', self.on_button_click)
                         ]
 
+    def on_button_click(self, event):
+        """ Clicking the already selected eraser button switches between erasing
+            whole paths and erasing only the touched segments.
+        """
+        if event.widget == self.buttons[1] and self.onoffvars[1].get():
+            if self.erase_mode.get() == ERASE_PATHS:
+                self.erase_mode.set(ERASE_SEGMENTS)
+            else:
+                self.erase_mode.set(ERASE_PATHS)
+
+        super().on_button_click(event)
+
 
 class ColorButtonGroupController(ButtonGroupController):
     """Controller for the panel with the color selection buttons."""
@@ -141,23 +164,46 @@ class LineWidthButtonGroupController(ButtonGroupController):
 
 class CanvasController(object):
 
-    def __init__(self, app, frame):
+    def __init__(self, app, frame, profiler=None, renderer=None):
+        """
+
+        :param app: the Application
+        :param frame: the Tk frame to put the canvas in
+        :param profiler: optional LatencyProfiler
+        :param renderer: the render backend (see ipysketch.render); by default
+                         a SketchCanvas is created in the frame
+        """
 
         self.app = app
 
-        self.canvas = SketchCanvas(frame, bd=3, background='white')
-        self.canvas.grid(row=0, column=0, sticky='NWSE')
+        if renderer is None:
+            renderer = SketchCanvas(frame, bd=3, background='white')
+            renderer.grid(row=0, column=0, sticky='NWSE')
 
-        frame.rowconfigure(0, weight=1)
-        frame.columnconfigure(0, weight=1)
+            frame.rowconfigure(0, weight=1)
+            frame.columnconfigure(0, weight=1)
+        self.canvas = renderer
 
         self.canvas.bind('<Button-1>', self.on_button_down)
         self.canvas.bind('<B1-Motion>', self.on_move)
         self.canvas.bind('<ButtonRelease-1>', self.on_button_up)
 
+        # The canvas and the hit-testing index follow the model changes; only the
+        # lasso and the preview of a moved selection are drawn directly
+        self.index = PathIndex(self.model)
+        app.events.subscribe(self.index.on_events)
+        app.events.subscribe(self.on_model_events)
+
         self.model.selection = []
         self.transform = None
         self.canvas_shift = None
+        self.eraser_position = None
+        # False while the button is pressed on a hidden or locked layer
+        self.drawing = False
+
+        self.profiler = profiler
+        self.canvas.profiler = profiler
+        self.show_overlay = False
 
         self.update_canvas()
 
@@ -170,9 +216,53 @@ class CanvasController(object):
         return self.model.selection
 
     def update_canvas(self):
-        self.canvas.draw(self.model)
+        self.canvas.draw(self.model, self.model.selection)
 
+    def on_model_events(self, events):
+        """ Update the canvas from a batch of ModelEvents. Changes of single paths are
+            applied one by one, everything else leads to one redraw of the model.
+            Finished paths are baked into the raster tiles, see SketchCanvas.bake_paths.
+        """
+        if any(event.kind in REDRAW_EVENTS for event in events):
+            self.update_canvas()
+            return
+        for event in events:
+            if event.kind == PATHS_REMOVED:
+                self.canvas.delete_paths(event.paths)
+                continue
+            model = event.model
+            paths = [path for path in event.paths if model.layer_of(path).visible]
+            # Finished strokes go to the raster tiles right away; only the strokes being
+            # drawn or selected stay vector items
+            selected = set(id(path) for path in model.selection)
+            active = [path for path in paths if not path.finished or id(path) in selected]
+            static = [path for path in paths if path.finished and id(path) not in selected]
+            if active:
+                self.canvas.update_paths(active)
+            if static:
+                self.canvas.bake_paths(model, static)
+
+    def toggle_overlay(self, event=None):
+        """Show or hide the latency overlay (only available when profiling)."""
+        if self.profiler is None:
+            return
+        self.show_overlay = not self.show_overlay
+        self.canvas.show_overlay(self.profiler.overlay_text() if self.show_overlay else None)
+
+    def _record(self, kind, event):
+        recorder = self.app.recorder
+        if recorder:
+            recorder.record_mouse(kind, event, self.app.action, self.app.pen, self.app.erase_mode)
+
+    def on_profiled_event(self):
+        if self.show_overlay:
+            self.canvas.show_overlay(self.profiler.overlay_text())
+
+    @profiled_event('button_down')
     def on_button_down(self, event):
+        self._record('down', event)
+        # All changes until the button is released make up one undo step
+        self.app.history.begin()
         action = self.app.action
 
         at_point = Point(event.x, event.y) + self.canvas.origin()
@@ -180,6 +270,7 @@ class CanvasController(object):
             self._start_action_draw(at_point)
         elif action == ACTION_ERASE:
             self.model.selection = []
+            self.eraser_position = None
             self.erase_paths(at_point)
         elif action == ACTION_LASSO:
             if self.model.selection:
@@ -194,8 +285,6 @@ class CanvasController(object):
         else:
             raise NotImplementedError
 
-        self.canvas.draw(self.model)
-
     def _start_canvas_shift(self, at_point):
         self.canvas_shift = Translation(at_point)
 
@@ -205,19 +294,25 @@ class CanvasController(object):
 
     def _start_action_draw(self, at_point):
         self.model.selection = []
+        # Hidden and locked layers cannot be drawn on
+        self.drawing = self.model.layer().editable
+        if not self.drawing:
+            return
         self.app.trigger_dirty()
         pen = self.app.pen
         self.model.start_path(at_point, pen)
 
+    @profiled_event('move')
     def on_move(self, event):
+        self._record('move', event)
 
         action = self.app.action
         at_point = Point(event.x, event.y) + self.canvas.origin()
 
         if action == ACTION_DRAW:
 
-            self.model.continue_path(at_point)
-            self.canvas.update_paths(self.model.paths[-1])
+            if self.drawing:
+                self.model.continue_path(at_point)
 
         elif action == ACTION_ERASE:
 
@@ -237,33 +332,55 @@ class CanvasController(object):
             raise NotImplementedError
 
     def erase_paths(self, at_point):
-        paths_to_erase = filter_paths(self.model.paths, at_point, radius=7)
-
-        if paths_to_erase:
-            self.canvas.delete_paths(paths_to_erase)
+        # Test the whole way the eraser moved since the last event, so that fast
+        # movements do not skip paths
+        start = self.eraser_position or at_point
+        self.eraser_position = at_point
+        # Bring the index up to date with the changes of this frame; it only holds
+        # the paths on visible, unlocked layers
+        self.app.events.flush()
+        candidates = self.index.candidates(start, at_point, ERASER_RADIUS)
+        paths_to_erase = filter_paths_swept(candidates, start, at_point, ERASER_RADIUS)
+
+        if not paths_to_erase:
+            return
+
+        if self.app.erase_mode == ERASE_SEGMENTS:
+            # Paths merely passing near the eraser may not be cut at all, and then no
+            # history entry must be opened
+            cuts = cut_paths(paths_to_erase, start, at_point, ERASER_RADIUS)
+            if not cuts:
+                return
+            self.app.trigger_dirty()
+            self.model.replace_cut_paths(cuts)
+        else:
             self.app.trigger_dirty()
             self.model.erase_paths(paths_to_erase)
 
+    @profiled_event('button_up')
     def on_button_up(self, event):
+        self._record('up', event)
         action = self.app.action
         at_point = Point(event.x, event.y) + self.canvas.origin()
         if action == ACTION_DRAW:
-            self.model.finish_path(Point(event.x, event.y) + self.canvas.origin())
-            self.canvas.update_paths(self.model.paths[-1])
+            if self.drawing:
+                self.model.finish_path(Point(event.x, event.y) + self.canvas.origin())
+                self.drawing = False
         elif action == ACTION_ERASE:
             self.erase_paths(at_point)
         elif action == ACTION_LASSO:
             if self.transform:
-                self.finish_transform(at_point)
+                # Start the new history entry first, so that undo restores the old positions
                 self.app.trigger_dirty()
+                self.finish_transform(at_point)
             elif self.model.lasso:
                 self.canvas.delete_paths(self.model.lasso)
                 self.model.finish_lasso(at_point)
-                self.canvas.update_paths(self.model.selection, selected=True)
         elif action == ACTION_MOVE:
             pass
         else:
             raise NotImplementedError
+        self.app.history.commit()
 
     def start_transform(self, at_point):
         self.transform = Translation(at_point)
@@ -272,9 +389,7 @@ class CanvasController(object):
         self.transform.destination = at_point
 
     def finish_transform(self, at_point):
-        self.transform.destination = at_point
-        for path in self.model.selection:
-            path.translate(self.transform.destination - self.transform.origin)
-
+        vector = at_point - self.transform.origin
+        # The preview ends here, the translated paths are drawn on the PATHS_TRANSFORMED event
         self.transform = None
-        self.canvas.draw(self.model, self.model.selection)
+        self.model.translate_paths(self.model.selection, vector)
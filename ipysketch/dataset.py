@@ -0,0 +1,292 @@
+import os
+import struct
+import sys
+import zipfile
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from ipysketch.model import load_model
+from ipysketch.storage import count_pages
+
+# Suffixes of the supported dataset formats
+NPZ_SUFFIX = '.npz'
+ARROW_SUFFIXES = ('.arrow', '.feather')
+
+
+class StrokeDataset(object):
+    """
+    The paths of one or many sketches in columnar form.
+
+    The coordinates of all paths are stacked in one (N, 2) array; the paths are
+    described by arrays with one entry per path. Path k consists of the points
+    coords[offsets[k]:offsets[k + 1]].
+    """
+
+    def __init__(self, coords, offsets, sketch_ids, pages, names, pen_widths, pen_colors, pen_dashes):
+        """
+
+        :param coords: (N, 2) array of the coordinates of all paths
+        :param offsets: the start index of each path followed by N
+        :param sketch_ids: the index into names of the sketch of each path
+        :param pages: the page of each path (starting with 0)
+        :param names: list of the names of the sketches
+        :param pen_widths: the pen width of each path
+        :param pen_colors: the pen color of each path as 0xRRGGBB
+        :param pen_dashes: the dash pattern of each path as comma-separated str, '' for solid lines
+        """
+        self.coords = coords
+        self.offsets = offsets
+        self.sketch_ids = sketch_ids
+        self.pages = pages
+        self.names = list(names)
+        self.pen_widths = pen_widths
+        self.pen_colors = pen_colors
+        self.pen_dashes = pen_dashes
+        if len(offsets) != len(sketch_ids) + 1:
+            raise Exception('Expected %d offsets, got %d' % (len(sketch_ids) + 1, len(offsets)))
+
+    def __len__(self):
+        return len(self.sketch_ids)
+
+    @property
+    def num_samples(self):
+        return len(self.coords)
+
+    def path(self, k):
+        """ Returns the coordinates of a path as view into the coordinate array. """
+        return self.coords[self.offsets[k]:self.offsets[k + 1]]
+
+    def sketch(self, name):
+        """ Returns the indices of the paths of a sketch. """
+        return np.flatnonzero(self.sketch_ids == self.names.index(name))
+
+
+def dataset_from_models(models, dtype=np.float32):
+    """ Convert sketch models to a StrokeDataset.
+
+    :param models: iterable of tuples (sketch name, page, SketchModel)
+    :param dtype: the data type of the coordinates
+    :return: StrokeDataset
+    """
+    return _concatenate([(name, page) + _model_columns(model) for name, page, model in models], dtype)
+
+
+def _model_columns(model):
+    coords, offsets, pen_indices, pens = model.path_arrays()
+    widths = np.array([pen.width for pen in pens], dtype=np.float32)
+    colors = np.array([_color_value(pen.color) for pen in pens], dtype=np.uint32)
+    dashes = np.array([','.join(str(d) for d in pen.dash or ()) for pen in pens] or [''])
+    return coords, offsets, widths[pen_indices], colors[pen_indices], dashes[pen_indices]
+
+
+def _color_value(color):
+    if color.startswith('#') and len(color) == 7:
+        return int(color[1:], 16)
+    from PIL import ImageColor
+
+    r, g, b = ImageColor.getrgb(color)[:3]
+    return (r << 16) | (g << 8) | b
+
+
+def _concatenate(pages, dtype):
+    names, ids, parts = [], {}, []
+    for name, page, *columns in pages:
+        if name not in ids:
+            ids[name] = len(names)
+            names.append(name)
+        parts.append((ids[name], page) + tuple(columns))
+    num_points = [len(coords) for _, _, coords, _, _, _, _ in parts]
+    starts = np.concatenate(([0], np.cumsum(num_points, dtype=np.int64)))
+    offsets = [part[3][:-1] + start for part, start in zip(parts, starts)]
+    return StrokeDataset(
+        coords=np.concatenate([part[2] for part in parts]).astype(dtype) if parts else np.zeros((0, 2), dtype),
+        offsets=np.concatenate(offsets + [starts[-1:]]).astype(np.int64),
+        sketch_ids=np.concatenate([np.full(len(part[4]), part[0], dtype=np.int32) for part in parts] +
+                                  [np.zeros(0, np.int32)]),
+        pages=np.concatenate([np.full(len(part[4]), part[1], dtype=np.int16) for part in parts] +
+                             [np.zeros(0, np.int16)]),
+        names=names,
+        pen_widths=np.concatenate([part[4] for part in parts] + [np.zeros(0, np.float32)]),
+        pen_colors=np.concatenate([part[5] for part in parts] + [np.zeros(0, np.uint32)]),
+        pen_dashes=np.concatenate([part[6] for part in parts] + [np.zeros(0, 'U1')]),
+    )
+
+
+def read_sketch(file_name):
+    """ Read the paths of all pages of a sketch file in columnar form.
+
+    :param file_name: path of the .isk file
+    :return: list of tuples (sketch name, page, coords, offsets, pen widths, pen colors, pen dashes)
+             with one tuple per page
+    """
+    name = file_name[:-4] if file_name.endswith('.isk') else file_name
+    return [(name, page) + _model_columns(load_model(file_name, page))
+            for page in range(count_pages(file_name))]
+
+
+def convert_sketches(file_names, output, workers=None, dtype=np.float32):
+    """ Convert many sketch files into one dataset file. The sketch files are read in
+        parallel in a pool of processes.
+
+    :param file_names: paths of .isk files or of folders, which are searched for .isk files
+    :param output: path of the dataset file; the format is chosen by the suffix
+                   (.npz, .arrow or .feather)
+    :param workers: number of processes; None for one per CPU, 1 for reading in this process
+    :param dtype: the data type of the coordinates
+    :return: the StrokeDataset written
+    """
+    sketch_files = []
+    for file_name in file_names:
+        if os.path.isdir(file_name):
+            for folder, _, files in sorted(os.walk(file_name)):
+                sketch_files.extend(os.path.join(folder, f) for f in sorted(files) if f.endswith('.isk'))
+        else:
+            sketch_files.append(file_name)
+
+    if workers == 1:
+        pages = [page for file_name in sketch_files for page in read_sketch(file_name)]
+    else:
+        with ProcessPoolExecutor(workers) as executor:
+            pages = [page for result in executor.map(read_sketch, sketch_files) for page in result]
+    dataset = _concatenate(pages, dtype)
+    save_dataset(dataset, output)
+    return dataset
+
+
+def save_dataset(dataset, file_name):
+    """ Write a StrokeDataset in NPZ or Arrow IPC format, depending on the suffix of the file. """
+    if file_name.endswith(NPZ_SUFFIX):
+        save_npz(dataset, file_name)
+    elif file_name.endswith(ARROW_SUFFIXES):
+        save_arrow(dataset, file_name)
+    else:
+        raise Exception('Unknown dataset format: %s' % file_name)
+
+
+def load_dataset(file_name, mmap=True):
+    """ Read a StrokeDataset written by save_dataset.
+
+    :param file_name: path of the .npz, .arrow or .feather file
+    :param mmap: memory-map the arrays instead of reading them
+    :return: StrokeDataset
+    """
+    if file_name.endswith(NPZ_SUFFIX):
+        return load_npz(file_name, mmap)
+    elif file_name.endswith(ARROW_SUFFIXES):
+        return load_arrow(file_name, mmap)
+    raise Exception('Unknown dataset format: %s' % file_name)
+
+
+def save_npz(dataset, file_name):
+    """ Write a StrokeDataset as uncompressed NPZ file, so that it can be memory-mapped. """
+    np.savez(file_name, coords=dataset.coords, offsets=dataset.offsets, sketch_ids=dataset.sketch_ids,
+             pages=dataset.pages, names=np.array(dataset.names or [''])[:len(dataset.names)],
+             pen_widths=dataset.pen_widths, pen_colors=dataset.pen_colors, pen_dashes=dataset.pen_dashes)
+
+
+def load_npz(file_name, mmap=True):
+    """ Read a StrokeDataset from an NPZ file.
+
+    :param file_name: path of the file
+    :param mmap: memory-map the arrays; np.load cannot do this for NPZ files, so the
+                 arrays are located in the zip archive directly
+    :return: StrokeDataset
+    """
+    if mmap:
+        arrays = _mmap_npz(file_name)
+    else:
+        with np.load(file_name) as data:
+            arrays = {key: data[key] for key in data.files}
+    arrays['names'] = [str(name) for name in arrays['names']]
+    return StrokeDataset(**arrays)
+
+
+def _mmap_npz(file_name):
+    arrays = {}
+    with zipfile.ZipFile(file_name) as archive, open(file_name, 'rb') as f:
+        for info in archive.infolist():
+            key = info.filename[:-4] if info.filename.endswith('.npy') else info.filename
+            if info.compress_type != zipfile.ZIP_STORED:
+                with archive.open(info) as member:
+                    arrays[key] = np.lib.format.read_array(member)
+                continue
+            # The member data follows the local file header and its variable length fields
+            f.seek(info.header_offset + 26)
+            name_length, extra_length = struct.unpack('<HH', f.read(4))
+            f.seek(info.header_offset + 30 + name_length + extra_length)
+            version = np.lib.format.read_magic(f)
+            if version == (1, 0):
+                shape, fortran_order, dtype = np.lib.format.read_array_header_1_0(f)
+            else:
+                shape, fortran_order, dtype = np.lib.format.read_array_header_2_0(f)
+            if dtype.hasobject or 0 in shape or shape == ():
+                f.seek(info.header_offset + 30 + name_length + extra_length)
+                arrays[key] = np.lib.format.read_array(f, allow_pickle=False)
+            else:
+                arrays[key] = np.memmap(file_name, dtype=dtype, mode='r', offset=f.tell(), shape=shape,
+                                        order='F' if fortran_order else 'C')
+    return arrays
+
+
+def save_arrow(dataset, file_name):
+    """ Write a StrokeDataset as Arrow IPC file with one row per path. The points of
+        the paths are stored as list column, i.e. as flat coordinates with offsets.
+        Requires pyarrow.
+    """
+    import pyarrow as pa
+
+    coords = np.ascontiguousarray(dataset.coords)
+    points = pa.LargeListArray.from_arrays(
+        pa.array(np.asarray(dataset.offsets, dtype=np.int64)),
+        pa.FixedSizeListArray.from_arrays(pa.array(coords.ravel()), 2))
+    table = pa.table({
+        'sketch': pa.DictionaryArray.from_arrays(pa.array(np.asarray(dataset.sketch_ids, dtype=np.int32)),
+                                                 pa.array(dataset.names, type=pa.string())),
+        'page': pa.array(dataset.pages),
+        'pen_width': pa.array(dataset.pen_widths),
+        'pen_color': pa.array(dataset.pen_colors),
+        'pen_dash': pa.array(np.asarray(dataset.pen_dashes).tolist(), type=pa.string()),
+        'points': points,
+    })
+    with pa.OSFile(file_name, 'wb') as sink:
+        with pa.ipc.new_file(sink, table.schema) as writer:
+            writer.write_table(table, max_chunksize=max(1, len(table)))
+
+
+def load_arrow(file_name, mmap=True):
+    """ Read a StrokeDataset from an Arrow IPC file. With mmap, the numeric columns
+        are zero-copy views of the memory-mapped file. Requires pyarrow.
+    """
+    import pyarrow as pa
+
+    source = pa.memory_map(file_name, 'r') if mmap else pa.OSFile(file_name, 'rb')
+    table = pa.ipc.open_file(source).read_all().combine_chunks()
+
+    def column(name):
+        return table.column(name).chunk(0) if table.num_rows else None
+
+    points, sketch = column('points'), column('sketch')
+    if points is None:
+        return StrokeDataset(np.zeros((0, 2), np.float32), np.zeros(1, np.int64), np.zeros(0, np.int32),
+                             np.zeros(0, np.int16), [], np.zeros(0, np.float32), np.zeros(0, np.uint32),
+                             np.zeros(0, 'U1'))
+    return StrokeDataset(
+        coords=points.values.values.to_numpy(zero_copy_only=True).reshape(-1, 2),
+        offsets=points.offsets.to_numpy(zero_copy_only=True),
+        sketch_ids=sketch.indices.to_numpy(zero_copy_only=True),
+        pages=column('page').to_numpy(zero_copy_only=True),
+        names=sketch.dictionary.to_pylist(),
+        pen_widths=column('pen_width').to_numpy(zero_copy_only=True),
+        pen_colors=column('pen_color').to_numpy(zero_copy_only=True),
+        pen_dashes=np.array(column('pen_dash').to_pylist()),
+    )
+
+
+if __name__ == '__main__':
+    if len(sys.argv) < 3:
+        print('Usage: python -m ipysketch.dataset <output.npz|.arrow> <sketch files or folders>...')
+        sys.exit(1)
+    result = convert_sketches(sys.argv[2:], sys.argv[1])
+    print('Wrote %d paths with %d points of %d sketches to %s' % (
+        len(result), result.num_samples, len(result.names), sys.argv[1]))
@@ -0,0 +1,169 @@
+import math
+import os
+import pickle
+import sys
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from ipysketch.model import load_model
+from ipysketch.background import draw_background
+from ipysketch.raster import TILE_SIZE, draw_paths, save_png
+
+DZI_TEMPLATE = '''<?xml version="1.0" encoding="UTF-8"?>
+<Image xmlns="http://schemas.microsoft.com/deepzoom/2008" Format="%s" Overlap="0" TileSize="%d">
+  <Size Width="%d" Height="%d"/>
+</Image>
+'''
+
+
+class TileRenderer(object):
+    """
+    Renders single tiles of a sketch at arbitrary scales. Only the paths whose
+    bounding box overlaps a tile are drawn into it.
+    """
+
+    def __init__(self, model, origin, tile_size=TILE_SIZE, background='white'):
+        """
+
+        :param model: the SketchModel; only its visible layers are rendered
+        :param origin: sketch coordinates of the upper left corner of the full image
+        :param tile_size: edge length of the tiles in pixels
+        :param background: the background color
+        """
+        self.paths = model.visible_paths()
+        self.background = model.background
+        self.origin = np.asarray(origin, dtype=float)
+        self.tile_size = tile_size
+        self.background_color = background
+        if self.paths:
+            bounds = [path.bounds() for path in self.paths]
+            self.bounds = np.array([(x0, y0, x1, y1) for (x0, y0), (x1, y1) in bounds])
+            self.margins = np.array([path.pen.width for path in self.paths], dtype=float)
+        else:
+            self.bounds = np.zeros((0, 4))
+            self.margins = np.zeros(0)
+
+    def render(self, scale, col, row):
+        """ Render a tile.
+
+        :param scale: the scale factor from sketch coordinates to pixels
+        :param col: the column of the tile
+        :param row: the row of the tile
+        :return: PIL Image
+        """
+        from PIL import Image
+
+        size = self.tile_size / scale
+        x0, y0 = self.origin + (col * size, row * size)
+        x1, y1 = x0 + size, y0 + size
+        b, m = self.bounds, self.margins
+        overlaps = (b[:, 2] + m >= x0) & (b[:, 0] - m <= x1) & (b[:, 3] + m >= y0) & (b[:, 1] - m <= y1)
+
+        image = Image.new('RGB', (self.tile_size, self.tile_size), self.background_color)
+        if self.background is not None:
+            draw_background(image, self.background, (x0, y0), scale)
+        draw_paths(image, [self.paths[k] for k in np.flatnonzero(overlaps)], (x0, y0), scale)
+        return image
+
+
+def pyramid_levels(width, height):
+    """ Returns the number of levels of a Deep Zoom pyramid for an image of the given size.
+        Level 0 is 1x1 pixel, each further level doubles the resolution.
+    """
+    return int(math.ceil(math.log(max(width, height, 1), 2))) + 1
+
+
+def pyramid_tiles(width, height, tile_size=TILE_SIZE):
+    """ Yields (level, scale, col, row, tile width, tile height) for all tiles of the pyramid.
+
+    :param width: width of the full resolution image
+    :param height: height of the full resolution image
+    :param tile_size: edge length of the tiles
+    """
+    levels = pyramid_levels(width, height)
+    for level in range(levels):
+        scale = 0.5 ** (levels - 1 - level)
+        w = int(math.ceil(width * scale))
+        h = int(math.ceil(height * scale))
+        for col in range(int(math.ceil(w / tile_size))):
+            for row in range(int(math.ceil(h / tile_size))):
+                yield (level, scale, col, row,
+                       min(tile_size, w - col * tile_size), min(tile_size, h - row * tile_size))
+
+
+def export_deep_zoom(model, name, tile_size=TILE_SIZE, margin=20, image_format='png', workers=None):
+    """ Export a sketch as Deep Zoom image: a pyramid of tiles at power-of-two scales,
+        which can be viewed e.g. with OpenSeadragon.
+
+    The tiles are rendered one by one directly from the model, in parallel in a pool of
+    processes, so that the full-size image never has to be allocated.
+
+    :param model: the SketchModel to export
+    :param name: base name of the output; writes <name>.dzi and the folder <name>_files
+    :param tile_size: edge length of the tiles in pixels
+    :param margin: margin around the sketch in pixels
+    :param image_format: file format of the tiles ('png' or 'jpg')
+    :param workers: number of processes; None for one per CPU, 1 for rendering in this process
+    :return: the path of the .dzi file
+    """
+    bbox = model.image_bbox()
+    if bbox is None:
+        raise Exception('Cannot export an empty sketch')
+
+    origin = (bbox.ul.x - margin, bbox.ul.y - margin)
+    width = int(math.ceil(bbox.lr.x - bbox.ul.x)) + 2 * margin
+    height = int(math.ceil(bbox.lr.y - bbox.ul.y)) + 2 * margin
+
+    tiles_dir = name + '_files'
+    for level in range(pyramid_levels(width, height)):
+        os.makedirs(os.path.join(tiles_dir, str(level)), exist_ok=True)
+
+    tasks = [(os.path.join(tiles_dir, str(level), '%d_%d.%s' % (col, row, image_format)), scale, col, row, w, h)
+             for level, scale, col, row, w, h in pyramid_tiles(width, height, tile_size)]
+
+    state = pickle.dumps((model, origin, tile_size), pickle.HIGHEST_PROTOCOL)
+    if workers == 1:
+        _init_worker(state)
+        for task in tasks:
+            _render_tile(task)
+    else:
+        with ProcessPoolExecutor(workers, initializer=_init_worker, initargs=(state,)) as executor:
+            chunksize = max(1, len(tasks) // (4 * (workers or os.cpu_count() or 1)))
+            for _ in executor.map(_render_tile, tasks, chunksize=chunksize):
+                pass
+
+    dzi_name = name + '.dzi'
+    with open(dzi_name, 'w') as f:
+        f.write(DZI_TEMPLATE % (image_format, tile_size, width, height))
+    return dzi_name
+
+
+# The tile renderer of a worker process
+_worker_renderer = None
+
+
+def _init_worker(state):
+    global _worker_renderer
+    model, origin, tile_size = pickle.loads(state)
+    _worker_renderer = TileRenderer(model, origin, tile_size)
+
+
+def _render_tile(task):
+    file_name, scale, col, row, w, h = task
+    image = _worker_renderer.render(scale, col, row)
+    if (w, h) != image.size:
+        image = image.crop((0, 0, w, h))
+    if file_name.endswith('.png'):
+        # There are many tiles, so they are encoded quickly
+        save_png(image, file_name, effort='fast')
+    else:
+        image.save(file_name)
+
+
+if __name__ == '__main__':
+    if len(sys.argv) != 2:
+        print('Usage: python -m ipysketch.deepzoom <sketch name>')
+        sys.exit(1)
+    sketch_name = sys.argv[1]
+    print('Wrote %s' % export_deep_zoom(load_model(sketch_name + '.isk'), sketch_name))
@@ -0,0 +1,137 @@
+import os
+
+from ipysketch.events import ModelEvent, MODEL_REPLACED
+from ipysketch.model import SketchModel, History, load_model
+from ipysketch.storage import PageRef, count_pages, is_chunked
+
+
+def page_name(name, page):
+    """ Returns the base name of the image files of a page. The first page uses the
+        name of the sketch, so that single page sketches keep their file names.
+
+    :param name: the name of the sketch
+    :param page: the index of the page
+    """
+    return name if page == 0 else '%s-page%d' % (name, page + 1)
+
+
+class Page(object):
+    """ A page of a Document. """
+
+    def __init__(self, history=None, source=None):
+        """
+
+        :param history: the History of the page; None as long as the page is not loaded
+        :param source: the index of the page in the sketch file; None if it is not stored there
+        """
+        self.history = history
+        self.source = source
+        self.modified = False
+
+    @property
+    def loaded(self):
+        return self.history is not None
+
+
+class Document(object):
+    """
+    The pages of a sketch. Each page has its own undo history.
+
+    Pages are read from the sketch file when they are needed. Only the active page and
+    its neighbours are kept in memory; the other pages are released again, unless they
+    have unsaved changes.
+    """
+
+    def __init__(self, file_name, bus=None, keep=1):
+        """
+
+        :param file_name: path of the sketch file; it is read if it exists
+        :param bus: optional EventBus for the model change events of all pages
+        :param keep: pages with at most this distance from the active page stay in memory
+        """
+        self.file_name = file_name
+        self.bus = bus
+        self.keep = keep
+        self.active = 0
+        if not os.path.exists(file_name):
+            self.pages = [Page(History(SketchModel(), bus=bus))]
+        elif is_chunked(file_name):
+            self.pages = [Page(source=k) for k in range(count_pages(file_name))]
+        else:
+            # Sketch saved by an older version
+            self.pages = [Page(History(load_model(file_name), bus=bus))]
+
+    def __len__(self):
+        return len(self.pages)
+
+    def history(self, page=None):
+        """ Returns the History of a page, loading the page if necessary.
+
+        :param page: the index of the page; None for the active page
+        """
+        page = self.pages[self.active if page is None else page]
+        if page.history is None:
+            page.history = History(load_model(self.file_name, page.source), bus=self.bus)
+        return page.history
+
+    def activate(self, page):
+        """ Make a page the active one and release the pages that are no longer needed.
+
+        :param page: the index of the page
+        """
+        if not 0 <= page < len(self.pages):
+            raise Exception('No such page: %d' % (page + 1))
+        self.active = page
+        history = self.history(page)
+        self.release()
+        if self.bus is not None:
+            self.bus.emit(ModelEvent(MODEL_REPLACED, model=history.current()))
+
+    def neighbours(self):
+        """ Returns the indices of the pages which shall be kept in memory besides the active one. """
+        return [k for k in range(self.active - self.keep, self.active + self.keep + 1)
+                if k != self.active and 0 <= k < len(self.pages)]
+
+    def release(self):
+        """ Drop the pages far from the active page from memory, if they are stored in the file. """
+        for k, page in enumerate(self.pages):
+            if (page.loaded and abs(k - self.active) > self.keep and
+                    not page.modified and page.source is not None):
+                page.history.close()
+                page.history = None
+
+    def add_page(self):
+        """ Append a new, empty page.
+
+        :return: the index of the new page
+        """
+        page = Page(History(SketchModel(), bus=self.bus))
+        page.modified = True
+        self.pages.append(page)
+        return len(self.pages) - 1
+
+    def touch(self):
+        """ Mark the active page as changed. """
+        self.pages[self.active].modified = True
+
+    def snapshot(self):
+        """ Returns the state of all pages for saving: copies of the loaded pages and
+            references into the sketch file for the others.
+
+        :return: list of SketchModel and PageRef objects
+        """
+        return [page.history.current().clone() if page.loaded else PageRef(self.file_name, page.source)
+                for page in self.pages]
+
+    def close(self):
+        """ Release the spill files of the histories of all loaded pages. """
+        for page in self.pages:
+            if page.loaded:
+                page.history.close()
+
+    def saved(self):
+        """ Called after the document has been written to its file. """
+        for k, page in enumerate(self.pages):
+            page.source = k
+            page.modified = False
+        self.release()
@@ -0,0 +1,101 @@
+# Kinds of model change events
+PATHS_ADDED = 'paths_added'
+# Paths read from the sketch file have been added; unlike PATHS_ADDED, not a change of the sketch
+PATHS_LOADED = 'paths_loaded'
+PATH_EXTENDED = 'path_extended'
+PATH_FINISHED = 'path_finished'
+PATHS_REMOVED = 'paths_removed'
+PATHS_TRANSFORMED = 'paths_transformed'
+SELECTION_CHANGED = 'selection_changed'
+# Layers have been added, removed, reordered, shown, hidden, locked or unlocked
+LAYERS_CHANGED = 'layers_changed'
+BACKGROUND_CHANGED = 'background_changed'
+# The whole model has been replaced, e.g. by undo or redo
+MODEL_REPLACED = 'model_replaced'
+
+# The kinds of events which change the content of a sketch, i.e. make it unsaved
+CONTENT_EVENTS = (PATHS_ADDED, PATH_FINISHED, PATHS_REMOVED, PATHS_TRANSFORMED, LAYERS_CHANGED, BACKGROUND_CHANGED)
+
+
+class ModelEvent(object):
+    """
+    A change of a SketchModel.
+
+    For PATH_FINISHED and PATHS_TRANSFORMED, the changed paths are replaced by new
+    Path objects; old_paths holds the replaced ones in the same order as paths.
+    """
+
+    def __init__(self, kind, paths=(), old_paths=(), model=None):
+        """
+
+        :param kind: one of the event kinds defined in this module
+        :param paths: the added, extended, finished, removed, transformed or selected paths
+        :param old_paths: the replaced paths
+        :param model: the model that has changed
+        """
+        self.kind = kind
+        self.paths = list(paths)
+        self.old_paths = list(old_paths)
+        self.model = model
+
+    def __repr__(self):
+        return 'ModelEvent(%s, %d paths)' % (self.kind, len(self.paths))
+
+
+class EventBus(object):
+    """
+    Delivers model change events to subscribers.
+
+    Events are collected and delivered in batches, typically once per frame. Subsequent
+    PATH_EXTENDED events of the same path are merged within a batch.
+
+    The canvas, the PathIndex used for hit-testing and the dirty state of the
+    application are kept up to date by subscribing to the bus.
+    """
+
+    def __init__(self, schedule=None):
+        """
+
+        :param schedule: function which calls the given function later, e.g. the
+                         after_idle method of a Tk widget; None for delivering events immediately
+        """
+        self.schedule = schedule
+        self._subscribers = []
+        self._pending = []
+        self._scheduled = False
+
+    def subscribe(self, callback, kinds=None):
+        """ Register a function to be called with the list of events of each batch.
+
+        :param callback: function taking a list of ModelEvent objects
+        :param kinds: the event kinds the function is interested in; None for all
+        """
+        self._subscribers.append((callback, frozenset(kinds) if kinds else None))
+
+    def unsubscribe(self, callback):
+        self._subscribers = [(cb, kinds) for cb, kinds in self._subscribers if cb != callback]
+
+    def emit(self, event):
+        if not self._subscribers:
+            return
+        pending = self._pending
+        if (event.kind == PATH_EXTENDED and pending and pending[-1].kind == PATH_EXTENDED
+                and pending[-1].paths == event.paths):
+            return
+        pending.append(event)
+        if self.schedule is None:
+            self.flush()
+        elif not self._scheduled:
+            self._scheduled = True
+            self.schedule(self.flush)
+
+    def flush(self):
+        """ Deliver the pending events now. """
+        self._scheduled = False
+        events, self._pending = self._pending, []
+        if not events:
+            return
+        for callback, kinds in list(self._subscribers):
+            selected = events if kinds is None else [event for event in events if event.kind in kinds]
+            if selected:
+                callback(selected)
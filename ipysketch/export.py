@@ -0,0 +1,236 @@
+import os
+import tempfile
+import warnings
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from contextlib import contextmanager
+from functools import partial
+
+from ipysketch.background import draw_background
+from ipysketch.document import page_name
+from ipysketch.model import SketchModel, save_model
+from ipysketch.raster import PNG_EFFORTS, draw_paths, save_png
+from ipysketch.storage import save_pages
+from ipysketch.vector import export_pdf, export_svg
+
+
+def export_png(model, file_name, margin=20, background='white', effort='default'):
+    """ Render the background and the visible layers of a sketch to a PNG file.
+
+    Sketches usually have only a few colors, so the PNG is written as palette or
+    greyscale image if possible (see ipysketch.raster.save_png).
+
+    :param model: the SketchModel to export
+    :param file_name: path of the output file
+    :param margin: margin around the sketch in pixels
+    :param background: the background color; None for a transparent background
+    :param effort: the PNG encoding effort: 'fast', 'default' or 'max'
+    :return:
+    """
+    from PIL import Image
+
+    bbox = model.image_bbox()
+    if bbox is None:
+        raise Exception('Cannot export an empty sketch')
+    size = (int(bbox.lr.x - bbox.ul.x + 2 * margin), int(bbox.lr.y - bbox.ul.y + 2 * margin))
+    offset = (bbox.ul.x - margin, bbox.ul.y - margin)
+    if background is None:
+        image = Image.new('RGBA', size, (255, 255, 255, 0))
+    else:
+        image = Image.new('RGB', size, background)
+    if model.background is not None:
+        draw_background(image, model.background, offset)
+    draw_paths(image, model.visible_paths(), offset)
+    save_png(image, file_name, effort)
+
+
+# The available exporters by file extension. An exporter is called with the model
+# and the name of the file to write. It must be a module level function, so that
+# it can be run in a process pool.
+EXPORTERS = {
+    '.isk': save_model,
+    '.png': export_png,
+    '.svg': export_svg,
+    '.pdf': export_pdf,
+}
+
+# The outputs written by the Application by default
+DEFAULT_OUTPUTS = ('.isk', '.png')
+
+# The umask can only be read by setting it, which is not thread-safe, so it is read
+# once on import, before any save pipeline has started its threads
+_UMASK = os.umask(0)
+os.umask(_UMASK)
+
+
+@contextmanager
+def atomic_file(file_name):
+    """ Context manager yielding the name of a temporary file in the folder of the given
+        file. If the block succeeds, the temporary file replaces the given file,
+        otherwise it is removed. So readers never see a partially written file.
+
+        The new file keeps the permissions of the file it replaces; new files get the
+        permissions of a file created by open().
+
+    :param file_name: the path of the file to write
+    """
+    directory, base = os.path.split(os.path.abspath(file_name))
+    stem, suffix = os.path.splitext(base)
+    fd, temp_name = tempfile.mkstemp(prefix='.' + stem + '-', suffix=suffix, dir=directory)
+    os.close(fd)
+    try:
+        yield temp_name
+        try:
+            mode = os.stat(file_name).st_mode & 0o7777
+        except FileNotFoundError:
+            mode = 0o666 & ~_UMASK
+        os.chmod(temp_name, mode)
+        os.replace(temp_name, file_name)
+    except BaseException:
+        if os.path.exists(temp_name):
+            os.remove(temp_name)
+        raise
+
+
+def export_atomic(exporter, model, file_name):
+    """ Run an exporter, writing its output atomically. """
+    with atomic_file(file_name) as temp_name:
+        exporter(model, temp_name)
+    return file_name
+
+
+class SavePipeline(object):
+    """
+    Saves a sketch to several files at once. The model is snapshotted once and all
+    exporters run concurrently on the snapshot, so that the time for saving is about
+    that of the slowest exporter.
+
+    Outputs other than the sketch file itself show only the visible layers and cannot
+    be written for sketches without visible paths or background image;
+    they are removed instead, so that no obsolete images are displayed.
+    """
+
+    def __init__(self, outputs=DEFAULT_OUTPUTS, processes=False, workers=None, png_effort='default', catalog=None):
+        """
+
+        :param outputs: the file extensions to write (keys of EXPORTERS) or a dict mapping
+                        extensions to exporter functions
+        :param processes: run the exporters in a process pool instead of a thread pool
+        :param workers: maximum number of threads or processes; by default one per output
+        :param png_effort: the encoding effort of the PNG exporter from EXPORTERS,
+                           e.g. 'fast' for frequent saves and 'max' for final output
+        :param catalog: optional Catalog (see ipysketch.catalog) in which each written
+                        sketch file is recorded; the records are updated in the background
+                        and errors only cause a warning
+        """
+        if isinstance(outputs, dict):
+            self.exporters = dict(outputs)
+        else:
+            unknown = [suffix for suffix in outputs if suffix not in EXPORTERS]
+            if unknown:
+                raise Exception('No exporter for %s' % ', '.join(unknown))
+            if png_effort not in PNG_EFFORTS:
+                raise Exception('Unknown PNG effort: %s' % png_effort)
+            self.exporters = {suffix: EXPORTERS[suffix] for suffix in outputs}
+            if '.png' in self.exporters and png_effort != 'default':
+                self.exporters['.png'] = partial(export_png, effort=png_effort)
+        self.processes = processes
+        self.workers = workers or len(self.exporters)
+        self.catalog = catalog
+        self._executor = None
+        # A single thread, so that the catalog records the saves in order
+        self._catalog_executor = None
+
+    def _get_executor(self):
+        if self._executor is None:
+            if self.processes:
+                self._executor = ProcessPoolExecutor(self.workers)
+            else:
+                self._executor = ThreadPoolExecutor(self.workers, thread_name_prefix='ipysketch-save')
+        return self._executor
+
+    def save(self, model, base_name):
+        """ Write all outputs of a sketch and wait until they are complete.
+
+        :param model: the SketchModel to save
+        :param base_name: the name of the output files without extension
+        :return: list of the written file names
+        """
+        snapshot = model.clone()
+        jobs = [(exporter, snapshot, base_name + suffix) for suffix, exporter in self.exporters.items()]
+        written = self._run(jobs)
+        self._update_catalog(base_name, [snapshot])
+        return written
+
+    def save_document(self, document, base_name):
+        """ Write a multi-page sketch: the sketch file with all pages and the other
+            outputs for each page in memory (see ipysketch.document.page_name).
+
+        :param document: the Document to save
+        :param base_name: the name of the output files without extension
+        :return: list of the written file names
+        """
+        pages = document.snapshot()
+        jobs = []
+        for suffix, exporter in self.exporters.items():
+            if suffix == '.isk':
+                jobs.append((save_pages, pages, base_name + suffix))
+                continue
+            for k, page in enumerate(pages):
+                if isinstance(page, SketchModel):
+                    jobs.append((exporter, page, page_name(base_name, k) + suffix))
+        written = self._run(jobs)
+        if '.isk' in self.exporters:
+            document.saved()
+            self._update_catalog(base_name, pages)
+        return written
+
+    def _update_catalog(self, base_name, pages):
+        if self.catalog is None or '.isk' not in self.exporters:
+            return
+        if self._catalog_executor is None:
+            self._catalog_executor = ThreadPoolExecutor(1, thread_name_prefix='ipysketch-catalog')
+        self._catalog_executor.submit(update_catalog, self.catalog, base_name + '.isk', pages)
+
+    def _run(self, jobs):
+        executor = self._get_executor()
+        futures = []
+        for exporter, model, file_name in jobs:
+            if not isinstance(model, SketchModel) or file_name.endswith('.isk') or model.image_bbox() is not None:
+                futures.append(executor.submit(export_atomic, exporter, model, file_name))
+            elif os.path.exists(file_name):
+                os.remove(file_name)
+
+        written, errors = [], []
+        for future in futures:
+            try:
+                written.append(future.result())
+            except Exception as e:
+                errors.append(e)
+        if errors:
+            raise Exception('Saving failed: %s' % '; '.join(str(e) for e in errors))
+        return written
+
+    def close(self):
+        """ Shut down the worker pool, waiting for pending catalog updates. """
+        if self._executor is not None:
+            self._executor.shutdown()
+            self._executor = None
+        if self._catalog_executor is not None:
+            self._catalog_executor.shutdown()
+            self._catalog_executor = None
+
+
+def update_catalog(catalog, file_name, pages):
+    """ Record a saved sketch file in a catalog. The catalog is only an index of the
+        sketch files, so a failure is reported as warning instead of an error.
+
+    :param catalog: the Catalog
+    :param file_name: path of the .isk file
+    :param pages: the pages as written to the file, see Catalog.update
+    :return: the CatalogEntry or None if the update failed
+    """
+    try:
+        return catalog.update(file_name, pages)
+    except Exception as e:
+        warnings.warn('Could not update the catalog for %s: %s' % (file_name, e))
+        return None
@@ -0,0 +1,90 @@
+import os
+import sys
+import tkinter as tk
+
+# Edge length of the toolbar icons in pixels
+ICON_SIZE = 30
+
+# The toolbar icons in the order of their cells in the icon atlas
+ICONS = ('pen-60.png', 'eraser-60.png', 'lasso-80.png', 'move-60.png',
+         'undo-50.png', 'redo-50.png', 'save-60.png', 'save-disabled-60.png')
+
+ASSETS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'assets')
+
+
+def asset_path(name):
+    """ Returns the path of a file in the assets folder. """
+    return os.path.join(ASSETS_DIR, name)
+
+
+def atlas_name(size=ICON_SIZE):
+    return 'icons-%d.png' % size
+
+
+def build_icon_atlas(file_name, size=ICON_SIZE, background='#FFFFFF'):
+    """ Render all toolbar icons on a background, scaled to the icon size, and store
+        them side by side in one PNG file.
+
+    :param file_name: path of the atlas to write
+    :param size: the icon size in pixels
+    :param background: the background color of the icons
+    :return:
+    """
+    from PIL import Image
+
+    atlas = Image.new('RGB', (size * len(ICONS), size), background)
+    for k, name in enumerate(ICONS):
+        png = Image.open(asset_path(name)).convert('RGBA')
+        composite = Image.alpha_composite(Image.new('RGBA', png.size, background), png)
+        atlas.paste(composite.resize((size, size), Image.LANCZOS).convert('RGB'), (k * size, 0))
+    atlas.save(file_name, optimize=True)
+
+
+def _cache_dir():
+    base = os.environ.get('XDG_CACHE_HOME') or os.path.join(os.path.expanduser('~'), '.cache')
+    return os.path.join(base, 'ipysketch')
+
+
+def _load_atlas(root):
+    """ Load an up-to-date icon atlas. The atlas shipped with the package is used if it
+        matches the icon list, otherwise one is built in the user's cache folder.
+    """
+    name = atlas_name()
+    for path in (asset_path(name), os.path.join(_cache_dir(), name)):
+        if os.path.exists(path):
+            atlas = tk.PhotoImage(master=root, file=path)
+            if atlas.width() == ICON_SIZE * len(ICONS):
+                return atlas
+
+    path = os.path.join(_cache_dir(), name)
+    os.makedirs(_cache_dir(), exist_ok=True)
+    build_icon_atlas(path)
+    return tk.PhotoImage(master=root, file=path)
+
+
+def icon(master, name):
+    """ Returns the PhotoImage of a toolbar icon. The icons are cut from the icon atlas,
+        which is loaded only once per Tk application.
+
+    :param master: any widget of the Tk application
+    :param name: the file name of the icon in the assets folder
+    :return: tk.PhotoImage
+    """
+    root = master._root()
+    cache = getattr(root, '_ipysketch_icons', None)
+    if cache is None:
+        cache = root._ipysketch_icons = {}
+        cache[None] = _load_atlas(root)
+    if name not in cache:
+        x = ICONS.index(name) * ICON_SIZE
+        image = tk.PhotoImage(master=root, width=ICON_SIZE, height=ICON_SIZE)
+        image.tk.call(image, 'copy', cache[None], '-from', x, 0, x + ICON_SIZE, ICON_SIZE)
+        cache[name] = image
+    return cache[name]
+
+
+if __name__ == '__main__':
+    # Regenerate the icon atlas shipped with the package
+    target = asset_path(atlas_name()) if len(sys.argv) < 2 else sys.argv[1]
+    build_icon_atlas(target)
+    print('Wrote %s' % target)
@@ -0,0 +1,90 @@
+from ipysketch.events import PATHS_ADDED, PATHS_LOADED, PATH_FINISHED, PATHS_REMOVED, PATHS_TRANSFORMED, \
+    LAYERS_CHANGED, MODEL_REPLACED
+from ipysketch.raster import tiles_of
+
+# Edge length of the grid cells of the PathIndex
+INDEX_CELL_SIZE = 128
+
+
+class PathIndex(object):
+    """
+    Grid of the finished paths on editable layers, for finding the paths near a
+    position without testing all paths of the sketch.
+
+    The index is subscribed to the EventBus of the application and follows the
+    changes of the model. The events are delivered once per frame, so the bus must
+    be flushed before querying the index in the middle of a frame.
+    """
+
+    def __init__(self, model=None, cell_size=INDEX_CELL_SIZE):
+        """
+
+        :param model: the SketchModel to index initially
+        :param cell_size: edge length of the grid cells
+        """
+        self.cell_size = cell_size
+        # cell -> uuids of the paths overlapping the cell
+        self.cells = {}
+        # uuid -> (Path, cells of the path, sequence number)
+        self.paths = {}
+        self._count = 0
+        if model is not None:
+            self.rebuild(model)
+
+    def rebuild(self, model):
+        """ Index the editable paths of a model, dropping all others. """
+        self.cells = {}
+        self.paths = {}
+        for path in model.editable_paths():
+            if path.finished:
+                self.add(path)
+
+    def add(self, path):
+        self.remove(path)
+        cells = tiles_of(path.bounds(), self.cell_size)
+        self._count += 1
+        self.paths[path.uuid] = path, cells, self._count
+        for cell in cells:
+            self.cells.setdefault(cell, set()).add(path.uuid)
+
+    def remove(self, path):
+        entry = self.paths.pop(path.uuid, None)
+        if entry is None:
+            return
+        for cell in entry[1]:
+            uuids = self.cells[cell]
+            uuids.discard(path.uuid)
+            if not uuids:
+                del self.cells[cell]
+
+    def on_events(self, events):
+        """ Update the index from a batch of ModelEvents. """
+        for event in events:
+            if event.kind in (LAYERS_CHANGED, MODEL_REPLACED):
+                self.rebuild(event.model)
+            elif event.kind == PATHS_REMOVED:
+                for path in event.paths:
+                    self.remove(path)
+            elif event.kind in (PATHS_ADDED, PATHS_LOADED, PATH_FINISHED, PATHS_TRANSFORMED):
+                for path in event.old_paths:
+                    self.remove(path)
+                for path in event.paths:
+                    if path.finished and event.model.layer_of(path).editable:
+                        self.add(path)
+
+    def candidates(self, start, end, radius):
+        """ Returns the indexed paths in the cells touched by a circle moved along a
+            straight line, in the order they have been indexed. The exact test is left
+            to filter_paths_swept.
+
+        :param start: start position of the circle (Point)
+        :param end: end position of the circle (Point)
+        :param radius: radius of the circle
+        :return: list of Path objects
+        """
+        bounds = (min(start[0], end[0]), min(start[1], end[1])), (max(start[0], end[0]), max(start[1], end[1]))
+        uuids = set()
+        for cell in tiles_of(bounds, self.cell_size, radius):
+            uuids.update(self.cells.get(cell, ()))
+        entries = sorted((self.paths[uuid] for uuid in uuids), key=lambda entry: entry[2])
+        return [path for path, _, _ in entries]
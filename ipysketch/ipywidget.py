@@ -5,11 +5,25 @@ import sys
 from ipywidgets import Button, Image, Output, DOMWidget
 from IPython.display import display
 
+from ipysketch.document import page_name
+from ipysketch.model import load_model
+from ipysketch.storage import count_pages
+
 
 class Sketch(DOMWidget):
 
-    def __init__(self, name, *args, **kwargs):
+    def __init__(self, name, *args, image_format='png', page=1, background=None, **kwargs):
+        """
+
+        :param name: the name of the sketch
+        :param image_format: 'png' or 'svg'; the format in which the sketch is displayed
+        :param page: the number of the page to display (starting with 1)
+        :param background: optional PNG or JPEG file to show under the sketch when editing it
+        """
         self.name = name
+        self.background = background
+        self.image_format = image_format
+        self.page = page
         self.edit_button = Button(description='Edit')
         self.edit_button.on_click(self.handle_edit)
         self.output = Output()
@@ -17,17 +31,38 @@ class Sketch(DOMWidget):
         self.load_image(name)
 
     def load_image(self, name):
-        if os.path.exists(name + '.png'):
-            self.img = Image.from_file(name + '.png')
+        if self.image_format == 'svg':
+            self._update_svg(name)
+        image_name = page_name(name, self.page - 1) + '.' + self.image_format
+        if os.path.exists(image_name):
+            self.img = Image.from_file(image_name)
         else:
             self.img = None
 
+    def _update_svg(self, name):
+        """ Write the SVG of the sketch if it is missing or older than the sketch file. """
+        from ipysketch.vector import export_svg
+
+        sketch_name, svg_name = name + '.isk', page_name(name, self.page - 1) + '.svg'
+        if not os.path.exists(sketch_name) or self.page > count_pages(sketch_name):
+            return
+        if os.path.exists(svg_name) and os.path.getmtime(svg_name) >= os.path.getmtime(sketch_name):
+            return
+        model = load_model(sketch_name, self.page - 1)
+        # Like the save pipeline, only pages without visible paths and background are empty
+        if model.image_bbox() is not None:
+            export_svg(model, svg_name)
+        elif os.path.exists(svg_name):
+            os.remove(svg_name)
+
     def handle_edit(self, e):
         with self.output:
             print('Starting sketch pad...')
         python = sys.executable
-        proc = subprocess.Popen((python + ' -m ipysketch ' + self.name).split(), shell=False, stdout=subprocess.PIPE,
-                         stderr=subprocess.STDOUT)
+        args = [python, '-m', 'ipysketch', self.name]
+        if self.background:
+            args.append(self.background)
+        proc = subprocess.Popen(args, shell=False, stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
         proc.wait()
         self.output.clear_output()
         self.close()
@@ -1,73 +1,657 @@
-from copy import deepcopy
-import uuid
-from numpy import sqrt, arange
-from scipy.interpolate import interp1d
+import os
+import pickle
+import tempfile
+import zlib
+from uuid import uuid4
 
-from shapely.geometry import Point as shPoint
-from shapely.geometry.polygon import Polygon
+import numpy as np
+
+from ipysketch.constants import HISTORY_MEMORY_BUDGET
+from ipysketch.events import ModelEvent, PATHS_ADDED, PATHS_LOADED, PATH_EXTENDED, PATH_FINISHED, PATHS_REMOVED, \
+    PATHS_TRANSFORMED, SELECTION_CHANGED, MODEL_REPLACED, LAYERS_CHANGED, BACKGROUND_CHANGED
+
+# Rough number of bytes a Path object (without its coordinates) and a reference to it
+# take in memory, used for estimating model sizes
+PATH_SIZE_ESTIMATE = 400
+REFERENCE_SIZE_ESTIMATE = 8
+
+# Maximum distance in pixels between the smooth curve through the points of a path and
+# the polyline it is drawn with
+TESSELLATION_TOLERANCE = 0.25
+# Upper bound for the number of line segments per curve segment, the default of Tk
+MAX_SPLINE_STEPS = 12
+
+
+def load_model(file_name, page=0):
+    """ Load a sketch model from an .isk file, either in the chunked format or
+        pickled by older versions.
+
+    :param file_name: path of the file
+    :param page: the index of the page to load
+    :return: SketchModel
+    """
+    from ipysketch.storage import ChunkedSketch, is_chunked
+
+    if is_chunked(file_name):
+        return ChunkedSketch(file_name, page).load()
+    with open(file_name, 'rb') as f:
+        return pickle.load(f)
+
+
+def save_model(model, file_name):
+    """ Save a sketch model to an .isk file in the chunked format (see ipysketch.storage).
+
+    :param model: the SketchModel
+    :param file_name: path of the file
+    """
+    from ipysketch.storage import save_chunked
+
+    save_chunked(model, file_name)
+
+
+# The spill file of a History is compacted only if it holds at least this many bytes
+# of models that are no longer needed
+SPILL_COMPACT_MIN = 1 << 20
 
 
 class History(object):
+    """
+    The undo/redo history of sketch models.
+
+    To keep the memory usage bounded, models exceeding the memory budget are
+    compressed and spilled to a temporary file, starting with those farthest away
+    from the current model. Spilled models are transparently reloaded when needed.
+    The space of spilled models which have been dropped from the history is reclaimed
+    by compacting the spill file once it holds more dropped than live data.
 
-    def __init__(self, initial_model):
+    A gesture like an eraser drag is wrapped in a transaction (begin, then commit
+    or abort), so that it results in a single history entry, no matter how often
+    new() is called during the gesture.
+    """
+
+    def __init__(self, initial_model, memory_budget=HISTORY_MEMORY_BUDGET, bus=None):
+        """
+
+        :param initial_model: the first model in the history
+        :param memory_budget: approximate number of bytes the models kept in memory may use;
+                              None means unlimited
+        :param bus: optional EventBus, which is assigned to all models and is notified
+                    when undo, redo or abort replace the current model
+        """
+        self.bus = bus
+        if bus is not None:
+            initial_model.bus = bus
         self.models = [initial_model]
         self._model_ptr = 0
+        self.memory_budget = memory_budget
+        # idx -> (index of the base model, estimated size), see _size
+        self._sizes = {}
+        self._spilled = {}
+        self._spill_file = None
+        # Number of bytes in the spill file of models no longer in the history
+        self._spill_garbage = 0
+        # None if no transaction is open, otherwise whether its history entry was created
+        self._transaction = None
 
     def current(self):
-        return self.models[self._model_ptr]
+        return self._load(self._model_ptr)
 
     def append(self, model):
+        # The previous models may have changed since their size was estimated
+        self._sizes.pop(self._model_ptr, None)
+        self._sizes.pop(len(self.models) - 1, None)
         self.models.append(model)
         self._model_ptr += 1
+        self._enforce_budget()
 
     def last(self):
-        return self.models[-1]
+        return self._load(len(self.models) - 1)
 
     def new(self):
+        """ Start a new history entry as copy of the last model. Within a transaction,
+            only the first call creates an entry.
+        """
+        if self._transaction:
+            return
+        if self._transaction is not None:
+            self._transaction = True
         if self._model_ptr != len(self.models) - 1:
             self.models = self.models[:self._model_ptr + 1]
+            for idx in list(self._spilled):
+                if idx > self._model_ptr:
+                    self._drop_spilled(idx)
+            for idx in list(self._sizes):
+                if idx > self._model_ptr:
+                    del self._sizes[idx]
         self.append(self.last().clone())
 
+    def begin(self):
+        """ Start a transaction. An open transaction is committed first. """
+        self.commit()
+        self._transaction = False
+
+    def commit(self):
+        """ End the transaction, keeping its history entry (if any). """
+        self._transaction = None
+
+    def abort(self):
+        """ End the transaction and discard its history entry with all changes. """
+        if self._transaction:
+            idx = len(self.models) - 1
+            self.models.pop()
+            self._sizes.pop(idx, None)
+            self._drop_spilled(idx)
+            self._model_ptr -= 1
+            self._replaced()
+        self._transaction = None
+
+    @property
+    def in_transaction(self):
+        return self._transaction is not None
+
+    def update_all(self, func):
+        """ Apply a change to all models of the history, e.g. for adding paths which
+            are loaded in the background.
+
+        :param func: function taking a SketchModel
+        """
+        for idx, model in enumerate(self.models):
+            if isinstance(model, SpilledModel):
+                model = self._read_spilled(model)
+            func(model)
+            self.models[idx] = model
+            # A spilled copy or a size estimate of the model is outdated now
+            self._drop_spilled(idx)
+            self._sizes.pop(idx, None)
+        self._enforce_budget()
+
     def back(self):
+        self.commit()
         if self._model_ptr > 0:
             self._model_ptr -= 1
+            # The model left may have changed since its size was estimated
+            self._sizes.pop(self._model_ptr + 1, None)
+            self._enforce_budget()
+            self._replaced()
 
     def forward(self):
+        self.commit()
         if self._model_ptr < len(self.models) - 1:
             self._model_ptr += 1
+            self._sizes.pop(self._model_ptr - 1, None)
+            self._enforce_budget()
+            self._replaced()
+
+    def _replaced(self):
+        if self.bus is not None:
+            self.bus.emit(ModelEvent(MODEL_REPLACED, model=self.current()))
+
+    def close(self):
+        """Release the spill file. Spilled models are read back into memory first,
+           so that the history stays usable.
+        """
+        if self._spill_file:
+            for idx, model in enumerate(self.models):
+                if isinstance(model, SpilledModel):
+                    self.models[idx] = self._read_spilled(model)
+            self._spill_file.close()
+            self._spill_file = None
+        self._spilled = {}
+        self._spill_garbage = 0
+
+    def _drop_spilled(self, idx):
+        spilled = self._spilled.pop(idx, None)
+        if spilled is not None:
+            self._spill_garbage += spilled.length
+
+    def _compact(self):
+        # Copy the live models into a new spill file; the placeholders are shared
+        # between self.models and self._spilled, so their offsets are updated in place
+        compacted = tempfile.TemporaryFile()
+        for spilled in sorted(self._spilled.values(), key=lambda spilled: spilled.offset):
+            self._spill_file.seek(spilled.offset)
+            data = self._spill_file.read(spilled.length)
+            spilled.offset = compacted.tell()
+            compacted.write(data)
+        self._spill_file.close()
+        self._spill_file = compacted
+        self._spill_garbage = 0
+
+    def _load(self, idx):
+        model = self.models[idx]
+        if isinstance(model, SpilledModel):
+            model = self._read_spilled(model)
+            self.models[idx] = model
+            # The reloaded model shares no paths with its neighbours any more
+            self._sizes.pop(idx, None)
+            self._enforce_budget()
+        return model
+
+    def _read_spilled(self, spilled):
+        self._spill_file.seek(spilled.offset)
+        model = pickle.loads(zlib.decompress(self._spill_file.read(spilled.length)))
+        model.bus = self.bus
+        return model
+
+    def _size(self, idx, base):
+        # The size of a model without the paths shared with the base model, which is
+        # the preceding model in memory (or None); paths are shared along the history,
+        # so every path in memory is counted once
+        cached = self._sizes.get(idx)
+        if cached is None or cached[0] != base:
+            cached = base, self.models[idx].memory_estimate(None if base is None else self.models[base])
+            self._sizes[idx] = cached
+        return cached[1]
+
+    def _enforce_budget(self):
+        if self.memory_budget is None:
+            return
+
+        in_memory = [idx for idx, model in enumerate(self.models)
+                     if not isinstance(model, SpilledModel)]
+        # The current and the last model may still change, the others do not
+        protected = (self._model_ptr, len(self.models) - 1)
+        for idx in protected:
+            self._sizes.pop(idx, None)
+        total = sum(self._size(idx, base) for base, idx in zip([None] + in_memory, in_memory))
+
+        candidates = sorted((idx for idx in in_memory if idx not in protected),
+                            key=lambda idx: abs(idx - self._model_ptr))
+        while total > self.memory_budget and candidates:
+            idx = candidates.pop()
+            self._spill(idx)
+            k = in_memory.index(idx)
+            in_memory.pop(k)
+            total -= self._sizes.pop(idx)[1]
+            # The following model now holds the paths it shared with the spilled one
+            if k < len(in_memory):
+                following = in_memory[k]
+                total -= self._sizes[following][1]
+                total += self._size(following, in_memory[k - 1] if k > 0 else None)
+
+    def _spill(self, idx):
+        if idx not in self._spilled:
+            if self._spill_file is None:
+                self._spill_file = tempfile.TemporaryFile()
+            elif self._spill_garbage > max(SPILL_COMPACT_MIN, sum(s.length for s in self._spilled.values())):
+                self._compact()
+            data = zlib.compress(pickle.dumps(self.models[idx], pickle.HIGHEST_PROTOCOL))
+            self._spill_file.seek(0, os.SEEK_END)
+            self._spilled[idx] = SpilledModel(self._spill_file.tell(), len(data))
+            self._spill_file.write(data)
+        self.models[idx] = self._spilled[idx]
 
     def __repr__(self):
         return '# models: %d, current model idx: %d' % (len(self.models), self._model_ptr)
 
 
+class SpilledModel(object):
+    """
+    Placeholder for a model in the History that has been written to the spill file.
+    """
+
+    def __init__(self, offset, length):
+        self.offset = offset
+        self.length = length
+
+
 class SketchModel(object):
+    """
+    The paths of a sketch.
+
+    The paths are organized in layers. Each path references its layer by the uuid of
+    the layer (None stands for the bottom layer, for paths of older sketches). In
+    model.paths, the paths of all layers are kept in the order they have been drawn;
+    visible_paths returns them in the stacking order of the layers.
+
+    If an EventBus is assigned to the bus attribute, all changes of the paths and the
+    selection are emitted as ModelEvents. Clones share the bus of their original.
+
+    The model does not know about the undo history: callers changing a model of a
+    History, including its layers and background, must open a history entry first
+    (History.new, as done by Application.trigger_dirty and Application.change_layers),
+    otherwise the change becomes part of the previous undo step.
+    """
 
     def __init__(self):
         self.paths = []
         self.lasso = None
         self.selection = []
+        self.styles = StyleTable()
+        self.bus = None
+        self.layers = [Layer('Layer 1')]
+        self.active_layer = self.layers[0].uuid
+        self.background = None
+
+    @property
+    def selection(self):
+        return self.__dict__['selection']
+
+    @selection.setter
+    def selection(self, paths):
+        # Stored in the instance dict, so that pickled models keep their format
+        changed = paths != self.__dict__.get('selection')
+        self.__dict__['selection'] = paths
+        if changed:
+            self._emit(SELECTION_CHANGED, paths)
+
+    def _emit(self, kind, paths=(), old_paths=()):
+        bus = self.__dict__.get('bus')
+        if bus is not None:
+            bus.emit(ModelEvent(kind, paths, old_paths, self))
 
     def clone(self):
-        return deepcopy(self)
+        """ Returns a copy of the model.
+
+        Finished paths are immutable, so the copy shares them with this model and
+        only the lists referencing them are copied.
+        """
+        model = SketchModel.__new__(SketchModel)
+        model.__dict__.update(self.__dict__)
+        model.paths = [path if path.finished else path.clone() for path in self.paths]
+        model.__dict__['selection'] = list(self.selection)
+        model.lasso = self.lasso.clone() if self.lasso else None
+        model.styles = StyleTable(self.styles.pens)
+        # Hiding or locking a layer is a change of the model like any other
+        model.layers = [layer.clone() for layer in self.layers]
+        return model
+
+    def __deepcopy__(self, memo):
+        return self.clone()
+
+    def __getstate__(self):
+        # Paths reference their pen by index into the style table
+        state = self.__dict__.copy()
+        state['styles'] = [pen.key() for pen in self.styles.pens]
+        state['paths'] = [(path.uuid, self.styles.index(path.pen), path.coords, path.layer) for path in self.paths]
+        state['selection'] = [path.uuid for path in self.selection]
+        state.pop('bus', None)
+        return state
+
+    def __setstate__(self, state):
+        paths = state['paths']
+        if 'styles' in state:
+            styles = StyleTable(Pen(*key) for key in state['styles'])
+            # Paths of sketches saved before the introduction of layers have no layer
+            paths = [Path(styles[item[1]], item[2], item[0], item[3] if len(item) > 3 else None)
+                     for item in paths]
+            selection = set(state['selection'])
+            state['selection'] = [path for path in paths if path.uuid in selection]
+        else:
+            # Sketch saved before the introduction of the style table
+            styles = StyleTable()
+            for path in paths:
+                path.pen = styles.intern(path.pen)
+        state['paths'] = paths
+        state['styles'] = styles
+        state['bus'] = None
+        if 'layers' not in state:
+            state['layers'] = [Layer('Layer 1')]
+            state['active_layer'] = state['layers'][0].uuid
+        state.setdefault('background', None)
+        self.__dict__.update(state)
+
+    def memory_estimate(self, base=None):
+        """ Returns the approximate number of bytes the model takes in memory.
+
+        :param base: optional model whose paths shall not be counted, because
+                     they are shared with this model
+        """
+        shared = set(id(path) for path in base.paths) if base is not None else ()
+        return REFERENCE_SIZE_ESTIMATE * len(self.paths) + sum(
+            path.nbytes for path in self.paths if id(path) not in shared)
+
+    def layer(self, uuid=None):
+        """ Returns a layer of the model.
+
+        :param uuid: the uuid of the layer; None for the active layer
+        :return: Layer
+        """
+        uuid = uuid or self.active_layer
+        for layer in self.layers:
+            if layer.uuid == uuid:
+                return layer
+        raise Exception('No such layer: %s' % uuid)
+
+    def layer_of(self, path):
+        """ Returns the Layer a path belongs to. """
+        if path.layer is None:
+            return self.layers[0]
+        for layer in self.layers:
+            if layer.uuid == path.layer:
+                return layer
+        return self.layers[0]
+
+    def add_layer(self, name=None):
+        """ Add a new layer on top of the others and make it the active one.
+
+        :param name: the name of the layer; by default 'Layer <n>'
+        :return: the new Layer
+        """
+        layer = Layer(name or 'Layer %d' % (len(self.layers) + 1))
+        self.layers.append(layer)
+        self.active_layer = layer.uuid
+        self._emit(LAYERS_CHANGED)
+        return layer
+
+    def remove_layer(self, uuid):
+        """ Remove a layer together with its paths. The last layer cannot be removed.
+
+        :param uuid: the uuid of the layer
+        """
+        layer = self.layer(uuid)
+        if len(self.layers) == 1:
+            raise Exception('Cannot remove the last layer')
+        removed = [path for path in self.paths if self.layer_of(path) is layer]
+        self.layers.remove(layer)
+        if removed:
+            self.erase_paths(removed)
+        if self.active_layer == uuid:
+            self.active_layer = self.layers[-1].uuid
+        self._emit(LAYERS_CHANGED)
+
+    def move_layer(self, uuid, position):
+        """ Change the stacking order of the layers.
+
+        :param uuid: the uuid of the layer
+        :param position: the new index of the layer, 0 being the bottom layer
+        """
+        layer = self.layer(uuid)
+        bottom = self.layers[0]
+        self.layers.remove(layer)
+        self.layers.insert(position, layer)
+        if bottom is not self.layers[0]:
+            # Paths without a layer stay on the layer they were shown on
+            self.paths = [path if path.layer is not None else path.with_layer(bottom.uuid)
+                          for path in self.paths]
+            self.__dict__['selection'] = [path if path.layer is not None else path.with_layer(bottom.uuid)
+                                          for path in self.selection]
+        self._emit(LAYERS_CHANGED)
+
+    def configure_layer(self, uuid, name=None, visible=None, locked=None):
+        """ Rename, show, hide, lock or unlock a layer. Paths on a layer which is hidden
+            or locked are removed from the selection.
+
+        :param uuid: the uuid of the layer
+        :param name: the new name; None for keeping the name
+        :param visible: the new visibility; None for keeping it
+        :param locked: the new lock state; None for keeping it
+        """
+        layer = self.layer(uuid)
+        if name is not None:
+            layer.name = name
+        if visible is not None:
+            layer.visible = visible
+        if locked is not None:
+            layer.locked = locked
+        if not layer.editable and self.selection:
+            self.selection = [path for path in self.selection if self.layer_of(path) is not layer]
+        self._emit(LAYERS_CHANGED)
+
+    def set_background(self, background):
+        """ Show an image under the paths of the sketch.
+
+        :param background: the Background; None for removing the background
+        """
+        self.background = background
+        self._emit(BACKGROUND_CHANGED)
+
+    def visible_paths(self):
+        """ Returns the paths on visible layers, ordered from the bottom layer to the top
+            layer and by drawing order within each layer.
+        """
+        if len(self.layers) == 1:
+            return list(self.paths) if self.layers[0].visible else []
+        # Hidden layers have no rank; paths without a known layer are on the bottom layer
+        ranks = {layer.uuid: k if layer.visible else None for k, layer in enumerate(self.layers)}
+        bottom = ranks[self.layers[0].uuid]
+        ranked = [(ranks.get(path.layer, bottom), path) for path in self.paths]
+        # sorted is stable, so the drawing order within each layer is kept
+        return [path for _, path in sorted((item for item in ranked if item[0] is not None),
+                                           key=lambda item: item[0])]
+
+    def editable_paths(self):
+        """ Returns the paths on layers which are visible and not locked, in drawing order.
+            Only these paths can be erased or selected.
+        """
+        if len(self.layers) == 1:
+            return self.paths if self.layers[0].editable else []
+        editable = set(layer.uuid for layer in self.layers if layer.editable)
+        return [path for path in self.paths if self.layer_of(path).uuid in editable]
 
     def start_path(self, point, pen=None):
-        pen = pen or Pen()
-        path = Path(pen)
+        pen = self.styles.intern(pen or Pen())
+        path = Path(pen, layer=self.active_layer)
         path.append(point)
         self.paths.append(path)
+        self._emit(PATHS_ADDED, [path])
 
     def continue_path(self, point):
         path = self.paths[-1]
         path.append(point)
+        self._emit(PATH_EXTENDED, [path])
 
     def finish_path(self, point):
         path = self.paths[-1]
         path.append(point)
-        self._optimize_path(path)
+        self.paths[-1] = path.finish(self._optimize_coords(path.coords))
+        self._emit(PATH_FINISHED, [self.paths[-1]], [path])
+
+    def add_paths(self, coords, offsets=None, pens=None, smooth=False):
+        """ Add many finished paths at once.
+
+        :param coords: list of (N_i, 2) arrays, one per path, or a stacked (N, 2) array
+                       of the coordinates of all paths together with offsets
+        :param offsets: for stacked coordinates, the start indices of the paths followed
+                        by N, like returned by path_arrays
+        :param pens: a Pen for all paths or a sequence with one Pen per path; None for the default pen
+        :param smooth: smooth the paths like paths drawn with the mouse
+        :return: list of the added Path objects; they are put on the active layer
+        """
+        if offsets is None:
+            parts = [np.asarray(c, dtype=float).reshape(-1, 2) for c in coords]
+            lengths = np.array([len(part) for part in parts], dtype=np.int64)
+            offsets = np.concatenate(([0], np.cumsum(lengths)))
+            stacked = np.concatenate(parts) if parts else np.zeros((0, 2))
+        else:
+            stacked = np.array(coords, dtype=float).reshape(-1, 2)
+            offsets = np.asarray(offsets, dtype=np.int64)
+            if len(offsets) == 0 or offsets[0] != 0 or offsets[-1] != len(stacked):
+                raise Exception('Offsets must start with 0 and end with the number of points')
+        if np.any(np.diff(offsets) <= 0):
+            raise Exception('Paths must have at least one point')
+
+        num_paths = len(offsets) - 1
+        if pens is None or isinstance(pens, Pen):
+            pens = [self.styles.intern(pens or Pen())] * num_paths
+        else:
+            pens = [self.styles.intern(pen) for pen in pens]
+            if len(pens) != num_paths:
+                raise Exception('Expected %d pens, got %d' % (num_paths, len(pens)))
+
+        if smooth:
+            stacked, offsets = smooth_paths(stacked, offsets)
+        # The paths share the stacked array, each one holds a read-only view of it
+        stacked.setflags(write=False)
+        bounds = offsets.tolist()
+        layer = self.active_layer
+        paths = [Path(pen, stacked[start:end], layer=layer)
+                 for pen, start, end in zip(pens, bounds[:-1], bounds[1:])]
+        self.paths.extend(paths)
+        self._emit(PATHS_ADDED, paths)
+        return paths
+
+    def merge_paths(self, paths, key, notify=True):
+        """ Insert finished paths and sort all paths by their position in the drawing order.
+
+        :param paths: list of Path objects
+        :param key: function returning the position of a path in the drawing order
+        :param notify: emit a PATHS_LOADED event
+        """
+        self.paths = sorted(self.paths + paths, key=key)
+        if notify:
+            self._emit(PATHS_LOADED, paths)
+
+    def path_arrays(self):
+        """ Returns the geometry of all paths as stacked arrays.
+
+        :return: tuple (coords, offsets, pen indices, pens): the (N, 2) array of the
+                 coordinates of all paths, the start index of each path followed by N,
+                 the index of the pen of each path into the list of pens
+        """
+        styles = StyleTable()
+        pen_indices = np.array([styles.add(path.pen) for path in self.paths], dtype=np.int64)
+        lengths = np.array([len(path.coords) for path in self.paths], dtype=np.int64)
+        offsets = np.concatenate(([0], np.cumsum(lengths)))
+        coords = np.concatenate([path.coords for path in self.paths]) if self.paths else np.zeros((0, 2))
+        return coords, offsets, pen_indices, styles.pens
 
     def erase_paths(self, paths):
-        for path in paths:
-            self.remove(path)
+        uuids = set(path.uuid for path in paths)
+        removed = [path for path in self.paths if path.uuid in uuids]
+        self.paths = [path for path in self.paths if path.uuid not in uuids]
+        if removed:
+            self._emit(PATHS_REMOVED, removed)
+
+    def cut_paths(self, paths, start, end, radius):
+        """ Erase the parts of the given paths touched by a circle moved from start
+            to end. Cut paths are replaced by the remaining pieces.
+
+        :param paths: list of Path objects in the model
+        :param start: start position of the circle (Point)
+        :param end: end position of the circle (Point)
+        :param radius: radius of the circle
+        :return: tuple (removed paths, added paths)
+        """
+        return self.replace_cut_paths(cut_paths(paths, start, end, radius))
+
+    def replace_cut_paths(self, cuts):
+        """ Replace paths by their remaining pieces as returned by cut_paths.
+
+        :param cuts: list of tuples (path in the model, list of the remaining pieces)
+        :return: tuple (removed paths, added paths)
+        """
+        pieces = {id(path): remaining for path, remaining in cuts}
+        removed = [path for path, _ in cuts]
+        added = [piece for _, remaining in cuts for piece in remaining]
+        if pieces:
+            self.paths = [piece for path in self.paths for piece in pieces.get(id(path), (path,))]
+            self.selection = [path for path in self.selection if id(path) not in pieces]
+            self._emit(PATHS_REMOVED, removed)
+            if added:
+                self._emit(PATHS_ADDED, added)
+        return removed, added
+
+    def translate_paths(self, paths, vector):
+        """ Replace the given paths by translated copies, also in the selection.
+
+        :param paths: list of Path objects in the model
+        :param vector: the translation vector (Point)
+        """
+        translated = {id(path): path.translated(vector) for path in paths}
+        self.paths = [translated.get(id(path), path) for path in self.paths]
+        self.__dict__['selection'] = [translated.get(id(path), path) for path in self.selection]
+        self._emit(PATHS_TRANSFORMED, [translated[id(path)] for path in paths], paths)
 
     def start_lasso(self, point):
         self.lasso = Lasso()
@@ -80,78 +664,227 @@ class SketchModel(object):
         self.lasso.append(point)
         self.lasso.append(self.lasso.points[0])
         selection = []
-        for path in self.paths:
+        for path in self.editable_paths():
             if self.lasso.contains(path):
                 selection.append(path)
         self.lasso = None
         self.selection = selection
 
-    def bbox(self):
+    def bbox(self, paths=None):
+        """ Returns the bounding box of the given paths, by default of all paths. """
 
         minx = miny = 1E9
         maxx = maxy = -1E9
 
-        for path in self.paths:
-            for pt in path.points:
-                if pt.x < minx:
-                    minx = pt.x
-                if pt.y < miny:
-                    miny = pt.y
-                if pt.x > maxx:
-                    maxx = pt.x
-                if pt.y > maxy:
-                    maxy = pt.y
+        for path in self.paths if paths is None else paths:
+            (x0, y0), (x1, y1) = path.bounds()
+            minx, miny = min(minx, x0), min(miny, y0)
+            maxx, maxy = max(maxx, x1), max(maxy, y1)
 
         return Rectangle(Point(minx, miny), Point(maxx, maxy))
 
+    def image_bbox(self):
+        """ Returns the bounding box of the visible paths and the background, i.e. of
+            everything shown in exported images; None if there is nothing to show.
+        """
+        paths = self.visible_paths()
+        boxes = [self.bbox(paths)] if paths else []
+        if self.background is not None:
+            boxes.append(self.background.bbox())
+        if not boxes:
+            return None
+        return Rectangle(Point(min(box.ul.x for box in boxes), min(box.ul.y for box in boxes)),
+                         Point(max(box.lr.x for box in boxes), max(box.lr.y for box in boxes)))
+
     def remove(self, path):
-        for p in self.paths:
-            if p.uuid == path.uuid:
-                self.paths.remove(p)
+        self.erase_paths([path])
 
-    def _optimize_path(self, path):
+    def _optimize_coords(self, coords):
+        """ Smooth the coordinates of a path, see smooth_paths.
+
+        :param coords: (N, 2) array of coordinates
+        :return: array with the smoothed coordinates
+        """
+        return smooth_paths(coords, [0, len(coords)])[0]
 
-        if len(path.points) <= 4:
-            return
 
-        xvalues = [p.x for p in path.points][:-1]
-        yvalues = [p.y for p in path.points][:-1]
+class Path(object):
+    """
+    A stroke in the sketch.
 
-        sigma = [0.]
-        for i in range(1, len(path.points)-1):
-            p0 = path.points[i - 1]
-            p1 = path.points[i]
-            dist = sqrt((p1.x - p0.x) ** 2 + (p1.y - p0.y) ** 2)
-            sigma.append(sigma[-1] + dist)
+    While a path is drawn, points can be appended to it. A finished path is immutable:
+    its coordinates are kept in a read-only array that can be shared between model
+    snapshots, and transformations return new Path objects. Derived geometry like the
+    bounding box and the tessellation is therefore computed only once per finished path.
+    """
 
-        xfit = interp1d(sigma, xvalues, kind='cubic')
-        yfit = interp1d(sigma, yvalues, kind='cubic')
+    def __init__(self, pen=None, coords=None, uuid=None, layer=None):
+        """
 
-        sigma_dense = arange(0, sigma[-1], 1.)
-        points = []
-        for s in sigma_dense:
-            p = Point(xfit(s), yfit(s))
-            points.append(p)
+        :param pen: the Pen of the path
+        :param coords: coordinates of a finished path (sequence of points or (N, 2) array);
+                       None for starting a new path
+        :param uuid: the identifier of the path (str); a new one is created if None
+        :param layer: the uuid of the layer of the path; None for the bottom layer
+        """
+        self.pen = pen or Pen()
+        self.uuid = uuid or str(uuid4())
+        self.layer = layer
+        self._pending = [] if coords is None else None
+        self._coords = None if coords is None else as_coords(coords)
+        self._bounds = None
+        self._tessellation = None
+
+    def __setstate__(self, state):
+        if 'points' in state:
+            # Path saved by an older version
+            state = {'pen': state['pen'], 'uuid': state['uuid'], '_pending': None,
+                     '_coords': state.pop('points'), '_bounds': None}
+        state.setdefault('layer', None)
+        state['_tessellation'] = None
+        if state['_coords'] is not None:
+            state['_coords'] = as_coords(state['_coords'])
+        self.__dict__.update(state)
 
-        path.points = points
+    @property
+    def finished(self):
+        return self._coords is not None
 
+    @property
+    def coords(self):
+        """ The coordinates of the path as (N, 2) array. """
+        if self._coords is None:
+            return as_coords(self._pending)
+        return self._coords
 
-class Path(object):
+    @property
+    def points(self):
+        """ The coordinates of the path as list of Point objects. """
+        if self._coords is None:
+            return [Point(x, y) for x, y in self._pending]
+        return [Point(x, y) for x, y in self._coords.tolist()]
 
-    def __init__(self, pen=None):
-        self.pen = pen or Pen()
-        self.points = []
-        self.uuid = str(uuid.uuid4())
+    @property
+    def nbytes(self):
+        if self._coords is None:
+            return PATH_SIZE_ESTIMATE + 100 * len(self._pending)
+        if self._tessellation is not None and self._tessellation is not self._coords:
+            return PATH_SIZE_ESTIMATE + self._coords.nbytes + self._tessellation.nbytes
+        return PATH_SIZE_ESTIMATE + self._coords.nbytes
+
+    def __len__(self):
+        return len(self._pending) if self._coords is None else len(self._coords)
+
+    def bounds(self):
+        """ Returns the bounding box of the path as ((minx, miny), (maxx, maxy)). """
+        if self._bounds is not None:
+            return self._bounds
+        coords = self.coords
+        bounds = tuple(coords.min(axis=0).tolist()), tuple(coords.max(axis=0).tolist())
+        if self.finished:
+            self._bounds = bounds
+        return bounds
+
+    def tessellation(self):
+        """ Returns the smooth curve through the points of the path as polyline, which
+            can be drawn without further smoothing (see tessellate).
+
+        :return: (M, 2) array of coordinates
+        """
+        if self._tessellation is not None:
+            return self._tessellation
+        tessellation = tessellate(self.coords)
+        if self.finished:
+            tessellation.setflags(write=False)
+            self._tessellation = tessellation
+        return tessellation
 
     def clone(self):
-        return deepcopy(self)
+        path = Path(self.pen, self._coords, self.uuid, self.layer)
+        if self._coords is None:
+            path._pending = list(self._pending)
+        return path
 
     def append(self, point):
-        self.points.append(point)
+        if self._pending is None:
+            raise Exception('Cannot append to a finished path')
+        self._pending.append((float(point[0]), float(point[1])))
+
+    def finish(self, coords=None):
+        """ Returns the finished version of this path.
+
+        :param coords: the final coordinates; by default the points appended so far
+        :return: Path
+        """
+        return Path(self.pen, self.coords if coords is None else coords, self.uuid, self.layer)
+
+    def with_layer(self, layer):
+        """ Returns a copy of the finished path on another layer.
 
-    def translate(self, vector):
-        for i, _ in enumerate(self.points):
-            self.points[i] += vector
+        :param layer: the uuid of the layer
+        :return: Path
+        """
+        path = Path(self.pen, self.coords, self.uuid, layer)
+        path._bounds = self._bounds
+        path._tessellation = self._tessellation
+        return path
+
+    def cut(self, start, end, radius):
+        """ Returns the pieces of the path that remain after erasing everything closer
+            than radius to the segment from start to end.
+
+        The pieces are clipped where the path enters or leaves the erased area, so even
+        a path with few points only loses the touched part. They get new uuids and share
+        the pen and the layer with this path.
+
+        :param start: start point of the segment (Point)
+        :param end: end point of the segment (Point)
+        :param radius: the erase radius
+        :return: list of Path objects; [self] if nothing is erased
+        """
+        coords = self.coords
+        a = np.array((start[0], start[1]), dtype=float)
+        b = np.array((end[0], end[1]), dtype=float)
+
+        keep = _point_segment_distances(coords, a, b) >= radius
+        # A path is also cut where a segment crosses the erased area without
+        # any of its end points being inside
+        breaks = ~keep[:-1] | ~keep[1:] | (segment_distances(a, b, coords[:-1], coords[1:]) < radius)
+        if keep.all() and not breaks.any():
+            return [self]
+
+        # The points where the broken segments enter and leave the erased area
+        broken = np.flatnonzero(breaks)
+        entries, exits = _clip_segments(coords[broken], coords[broken + 1], a, b, radius)
+        entries = dict(zip(broken.tolist(), entries))
+        exits = dict(zip(broken.tolist(), exits))
+
+        # Runs of points without breaks in between; erased points form runs of their own.
+        # The kept runs are extended to the boundary of the erased area.
+        cuts = broken + 1
+        run_starts = np.concatenate(([0], cuts)).tolist()
+        run_ends = np.concatenate((cuts, [len(coords)])).tolist()
+        pieces = []
+        for i, j in zip(run_starts, run_ends):
+            if not keep[i]:
+                continue
+            parts = [coords[i:j]]
+            if i - 1 in exits:
+                parts.insert(0, exits[i - 1][None])
+            if j - 1 in entries:
+                parts.append(entries[j - 1][None])
+            piece = np.concatenate(parts) if len(parts) > 1 else parts[0]
+            if len(piece) > 1:
+                pieces.append(Path(self.pen, piece, layer=self.layer))
+        return pieces
+
+    def translated(self, vector):
+        """ Returns a translated copy of the path with the same uuid.
+
+        :param vector: the translation vector (Point)
+        :return: Path
+        """
+        return Path(self.pen, self.coords + (vector[0], vector[1]), self.uuid, self.layer)
 
 
 class Lasso(Path):
@@ -161,19 +894,91 @@ class Lasso(Path):
         super().__init__(pen)
 
     def contains(self, path):
+        from shapely.geometry import Point as shPoint
+        from shapely.geometry.polygon import Polygon
 
-        polygon = Polygon((p.x, p.y) for p in self.points)
+        polygon = Polygon(self.coords)
 
-        for point in path.points:
-            pt = shPoint(point.x, point.y)
-            if polygon.contains(pt):
+        for x, y in path.coords.tolist():
+            if polygon.contains(shPoint(x, y)):
                 return True
         return False
 
 
+class Layer(object):
+    """
+    A layer of a sketch. Layers are stacked in the order of SketchModel.layers.
+
+    Paths on hidden layers are not drawn and, like paths on locked layers, they
+    cannot be erased or selected.
+    """
+
+    def __init__(self, name, visible=True, locked=False, uuid=None):
+        """
+
+        :param name: the name of the layer (str)
+        :param visible: whether the paths of the layer are shown
+        :param locked: whether the paths of the layer are protected from changes
+        :param uuid: the identifier of the layer (str); a new one is created if None
+        """
+        self.name = name
+        self.visible = visible
+        self.locked = locked
+        self.uuid = uuid or str(uuid4())
+
+    @property
+    def editable(self):
+        return self.visible and not self.locked
+
+    def clone(self):
+        return Layer(self.name, self.visible, self.locked, self.uuid)
+
+    def __repr__(self):
+        return 'Layer(%r, visible=%s, locked=%s)' % (self.name, self.visible, self.locked)
+
+
+class Background(object):
+    """
+    A raster image shown under the paths of a sketch, e.g. a plot or a scanned page.
+
+    The image file is referenced by its name, it is not copied into the sketch file.
+    Background objects are immutable and shared between model snapshots.
+    See ipysketch.background for loading and rendering the image.
+    """
+
+    def __init__(self, source, size, origin=(0, 0)):
+        """
+
+        :param source: path of the image file (PNG or JPEG)
+        :param size: (width, height) of the image in pixels
+        :param origin: sketch coordinates of the upper left corner of the image
+        """
+        self.source = source
+        self.size = (int(size[0]), int(size[1]))
+        self.origin = (float(origin[0]), float(origin[1]))
+
+    def bbox(self):
+        x, y = self.origin
+        return Rectangle(Point(x, y), Point(x + self.size[0], y + self.size[1]))
+
+    def __eq__(self, other):
+        return isinstance(other, Background) and self.key() == other.key()
+
+    def __hash__(self):
+        return hash(self.key())
+
+    def key(self):
+        return self.source, self.size, self.origin
+
+    def __repr__(self):
+        return 'Background(%r, %r, %r)' % self.key()
+
+
 class Pen(object):
     """
     Class representing the pen used for drawing.
+
+    Pens are immutable, so that equal pens can be shared between paths and models.
     """
 
     def __init__(self, width=1, color='#000000', dash=None):
@@ -181,21 +986,99 @@ class Pen(object):
 
         :param width: width of the pen (int)
         :param color: color of the pen (6 digit hex-valued code as str)
+        :param dash: dash pattern (tuple of int) or None for solid lines
         """
-        self.width = width
-        self.color = color
-        self.dash = dash
+        object.__setattr__(self, 'width', width)
+        object.__setattr__(self, 'color', color)
+        object.__setattr__(self, 'dash', tuple(dash) if dash else None)
+        object.__setattr__(self, '_line_options', None)
+
+    def __setattr__(self, name, value):
+        raise AttributeError('Pen objects are immutable')
+
+    def __setstate__(self, state):
+        self.__init__(state['width'], state['color'], state.get('dash'))
+
+    def __getstate__(self):
+        return {'width': self.width, 'color': self.color, 'dash': self.dash}
+
+    def __copy__(self):
+        return self
+
+    def __deepcopy__(self, memo):
+        return self
+
+    def __eq__(self, other):
+        return isinstance(other, Pen) and self.key() == other.key()
+
+    def __hash__(self):
+        return hash(self.key())
+
+    def key(self):
+        return self.width, self.color, self.dash
 
     def clone(self):
-        return Pen(self.width, self.color)
+        return self
+
+    @property
+    def line_options(self):
+        """ The options for Tk's create_line, computed once per pen. """
+        if self._line_options is None:
+            options = {'fill': self.color, 'width': self.width}
+            if self.dash:
+                options['dash'] = self.dash
+            object.__setattr__(self, '_line_options', options)
+        return self._line_options
 
     def __repr__(self):
         repr = 'Line width: %d\n' % self.width
         repr += 'Color: %s\n' % self.color
-        repr += 'Dash: %s\n\n' % self.dash
+        repr += 'Dash: %s\n\n' % (self.dash,)
         return repr
 
 
+class StyleTable(object):
+    """
+    Table of the distinct pens used in a model. Each pen is stored once and
+    referenced by its index.
+    """
+
+    def __init__(self, pens=()):
+        self.pens = []
+        self._indices = {}
+        for pen in pens:
+            self.add(pen)
+
+    def add(self, pen):
+        """ Add a pen to the table, unless an equal pen is already there.
+
+        :param pen: the Pen to add
+        :return: the index of the pen in the table
+        """
+        idx = self._indices.get(pen)
+        if idx is None:
+            idx = len(self.pens)
+            self.pens.append(pen)
+            self._indices[pen] = idx
+        return idx
+
+    def intern(self, pen):
+        """ Returns the shared instance of the table equal to the given pen. """
+        return self.pens[self.add(pen)]
+
+    def index(self, pen):
+        return self._indices[pen]
+
+    def __getitem__(self, idx):
+        return self.pens[idx]
+
+    def __len__(self):
+        return len(self.pens)
+
+    def __deepcopy__(self, memo):
+        return StyleTable(self.pens)
+
+
 class Rectangle(object):
 
     def __init__(self, upper_left, lower_right):
@@ -290,15 +1173,281 @@ class Circle(object):
 
 def filter_paths(paths, at_point, radius=20):
     found_paths = []
-    circle = Circle(at_point, radius)
+    center = np.array((at_point[0], at_point[1]))
     for path in paths:
-        for pt in path.points:
-            if circle.contains(pt):
-                found_paths.append(path)
-                break
+        (x0, y0), (x1, y1) = path.bounds()
+        if center[0] < x0 - radius or center[0] > x1 + radius or \
+                center[1] < y0 - radius or center[1] > y1 + radius:
+            continue
+        if (((path.coords - center) ** 2).sum(axis=1) < radius ** 2).any():
+            found_paths.append(path)
     return found_paths
 
 
+def filter_paths_swept(paths, start, end, radius):
+    """ Find the paths touched by a circle moved along a straight line, i.e. the
+        paths with any segment closer than radius to the segment from start to end.
+
+    :param paths: the paths to check
+    :param start: start position of the circle (Point)
+    :param end: end position of the circle (Point)
+    :param radius: radius of the circle
+    :return: list of paths
+    """
+    a = np.array((start[0], start[1]), dtype=float)
+    b = np.array((end[0], end[1]), dtype=float)
+    lo = np.minimum(a, b) - radius
+    hi = np.maximum(a, b) + radius
+
+    candidates = []
+    for path in paths:
+        (x0, y0), (x1, y1) = path.bounds()
+        if x1 < lo[0] or x0 > hi[0] or y1 < lo[1] or y0 > hi[1]:
+            continue
+        candidates.append(path)
+    if not candidates:
+        return []
+
+    # Treat all segments of all candidates in one go. Each path contributes its
+    # segments, a single point counts as a segment of length zero.
+    starts, ends, owners = [], [], []
+    for k, path in enumerate(candidates):
+        coords = path.coords
+        if len(coords) == 1:
+            starts.append(coords)
+            ends.append(coords)
+        else:
+            starts.append(coords[:-1])
+            ends.append(coords[1:])
+        owners.append(np.full(len(starts[-1]), k))
+    p, q, owners = np.concatenate(starts), np.concatenate(ends), np.concatenate(owners)
+
+    hits = segment_distances(a, b, p, q) < radius
+    hit_owners = set(np.unique(owners[hits]).tolist())
+    return [path for k, path in enumerate(candidates) if k in hit_owners]
+
+
+def segment_distances(a, b, p, q):
+    """ Distances between the segment a-b and each of the segments p[i]-q[i].
+
+    :param a: start point of the segment, array of shape (2,)
+    :param b: end point of the segment, array of shape (2,)
+    :param p: start points of the other segments, array of shape (N, 2)
+    :param q: end points of the other segments, array of shape (N, 2)
+    :return: array of shape (N,)
+    """
+    dist = np.minimum(
+        np.minimum(_point_segment_distances(p, a, b), _point_segment_distances(q, a, b)),
+        np.minimum(_point_segment_distances(a, p, q), _point_segment_distances(b, p, q)))
+
+    # Crossing segments have distance zero
+    d1 = _cross(p - a, b - a)
+    d2 = _cross(q - a, b - a)
+    d3 = _cross(a - p, q - p)
+    d4 = _cross(b - p, q - p)
+    crossing = (d1 * d2 < 0) & (d3 * d4 < 0)
+    dist[crossing] = 0.
+    return dist
+
+
+def cut_paths(paths, start, end, radius):
+    """ Compute which paths are touched by a circle moved from start to end, without
+        changing anything, so that a history entry is only needed if something is cut.
+
+    :param paths: list of Path objects
+    :param start: start position of the circle (Point)
+    :param end: end position of the circle (Point)
+    :param radius: radius of the circle
+    :return: list of tuples (cut path, list of its remaining pieces)
+    """
+    cuts = []
+    for path in paths:
+        remaining = path.cut(start, end, radius)
+        if len(remaining) == 1 and remaining[0] is path:
+            continue
+        cuts.append((path, remaining))
+    return cuts
+
+
+def smooth_paths(coords, offsets):
+    """ Smooth paths by cubic interpolation with respect to the arc length and
+        resampling at unit distance, like paths drawn with the mouse.
+
+    The last point of each path is dropped, as it is usually a duplicate of the one
+    before. Paths with less than four distinct points are returned unchanged. The
+    not-a-knot splines of all paths are computed at once, by solving one banded
+    system with a block for each path.
+
+    :param coords: (N, 2) array of the coordinates of all paths
+    :param offsets: the start index of each path followed by N
+    :return: tuple (coords, offsets) of the smoothed paths
+    """
+    coords = np.asarray(coords, dtype=float)
+    offsets = np.asarray(offsets, dtype=np.int64)
+    lengths = np.diff(offsets)
+    num_paths = len(lengths)
+    path_ids = np.repeat(np.arange(num_paths), lengths)
+
+    # The knots: all points but the last one of each path, without repeated points
+    keep = np.ones(len(coords), dtype=bool)
+    keep[offsets[1:] - 1] = False
+    repeated = np.zeros(len(coords), dtype=bool)
+    repeated[1:] = np.all(coords[1:] == coords[:-1], axis=1)
+    repeated[offsets[:-1]] = False
+    keep &= ~repeated
+    counts = np.bincount(path_ids[keep], minlength=num_paths)
+    smoothable = (lengths > 4) & (counts > 3)
+    if not smoothable.any():
+        return coords, offsets
+
+    # scipy takes long to import, so it is only loaded when needed
+    from scipy.linalg import solve_banded
+
+    keep &= smoothable[path_ids]
+    knots, knot_ids = coords[keep], path_ids[keep]
+    n = counts[smoothable]
+    starts = np.concatenate(([0], np.cumsum(n)))
+    first, last = starts[:-1], starts[1:] - 1
+    # dx[i] is the arc length from knot i to knot i + 1 (0 at the last knot of a path)
+    dx = np.zeros(len(knots))
+    dx[:-1] = np.hypot(*np.diff(knots, axis=0).T)
+    dx[last] = 0.
+    slope = np.zeros_like(knots)
+    inner = dx > 0
+    slope[inner] = (knots[1:] - knots[:-1])[inner[:-1]] / dx[inner][:, None]
+    sigma = np.cumsum(dx) - dx
+    sigma -= np.repeat(sigma[first], n)
+
+    # The tridiagonal system for the first derivatives at the knots, see scipy's CubicSpline
+    dxp, slp = np.roll(dx, 1), np.roll(slope, 1, axis=0)
+    diag, upper, lower = 2 * (dxp + dx), dxp.copy(), dx.copy()
+    rhs = 3 * (dx[:, None] * slp + dxp[:, None] * slope)
+    d = dx[first] + dx[first + 1]
+    diag[first], upper[first], lower[first] = dx[first + 1], d, 0.
+    rhs[first] = (((dx[first] + 2 * d) * dx[first + 1])[:, None] * slope[first] +
+                  (dx[first] ** 2)[:, None] * slope[first + 1]) / d[:, None]
+    d = dx[last - 1] + dx[last - 2]
+    diag[last], upper[last], lower[last] = dx[last - 2], 0., d
+    rhs[last] = ((dx[last - 1] ** 2)[:, None] * slope[last - 2] +
+                 ((2 * d + dx[last - 1]) * dx[last - 2])[:, None] * slope[last - 1]) / d[:, None]
+    banded = np.zeros((3, len(knots)))
+    banded[0, 1:], banded[1], banded[2, :-1] = upper[:-1], diag, lower[1:]
+    derivatives = solve_banded((1, 1), banded, rhs)
+
+    # Sample the splines at unit distance
+    total = sigma[last]
+    samples = np.ceil(total).astype(np.int64)
+    sample_ids = np.repeat(np.arange(len(samples)), samples)
+    x = np.arange(samples.sum()) - np.repeat(np.concatenate(([0], np.cumsum(samples)[:-1])), samples)
+    # The paths are laid out one after another, so that one search finds the intervals of all samples
+    shift = np.concatenate(([0.], np.cumsum(total + 1)[:-1]))
+    idx = np.searchsorted(sigma + np.repeat(shift, n), x + shift[sample_ids], side='right') - 1
+    idx = np.clip(idx, first[sample_ids], last[sample_ids] - 1)
+    h, t = dx[idx][:, None], (x - sigma[idx])[:, None]
+    s0, s1, m = derivatives[idx], derivatives[idx + 1], slope[idx]
+    dense = knots[idx] + t * (s0 + t * ((3 * m - 2 * s0 - s1) / h + t * ((s0 + s1 - 2 * m) / h ** 2)))
+
+    new_lengths = lengths.copy()
+    new_lengths[smoothable] = samples
+    result = np.empty((new_lengths.sum(), 2))
+    smoothed = smoothable[np.repeat(np.arange(num_paths), new_lengths)]
+    result[smoothed] = dense
+    result[~smoothed] = coords[~smoothable[path_ids]]
+    return result, np.concatenate(([0], np.cumsum(new_lengths)))
+
+
+def tessellate(coords, tolerance=TESSELLATION_TOLERANCE):
+    """ Approximate the smooth curve through points by a polyline.
+
+    The curve is the one Tk draws for lines with smooth=True: a chain of parabolic
+    segments from the midpoint of each edge to the midpoint of the next one, with the
+    point in between as control point, starting and ending at the end points. The
+    number of steps per segment is chosen such that the polyline deviates at most by
+    the tolerance from the curve.
+
+    :param coords: (N, 2) array of coordinates
+    :param tolerance: the maximum deviation
+    :return: (M, 2) array of coordinates
+    """
+    if len(coords) < 3:
+        return coords
+
+    a, b, c = coords[:-2], coords[1:-1], coords[2:]
+    start = (a + b) / 2
+    end = (b + c) / 2
+    start[0] = coords[0]
+    end[-1] = coords[-1]
+
+    # A parabolic segment deviates from its chord by half the distance of the control
+    # point from the chord; with n steps, the deviation shrinks by a factor of n ** 2
+    chord = end - start
+    length = np.hypot(*chord.T)
+    offset = np.hypot(*(b - start).T)
+    distance = np.where(length > 0, np.abs(_cross(chord, b - start)) / np.maximum(length, 1e-9), offset)
+    deviation = distance.max() / 2
+    steps = int(min(MAX_SPLINE_STEPS, max(1, np.ceil(np.sqrt(deviation / tolerance)))))
+
+    t = (np.arange(1, steps + 1) / steps)[None, :, None]
+    start, b, end = start[:, None], b[:, None], end[:, None]
+    points = (1 - t) ** 2 * start + 2 * t * (1 - t) * b + t ** 2 * end
+    return np.concatenate((coords[:1], points.reshape(-1, 2)))
+
+
+def _point_segment_distances(x, p, q):
+    """ Distances of point(s) x to segment(s) p-q, broadcasting over the first axis. """
+    pq = q - p
+    length2 = (pq ** 2).sum(axis=-1)
+    t = ((x - p) * pq).sum(axis=-1) / np.where(length2 > 0, length2, 1.)
+    t = np.clip(t, 0., 1.)
+    closest = p + t[..., None] * pq
+    return np.sqrt(((x - closest) ** 2).sum(axis=-1))
+
+
+def _clip_segments(p, q, a, b, radius):
+    """ Find where the segments p[i]-q[i] enter and leave the area closer than radius
+        to the segment a-b. The distance to a-b is convex along a segment, so the part
+        inside is a single interval, which is found by bisection. The points returned
+        lie just outside the area.
+
+    :param p: start points of the segments, array of shape (N, 2)
+    :param q: end points of the segments, array of shape (N, 2)
+    :return: tuple (entry points, exit points), arrays of shape (N, 2); a segment starting
+             (ending) inside the area has its start (end) point as entry (exit) point
+    """
+    d = q - p
+
+    def distance(t):
+        return _point_segment_distances(p + t[:, None] * d, a, b)
+
+    # The point of each segment closest to a-b, by ternary search
+    lo, hi = np.zeros(len(p)), np.ones(len(p))
+    for _ in range(40):
+        t1, t2 = lo + (hi - lo) / 3, hi - (hi - lo) / 3
+        closer = distance(t1) < distance(t2)
+        hi = np.where(closer, t2, hi)
+        lo = np.where(closer, lo, t1)
+    closest = (lo + hi) / 2
+
+    def boundary(outside, inside):
+        # Bisection between a parameter outside and one inside the area
+        for _ in range(40):
+            middle = (outside + inside) / 2
+            out = distance(middle) >= radius
+            outside = np.where(out, middle, outside)
+            inside = np.where(out, inside, middle)
+        return outside
+
+    start_inside = distance(np.zeros(len(p))) < radius
+    end_inside = distance(np.ones(len(p))) < radius
+    t_in = np.where(start_inside, 0., boundary(np.zeros(len(p)), closest))
+    t_out = np.where(end_inside, 1., boundary(np.ones(len(p)), closest))
+    return p + t_in[:, None] * d, p + t_out[:, None] * d
+
+
+def _cross(u, v):
+    return u[..., 0] * v[..., 1] - u[..., 1] * v[..., 0]
+
+
 class Transformation(object):
     pass
 
@@ -310,10 +1459,30 @@ class Translation(Transformation):
         self.destination = destination
 
 
+def as_coords(points):
+    """ Convert points to a read-only (N, 2) array of floats.
+
+    :param points: sequence of points (anything indexable by 0 and 1) or array
+    :return: numpy array
+    """
+    if isinstance(points, np.ndarray):
+        if points.dtype == float and not points.flags.writeable:
+            return points
+        coords = np.array(points, dtype=float)
+    else:
+        coords = np.array([(p[0], p[1]) for p in points], dtype=float)
+    coords = coords.reshape(-1, 2)
+    coords.setflags(write=False)
+    return coords
+
+
 def flatten(points):
-    flat_list = []
-    for pt in points:
-        flat_list.extend([pt[0], pt[1]])
+    if isinstance(points, np.ndarray):
+        flat_list = points.ravel().tolist()
+    else:
+        flat_list = []
+        for pt in points:
+            flat_list.extend([pt[0], pt[1]])
     if len(flat_list) == 2:
         flat_list += flat_list
     return tuple(flat_list)
@@ -0,0 +1,206 @@
+import functools
+import json
+import time
+from collections import deque
+
+
+class RollingHistogram(object):
+    """
+    Keeps the most recent samples of a measured quantity and summarizes them
+    as percentiles and logarithmic bucket counts.
+    """
+
+    def __init__(self, window=1000, buckets=(0.5, 1, 2, 4, 8, 16, 32, 64, 128, 256)):
+        """
+
+        :param window: maximum number of samples to keep (int)
+        :param buckets: upper bounds of the histogram buckets (ascending)
+        """
+        self.samples = deque(maxlen=window)
+        self.buckets = tuple(buckets)
+
+    def add(self, value):
+        self.samples.append(value)
+
+    def __len__(self):
+        return len(self.samples)
+
+    def percentile(self, q):
+        """ Returns the q-th percentile (0 <= q <= 100) of the current window.
+
+        :param q: the percentile to compute
+        :return: float or None if there are no samples
+        """
+        if not self.samples:
+            return None
+        values = sorted(self.samples)
+        idx = min(len(values) - 1, int(round(q / 100. * (len(values) - 1))))
+        return values[idx]
+
+    def counts(self):
+        """ Returns the number of samples in each bucket. The last entry counts the
+            samples above the largest bucket bound.
+
+        :return: list of int
+        """
+        counts = [0] * (len(self.buckets) + 1)
+        for value in self.samples:
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    counts[i] += 1
+                    break
+            else:
+                counts[-1] += 1
+        return counts
+
+    def summary(self):
+        return {
+            'count': len(self.samples),
+            'p50': self.percentile(50),
+            'p95': self.percentile(95),
+            'max': max(self.samples) if self.samples else None,
+            'buckets': list(self.buckets),
+            'counts': self.counts(),
+        }
+
+
+class LatencyProfiler(object):
+    """
+    Records per-event timings of the interactive pipeline.
+
+    For each handled input event, the profiler measures the total handling time,
+    the part of it spent in canvas operations (the rest is attributed to the model
+    and controller), the lag between the Tk event timestamp and the start of its
+    handling, and the number of canvas items created or deleted.
+    All times are in milliseconds.
+    """
+
+    def __init__(self, window=1000):
+        self.window = window
+        self.histograms = {}
+        self._event = None
+        self._canvas_depth = 0
+        self._canvas_start = None
+        self._clock_offset = None
+
+    def histogram(self, name):
+        if name not in self.histograms:
+            self.histograms[name] = RollingHistogram(self.window)
+        return self.histograms[name]
+
+    def begin_event(self, name, event=None):
+        """ Mark the start of handling an input event.
+
+        :param name: the kind of event, e.g. 'move'
+        :param event: the Tk event object (optional)
+        """
+        now = _now()
+        self._event = {
+            'name': name,
+            'start': now,
+            'canvas': 0.,
+            'items': 0,
+        }
+        event_time = getattr(event, 'time', None)
+        if isinstance(event_time, int) and event_time > 0:
+            # Tk event timestamps use an arbitrary epoch, so we measure the lag
+            # relative to the smallest offset between both clocks seen so far.
+            offset = now - event_time
+            if self._clock_offset is None or offset < self._clock_offset:
+                self._clock_offset = offset
+            self.histogram(name + '.lag').add(offset - self._clock_offset)
+
+    def end_event(self):
+        """ Mark the end of handling the current input event and record its timings. """
+        if self._event is None:
+            return
+        event = self._event
+        self._event = None
+        total = _now() - event['start']
+        name = event['name']
+        self.histogram(name + '.total').add(total)
+        self.histogram(name + '.canvas').add(event['canvas'])
+        self.histogram(name + '.model').add(total - event['canvas'])
+        self.histogram(name + '.items').add(event['items'])
+
+    def begin_canvas(self):
+        self._canvas_depth += 1
+        if self._canvas_depth == 1:
+            self._canvas_start = _now()
+
+    def end_canvas(self):
+        self._canvas_depth -= 1
+        if self._canvas_depth == 0 and self._event is not None:
+            self._event['canvas'] += _now() - self._canvas_start
+
+    def count_items(self, n=1):
+        """ Count canvas items touched while handling the current event. """
+        if self._event is not None:
+            self._event['items'] += n
+
+    def summary(self):
+        return {name: hist.summary() for name, hist in sorted(self.histograms.items())}
+
+    def dump(self, file_name):
+        """ Write the summary of all histograms as JSON to a file.
+
+        :param file_name: path of the output file
+        """
+        with open(file_name, 'w') as f:
+            json.dump(self.summary(), f, indent=2)
+
+    def overlay_text(self):
+        """ Returns a short text for the debug overlay. """
+        lines = []
+        for name in ('button_down', 'move', 'button_up'):
+            total = self.histograms.get(name + '.total')
+            if not total:
+                continue
+            canvas = self.histograms[name + '.canvas']
+            lines.append('%s: p50 %.1f p95 %.1f ms (canvas p50 %.1f) items %d' % (
+                name, total.percentile(50), total.percentile(95),
+                canvas.percentile(50), self.histograms[name + '.items'].percentile(50)))
+        return '\n'.join(lines)
+
+
+def profiled_event(name):
+    """ Decorator for controller event handlers. Records the handling of the event
+        if the controller has a profiler attached.
+
+    :param name: the name of the event kind
+    """
+    def decorator(method):
+        @functools.wraps(method)
+        def wrapper(self, event):
+            profiler = self.profiler
+            if profiler is None:
+                return method(self, event)
+            profiler.begin_event(name, event)
+            try:
+                return method(self, event)
+            finally:
+                profiler.end_event()
+                self.on_profiled_event()
+        return wrapper
+    return decorator
+
+
+def profiled_canvas(method):
+    """ Decorator for canvas operations. Attributes the time spent in the operation
+        to canvas work if the canvas has a profiler attached.
+    """
+    @functools.wraps(method)
+    def wrapper(self, *args, **kwargs):
+        profiler = self.profiler
+        if profiler is None:
+            return method(self, *args, **kwargs)
+        profiler.begin_canvas()
+        try:
+            return method(self, *args, **kwargs)
+        finally:
+            profiler.end_canvas()
+    return wrapper
+
+
+def _now():
+    return time.perf_counter() * 1000.
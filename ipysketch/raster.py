@@ -0,0 +1,264 @@
+import io
+import tkinter as tk
+import zlib
+
+import numpy as np
+
+# Edge length of the raster tiles in pixels
+TILE_SIZE = 256
+
+# PNG encoder settings by effort: the zlib compression level and the zlib strategies
+# to try. With several strategies, the smallest result is kept. Run-length encoding
+# is fast and suits the long runs of background pixels in sketches.
+PNG_EFFORTS = {
+    'fast': (1, (zlib.Z_RLE,)),
+    'default': (6, (zlib.Z_DEFAULT_STRATEGY,)),
+    'max': (9, (zlib.Z_DEFAULT_STRATEGY, zlib.Z_FILTERED, zlib.Z_RLE)),
+}
+
+
+def draw_paths(image, paths, offset=(0, 0), scale=1.):
+    """ Draw paths onto a PIL image, using their tessellations like the canvas.
+
+    :param image: the PIL image to draw on
+    :param paths: iterable of Path objects
+    :param offset: sketch coordinates of the upper left corner of the image
+    :param scale: scale factor from sketch coordinates to image pixels
+    :return:
+    """
+    from PIL import ImageDraw
+
+    draw = ImageDraw.Draw(image)
+    for path in paths:
+        coords = (path.tessellation() - offset) * scale
+        xy = coords.ravel().tolist()
+        if len(xy) == 2:
+            xy += xy
+        width = max(1, int(round(path.pen.width * scale)))
+        draw.line(xy, fill=path.pen.color, width=width, joint='curve')
+
+
+def reduce_colors(image):
+    """ Convert an image to the most compact PNG color type which represents it exactly.
+
+    Images with at most 256 colors become palette images, with as few bits per pixel
+    as possible and the alpha values of the colors in the palette. Other images
+    become greyscale if all their pixels are grey. The alpha channel is dropped
+    if the image is opaque.
+
+    :param image: PIL image in RGB or RGBA mode
+    :return: tuple (image, dict with additional options for saving it as PNG)
+    """
+    from PIL import Image
+
+    if image.mode == 'RGBA' and image.getextrema()[3] == (255, 255):
+        image = image.convert('RGB')
+
+    colors = image.getcolors(256)
+    if colors is None:
+        pixels = np.asarray(image)
+        if (pixels[..., 0] == pixels[..., 1]).all() and (pixels[..., 1] == pixels[..., 2]).all():
+            return image.convert('LA' if image.mode == 'RGBA' else 'L'), {}
+        return image, {}
+
+    colors = [color if image.mode == 'RGBA' else color + (255,) for _, color in colors]
+    if len(colors) > 16 and all(r == g == b for r, g, b, _ in colors):
+        # Greyscale needs no palette lookup and compresses as well as 8 bit palettes
+        return image.convert('LA' if image.mode == 'RGBA' else 'L'), {}
+
+    # Map each pixel to the index of its color in the sorted palette
+    packed_colors = np.array(sorted((r << 24) | (g << 16) | (b << 8) | a for r, g, b, a in colors), dtype=np.uint32)
+    pixels = np.asarray(image.convert('RGBA')).astype(np.uint32)
+    packed = (pixels[..., 0] << 24) | (pixels[..., 1] << 16) | (pixels[..., 2] << 8) | pixels[..., 3]
+    indexed = Image.fromarray(np.searchsorted(packed_colors, packed).astype(np.uint8), 'P')
+    indexed.putpalette([(int(c) >> shift) & 255 for c in packed_colors for shift in (24, 16, 8)])
+
+    options = {'bits': next(bits for bits in (1, 2, 4, 8) if len(colors) <= 1 << bits)}
+    alphas = [int(c) & 255 for c in packed_colors]
+    if min(alphas) < 255:
+        options['transparency'] = bytes(alphas)
+    return indexed, options
+
+
+def save_png(image, file_name, effort='default'):
+    """ Save an image as PNG with the most compact color type (see reduce_colors).
+
+    :param image: PIL image in RGB or RGBA mode
+    :param file_name: path of the output file
+    :param effort: 'fast', 'default' or 'max', see PNG_EFFORTS
+    :return:
+    """
+    if effort not in PNG_EFFORTS:
+        raise Exception('Unknown PNG effort: %s' % effort)
+    image, options = reduce_colors(image)
+    level, strategies = PNG_EFFORTS[effort]
+    if len(strategies) == 1:
+        image.save(file_name, format='PNG', compress_level=level, compress_type=strategies[0], **options)
+        return
+
+    smallest = None
+    for strategy in strategies:
+        buffer = io.BytesIO()
+        image.save(buffer, format='PNG', compress_level=level, compress_type=strategy, **options)
+        if smallest is None or buffer.tell() < len(smallest):
+            smallest = buffer.getvalue()
+    with open(file_name, 'wb') as f:
+        f.write(smallest)
+
+
+def tiles_of(bounds, tile_size=TILE_SIZE, margin=0):
+    """ Returns the keys (column, row) of all tiles overlapping a bounding box.
+
+    :param bounds: ((minx, miny), (maxx, maxy))
+    :param tile_size: edge length of the tiles
+    :param margin: extend the bounding box by this distance
+    :return: list of tuples
+    """
+    (x0, y0), (x1, y1) = bounds
+    return [(i, j)
+            for i in range(int((x0 - margin) // tile_size), int((x1 + margin) // tile_size) + 1)
+            for j in range(int((y0 - margin) // tile_size), int((y1 + margin) // tile_size) + 1)]
+
+
+class RasterLayer(object):
+    """
+    Static paths baked into bitmap tiles, which are shown as images below the
+    vector items of a Tk canvas.
+
+    Only the tiles overlapping added or removed paths are re-rendered.
+    """
+
+    def __init__(self, canvas, tile_size=TILE_SIZE, tag='raster', restack=None):
+        """
+
+        :param canvas: the Tk canvas
+        :param tile_size: edge length of the tiles in pixels
+        :param tag: canvas tag of the tiles of this layer; all tiles also get the tag 'raster'
+        :param restack: optional function which restores the stacking order of the tiles
+                        after new tiles have been created; by default they are lowered
+                        below all other items
+        """
+        self.canvas = canvas
+        self.tile_size = tile_size
+        self.tag = tag
+        self.restack = restack
+        self.visible = True
+        # id(path) -> (position, path) of the baked paths
+        self.paths = {}
+        # tile key -> set of ids of the paths overlapping the tile
+        self.index = {}
+        # tile key -> (PhotoImage, canvas item)
+        self.tiles = {}
+
+    def __contains__(self, path):
+        return id(path) in self.paths
+
+    def update(self, paths):
+        """ Make the layer show exactly the given paths (in the given order).
+
+        :param paths: list of finished Path objects
+        :return:
+        """
+        new_paths = {id(path): (k, path) for k, path in enumerate(paths)}
+        dirty = set()
+        for key, (_, path) in self.paths.items():
+            if key not in new_paths:
+                dirty.update(self._unindex(path))
+        for key, (_, path) in new_paths.items():
+            if key not in self.paths:
+                dirty.update(self._index(path))
+
+        # If the paths kept on the layer changed their relative order, the z-order
+        # of the tiles may be wrong everywhere
+        kept = [self.paths[id(path)][0] for path in paths if id(path) in self.paths]
+        if any(a > b for a, b in zip(kept, kept[1:])):
+            dirty.update(self.index)
+
+        self.paths = new_paths
+        self._render(dirty)
+
+    def add(self, paths):
+        """ Add paths on top of the paths shown by the layer, e.g. a stroke which has just
+            been finished. Only the tiles overlapping the new paths are rendered.
+
+        :param paths: list of finished Path objects
+        :return:
+        """
+        top = max((k for k, _ in self.paths.values()), default=-1)
+        dirty = set()
+        for path in paths:
+            if id(path) not in self.paths:
+                top += 1
+                self.paths[id(path)] = top, path
+                dirty.update(self._index(path))
+        self._render(dirty)
+
+    def remove(self, paths):
+        """ Remove paths from the layer, e.g. because they are erased or edited.
+
+        :param paths: iterable of Path objects
+        :return:
+        """
+        dirty = set()
+        for path in paths:
+            if id(path) in self.paths:
+                del self.paths[id(path)]
+                dirty.update(self._unindex(path))
+        self._render(dirty)
+
+    def show(self, visible):
+        """ Show or hide the tiles. The tiles are kept, so showing them again is cheap. """
+        if visible != self.visible:
+            self.visible = visible
+            self.canvas.itemconfigure(self.tag, state=tk.NORMAL if visible else tk.HIDDEN)
+
+    def clear(self):
+        self.canvas.delete(self.tag)
+        self.paths = {}
+        self.index = {}
+        self.tiles = {}
+
+    def _tiles_of(self, path):
+        return tiles_of(path.bounds(), self.tile_size, margin=path.pen.width)
+
+    def _index(self, path):
+        keys = self._tiles_of(path)
+        for key in keys:
+            self.index.setdefault(key, set()).add(id(path))
+        return keys
+
+    def _unindex(self, path):
+        keys = self._tiles_of(path)
+        for key in keys:
+            ids = self.index.get(key)
+            if ids:
+                ids.discard(id(path))
+        return keys
+
+    def _render(self, keys):
+        for key in keys:
+            self._render_tile(key)
+        if keys:
+            if self.restack:
+                self.restack()
+            else:
+                self.canvas.tag_lower(self.tag)
+
+    def _render_tile(self, key):
+        from PIL import Image, ImageTk
+
+        if key in self.tiles:
+            self.canvas.delete(self.tiles.pop(key)[1])
+        ids = self.index.get(key)
+        if not ids:
+            self.index.pop(key, None)
+            return
+        paths = sorted((self.paths[k] for k in ids), key=lambda item: item[0])
+        size = self.tile_size
+        offset = (key[0] * size, key[1] * size)
+        image = Image.new('RGBA', (size, size), (255, 255, 255, 0))
+        draw_paths(image, [path for _, path in paths], offset)
+        photo = ImageTk.PhotoImage(image, master=self.canvas)
+        item = self.canvas.create_image(offset[0], offset[1], anchor=tk.NW, image=photo, tags=('raster', self.tag),
+                                        state=tk.NORMAL if self.visible else tk.HIDDEN)
+        self.tiles[key] = photo, item
@@ -0,0 +1,265 @@
+import gzip
+import sys
+import time
+
+from ipysketch.canvas import ObjectVar
+from ipysketch.controller import CanvasController
+from ipysketch.events import EventBus, CONTENT_EVENTS
+from ipysketch.constants import *
+from ipysketch.model import Pen, SketchModel, History
+from ipysketch.render import NullRenderer
+
+SESSION_HEADER = 'ipysketch-session 1'
+
+# Codes for the records in a session file
+MOUSE_CODES = {'down': 'd', 'move': 'm', 'up': 'u'}
+MOUSE_KINDS = {code: kind for kind, code in MOUSE_CODES.items()}
+
+
+class InputRecorder(object):
+    """
+    Records an input session: mode changes, eraser mode and pen changes, mouse events and undo/redo
+    commands, each with a timestamp relative to the start of the recording.
+
+    Mode and pen changes are recorded lazily, i.e. right before the next mouse
+    event that uses them.
+    """
+
+    def __init__(self):
+        self.records = []
+        self._start = None
+        self._action = None
+        self._erase_mode = ERASE_PATHS
+        self._pen = None
+
+    def _timestamp(self):
+        now = time.perf_counter()
+        if self._start is None:
+            self._start = now
+        return int(round((now - self._start) * 1000))
+
+    def record_mouse(self, kind, event, action, pen, erase_mode=ERASE_PATHS):
+        """ Record a mouse event on the canvas.
+
+        :param kind: 'down', 'move' or 'up'
+        :param event: the Tk event (only x and y are used)
+        :param action: the active mode (one of the ACTION_* constants)
+        :param pen: the currently selected Pen
+        :param erase_mode: ERASE_PATHS or ERASE_SEGMENTS
+        """
+        t = self._timestamp()
+        if action != self._action:
+            self._action = action
+            self.records.append((t, 'a', action))
+        if erase_mode != self._erase_mode:
+            self._erase_mode = erase_mode
+            self.records.append((t, 'e', erase_mode))
+        if (pen.color, pen.width) != self._pen:
+            self._pen = (pen.color, pen.width)
+            self.records.append((t, 'p', pen.color, pen.width))
+        self.records.append((t, MOUSE_CODES[kind], int(event.x), int(event.y)))
+
+    def record_command(self, command):
+        """ Record an undo or redo command.
+
+        :param command: 'undo' or 'redo'
+        """
+        self.records.append((self._timestamp(), 'z' if command == 'undo' else 'y'))
+
+    def save(self, file_name):
+        save_session(self.records, file_name)
+
+
+def save_session(records, file_name):
+    """ Write session records to a gzip-compressed text file with one record per line.
+        Timestamps are stored as deltas in milliseconds.
+
+    :param records: list of tuples (time, code, *args)
+    :param file_name: path of the output file
+    """
+    with gzip.open(file_name, 'wt', encoding='utf-8') as f:
+        f.write(SESSION_HEADER + '\n')
+        last = 0
+        for record in records:
+            t, code, args = record[0], record[1], record[2:]
+            f.write(' '.join([str(t - last), code] + [str(arg) for arg in args]) + '\n')
+            last = t
+
+
+def load_session(file_name):
+    """ Read session records written by save_session.
+
+    :param file_name: path of the session file
+    :return: list of tuples (time, code, *args)
+    """
+    records = []
+    with gzip.open(file_name, 'rt', encoding='utf-8') as f:
+        if f.readline().strip() != SESSION_HEADER:
+            raise Exception('Not an ipysketch session file: %s' % file_name)
+        t = 0
+        for line in f:
+            fields = line.split()
+            if not fields:
+                continue
+            t += int(fields[0])
+            code, args = fields[1], fields[2:]
+            if code in MOUSE_KINDS:
+                args = [int(args[0]), int(args[1])]
+            elif code == 'p':
+                args = [args[0], _number(args[1])]
+            records.append(tuple([t, code] + args))
+    return records
+
+
+class ReplayEvent(object):
+    """ Minimal replacement for a Tk event as used by the CanvasController. """
+
+    def __init__(self, x, y):
+        self.x = x
+        self.y = y
+
+
+def draw_stroke(app, points):
+    """ Drive the CanvasController of an application with a press, moves and a release,
+        e.g. for drawing, erasing or lassoing in tests and benchmarks.
+
+    :param app: the Application or HeadlessApplication
+    :param points: sequence of (x, y) window coordinates; the first one is the press,
+                   the last one the release position
+    """
+    controller = app.canvas_controller
+    controller.on_button_down(ReplayEvent(*points[0]))
+    for point in points[1:-1]:
+        controller.on_move(ReplayEvent(*point))
+    controller.on_button_up(ReplayEvent(*points[-1]))
+
+
+def replay(records, app, realtime=False):
+    """ Replay a recorded session against an Application or HeadlessApplication.
+
+    :param records: list of session records (see load_session)
+    :param app: the target application
+    :param realtime: if True, keep the recorded timing, otherwise replay as fast as possible
+    :return: the number of replayed mouse events
+    """
+    controller = app.canvas_controller
+    handlers = {
+        'd': controller.on_button_down,
+        'm': controller.on_move,
+        'u': controller.on_button_up,
+    }
+    start = time.perf_counter()
+    num_events = 0
+    for record in records:
+        t, code = record[0], record[1]
+        if realtime:
+            _wait_until(app, start + t / 1000.)
+        if code in handlers:
+            handlers[code](ReplayEvent(record[2], record[3]))
+            num_events += 1
+        elif code == 'a':
+            app.action = record[2]
+        elif code == 'e':
+            app.erase_mode = record[2]
+        elif code == 'p':
+            app.pen = Pen(color=record[2], width=record[3])
+        elif code == 'z':
+            app.undo(None)
+        elif code == 'y':
+            app.redo(None)
+        else:
+            raise Exception('Unknown session record: %s' % (record,))
+    return num_events
+
+
+def _wait_until(app, deadline):
+    while True:
+        remaining = deadline - time.perf_counter()
+        if remaining <= 0:
+            return
+        app.update()
+        time.sleep(min(remaining, 0.005))
+
+
+class HeadlessApplication(object):
+    """
+    Replacement for the Application that drives the model and the CanvasController
+    without creating any Tk widgets. Used for replaying and benchmarking sessions.
+    """
+
+    def __init__(self, model=None, renderer=None):
+        """
+
+        :param model: the initial model; empty by default
+        :param renderer: the render backend; by default a NullRenderer
+        """
+        self.events = EventBus()
+        self.history = History(model or SketchModel(), bus=self.events)
+        self.action = ACTION_DRAW
+        self.erase_mode = ERASE_PATHS
+        self.pen = Pen()
+        self.recorder = None
+        self.dirty = ObjectVar()
+        self.dirty.set(False)
+        self.events.subscribe(lambda events: self.dirty.set(True), kinds=CONTENT_EVENTS)
+        self.canvas_controller = CanvasController(self, None, renderer=renderer or NullRenderer())
+
+    @property
+    def model(self):
+        return self.history.current()
+
+    def update(self):
+        pass
+
+    def undo(self, event):
+        self.history.back()
+
+    def redo(self, event):
+        self.history.forward()
+
+    def trigger_dirty(self):
+        self.history.new()
+
+    def change_layers(self, change):
+        """ See Application.change_layers. """
+        self.trigger_dirty()
+        return change(self.model)
+
+    def close(self):
+        """ Release the spill file of the history. """
+        self.history.close()
+
+
+def benchmark(file_name, repeat=3):
+    """ Replay a session headless several times and report the throughput.
+
+    :param file_name: path of the session file
+    :param repeat: number of replays
+    :return: best throughput in mouse events per second
+    """
+    records = load_session(file_name)
+    best = None
+    for _ in range(repeat):
+        app = HeadlessApplication()
+        start = time.perf_counter()
+        num_events = replay(records, app)
+        elapsed = time.perf_counter() - start
+        app.close()
+        if best is None or elapsed < best[1]:
+            best = num_events, elapsed
+    num_events, elapsed = best
+    return num_events / elapsed if elapsed > 0 else float('inf')
+
+
+def _number(value):
+    try:
+        return int(value)
+    except ValueError:
+        return float(value)
+
+
+if __name__ == '__main__':
+    if len(sys.argv) != 2:
+        print('Usage: python -m ipysketch.recording <session file>')
+        sys.exit(1)
+    print('%.0f events/s' % benchmark(sys.argv[1]))
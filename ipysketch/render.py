@@ -0,0 +1,199 @@
+from collections import Counter, OrderedDict
+
+from ipysketch.background import draw_background
+from ipysketch.model import Pen, Point
+from ipysketch.profiling import profiled_canvas
+from ipysketch.raster import draw_paths
+
+# Pen used for highlighting selected paths (added to the width of the path's pen)
+SELECTION_COLOR = '#00FFFF'
+SELECTION_EXTRA_WIDTH = 4
+
+
+class Renderer(object):
+    """
+    Interface of the render backends used by the CanvasController.
+
+    The Tk implementation is SketchCanvas. For running the interaction pipeline
+    without a display, there are the off-screen PillowRenderer and the NullRenderer,
+    which only counts the operations. The off-screen backends emulate a viewport
+    whose origin is moved by shift().
+    """
+
+    def __init__(self):
+        self.profiler = None
+        self._origin = Point(0, 0)
+
+    def bind(self, sequence, func):
+        """Register an input event handler. Off-screen renderers have no input."""
+        pass
+
+    def show_overlay(self, text):
+        pass
+
+    def draw(self, model, selection=None, transform=None):
+        """ Redraw the complete model.
+
+        :param model: the model instance
+        :param selection: the list of paths that shall be drawn as selected
+        :param transform: the transformation to apply to the selection
+        :return:
+        """
+        raise NotImplementedError
+
+    def update_paths(self, *paths, transform=None, selected=False):
+        """ Update one or more paths.
+
+        :param paths: List or variable arg list of Path objects
+        :param transform: transformation to apply to paths
+        :param selected: paint as selected paths or not
+        :return:
+        """
+        raise NotImplementedError
+
+    def delete_paths(self, *paths):
+        """ Delete one or more paths.
+
+        :param paths: list or variable arg list of Path objects to remove
+        :return:
+        """
+        raise NotImplementedError
+
+    def bake_paths(self, model, paths):
+        """ Show finished paths which are no longer edited. Backends which cache the
+            static paths of a layer add them to the cache; the others draw them like
+            update_paths.
+
+        :param model: the SketchModel of the paths
+        :param paths: list of finished, unselected Path objects on visible layers
+        :return:
+        """
+        self.update_paths(paths)
+
+    def shift(self, translation):
+        """ Shift the visible part of the canvas
+
+        :param translation: direction and size of the shift; Translation object
+        :return:
+        """
+        self._origin = self._origin - (translation.destination - translation.origin)
+        translation.origin = translation.destination
+        translation.destination = None
+
+    def origin(self):
+        """ Returns the origin of the window in canvas coordinates """
+        return Point(self._origin.x, self._origin.y)
+
+
+class PillowRenderer(Renderer):
+    """
+    Off-screen renderer that keeps the drawn paths like the items of a Tk canvas
+    and renders them with Pillow on demand.
+    """
+
+    def __init__(self, width=800, height=600, background='white'):
+        super().__init__()
+        self.width = width
+        self.height = height
+        self.background = background
+        # uuid -> (path, selected); the order is the drawing order
+        self.items = OrderedDict()
+        # The Background of the model or None
+        self.image_background = None
+
+    @profiled_canvas
+    def draw(self, model, selection=None, transform=None):
+        selection = selection or []
+        selected = set(id(path) for path in selection)
+        self.image_background = model.background
+        self.items = OrderedDict()
+        for path in model.visible_paths():
+            if id(path) in selected:
+                self.items[path.uuid] = (apply_transform(path, transform), True)
+            else:
+                self.items[path.uuid] = (path, False)
+        if model.lasso:
+            self.items[model.lasso.uuid] = (model.lasso, False)
+
+    @profiled_canvas
+    def update_paths(self, *paths, transform=None, selected=False):
+        if isinstance(paths[0], list):
+            paths = paths[0]
+        for path in paths:
+            self.items[path.uuid] = (apply_transform(path, transform), selected)
+
+    @profiled_canvas
+    def delete_paths(self, *paths):
+        if isinstance(paths[0], list):
+            paths = paths[0]
+        for path in paths:
+            self.items.pop(path.uuid, None)
+
+    def image(self):
+        """ Render the visible part of the sketch.
+
+        :return: PIL Image
+        """
+        origin = self.origin()
+        return self._render((origin.x, origin.y), (self.width, self.height))
+
+    def _render(self, offset, size):
+        from PIL import Image
+
+        image = Image.new('RGB', size, self.background)
+        if self.image_background is not None:
+            draw_background(image, self.image_background, offset)
+        for path, selected in self.items.values():
+            if selected:
+                highlight = Pen(width=path.pen.width + SELECTION_EXTRA_WIDTH, color=SELECTION_COLOR)
+                draw_paths(image, [_Restyled(path, highlight)], offset)
+            draw_paths(image, [path], offset)
+        return image
+
+
+class NullRenderer(Renderer):
+    """
+    Renderer that does not render anything, but counts the operations and the
+    number of paths passed to them. Used for benchmarking the model and controller.
+    """
+
+    def __init__(self):
+        super().__init__()
+        self.counts = Counter()
+
+    def draw(self, model, selection=None, transform=None):
+        self.counts['draw'] += 1
+        self.counts['paths'] += len(model.paths)
+
+    def update_paths(self, *paths, transform=None, selected=False):
+        if isinstance(paths[0], list):
+            paths = paths[0]
+        self.counts['update_paths'] += 1
+        self.counts['paths'] += len(paths)
+
+    def delete_paths(self, *paths):
+        if isinstance(paths[0], list):
+            paths = paths[0]
+        self.counts['delete_paths'] += 1
+        self.counts['paths'] += len(paths)
+
+
+def apply_transform(path, transform):
+    """ Apply a transformation to the given path.
+
+    :param path: Path object
+    :param transform: Transformation object or None
+    :return: Path
+    """
+    if transform:
+        return path.translated(transform.destination - transform.origin)
+    return path
+
+
+class _Restyled(object):
+    """ A path drawn with a different pen. """
+
+    def __init__(self, path, pen):
+        self.coords = path.coords
+        self.pen = pen
+        self.tessellation = path.tessellation
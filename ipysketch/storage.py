@@ -0,0 +1,314 @@
+import json
+import math
+import pickle
+import struct
+import zlib
+
+import numpy as np
+
+from ipysketch.model import SketchModel, StyleTable, Background, Layer, Path, Pen
+
+# First bytes of a chunked sketch file. Pickled sketches written by older versions
+# start with the pickle protocol byte instead.
+MAGIC = b'ISKC\x01\n'
+
+# Edge length of the square chunks the sketch is divided into
+CHUNK_SIZE = 512
+
+
+def is_chunked(file_name):
+    with open(file_name, 'rb') as f:
+        return f.read(len(MAGIC)) == MAGIC
+
+
+def save_chunked(model, file_name, chunk_size=CHUNK_SIZE):
+    """ Save a sketch model in the chunked file format.
+
+    The file starts with a small JSON header containing, for each page, the pens, the
+    layers and, for each chunk, its bounding box and position in the file. It is followed by the
+    compressed chunks. Each path is stored in the chunk containing the center of its
+    bounding box, together with its position in the drawing order.
+
+    :param model: the SketchModel
+    :param file_name: path of the file
+    :param chunk_size: edge length of the chunks
+    """
+    save_pages([model], file_name, chunk_size)
+
+
+class PageRef(object):
+    """
+    Reference to a page of a chunked sketch file. When saving, its chunks are
+    copied from the file without decoding them.
+    """
+
+    def __init__(self, file_name, page):
+        self.file_name = file_name
+        self.page = page
+
+
+def save_pages(pages, file_name, chunk_size=CHUNK_SIZE):
+    """ Save the pages of a sketch in the chunked file format.
+
+    :param pages: list of SketchModel or PageRef objects
+    :param file_name: path of the file
+    :param chunk_size: edge length of the chunks of the SketchModels
+    """
+    headers, bodies, offset = [], [], 0
+    for page in pages:
+        if isinstance(page, PageRef):
+            header, page_bodies = _copy_page(page)
+        else:
+            header, page_bodies = _encode_page(page, chunk_size)
+        for chunk in header['chunks']:
+            chunk['offset'] = offset
+            offset += chunk['length']
+        headers.append(header)
+        bodies.extend(page_bodies)
+
+    header = json.dumps({'pages': headers}).encode('utf-8')
+
+    with open(file_name, 'wb') as f:
+        f.write(MAGIC)
+        f.write(struct.pack('<I', len(header)))
+        f.write(header)
+        for body in bodies:
+            if isinstance(body, bytes):
+                f.write(body)
+            else:
+                source, start, length = body
+                with open(source, 'rb') as src:
+                    src.seek(start)
+                    f.write(src.read(length))
+
+
+def _encode_page(model, chunk_size):
+    styles = StyleTable(model.styles.pens)
+    layers = {layer.uuid: k for k, layer in enumerate(model.layers)}
+    cells = {}
+    for order, path in enumerate(model.paths):
+        (x0, y0), (x1, y1) = path.bounds()
+        key = (int(math.floor((x0 + x1) / 2 / chunk_size)), int(math.floor((y0 + y1) / 2 / chunk_size)))
+        cells.setdefault(key, []).append((order, path))
+
+    chunks, bodies = [], []
+    for key in sorted(cells):
+        items = cells[key]
+        margin = max(path.pen.width for _, path in items)
+        bounds = np.array([sum(path.bounds(), ()) for _, path in items])
+        body = zlib.compress(pickle.dumps((
+            [order for order, _ in items],
+            [path.uuid for _, path in items],
+            [styles.add(path.pen) for _, path in items],
+            np.cumsum([0] + [len(path) for _, path in items]),
+            np.concatenate([path.coords for _, path in items]),
+            [layers.get(path.layer, 0) for _, path in items],
+        ), pickle.HIGHEST_PROTOCOL))
+        chunks.append({
+            'key': list(key),
+            'bounds': (bounds[:, :2].min(axis=0) - margin).tolist() + (bounds[:, 2:].max(axis=0) + margin).tolist(),
+            'paths': len(items),
+            'length': len(body),
+        })
+        bodies.append(body)
+
+    header = {
+        'chunk_size': chunk_size,
+        'styles': [pen.key() for pen in styles.pens],
+        'num_paths': len(model.paths),
+        'selection': [path.uuid for path in model.selection],
+        'layers': [[layer.name, layer.visible, layer.locked, layer.uuid] for layer in model.layers],
+        'active_layer': model.active_layer,
+        'background': list(model.background.key()) if model.background is not None else None,
+        'chunks': chunks,
+    }
+    return header, bodies
+
+
+def _copy_page(ref):
+    sketch = ChunkedSketch(ref.file_name, ref.page)
+    header = json.loads(json.dumps(sketch.header))
+    bodies = [(ref.file_name, sketch.data_offset + chunk['offset'], chunk['length']) for chunk in sketch.chunks]
+    return header, bodies
+
+
+def count_pages(file_name):
+    """ Returns the number of pages of a sketch file. """
+    if is_chunked(file_name):
+        return ChunkedSketch(file_name).num_pages
+    return 1
+
+
+class ChunkedSketch(object):
+    """
+    Read access to a page of a sketch in the chunked file format. Only the header is
+    read on opening, the chunks are read when requested.
+    """
+
+    def __init__(self, file_name, page=0):
+        """
+
+        :param file_name: path of the sketch file
+        :param page: the index of the page
+        """
+        self.file_name = file_name
+        with open(file_name, 'rb') as f:
+            if f.read(len(MAGIC)) != MAGIC:
+                raise Exception('Not a chunked sketch file: %s' % file_name)
+            length, = struct.unpack('<I', f.read(4))
+            pages = json.loads(f.read(length).decode('utf-8'))['pages']
+            self.data_offset = f.tell()
+        if not 0 <= page < len(pages):
+            raise Exception('No page %d in %s' % (page + 1, file_name))
+        self.num_pages = len(pages)
+        self.header = header = pages[page]
+        self.chunk_size = header['chunk_size']
+        self.styles = StyleTable(Pen(width, color, dash) for width, color, dash in header['styles'])
+        self.num_paths = header['num_paths']
+        self.selection = header['selection']
+        # Files written before the introduction of layers have a single layer
+        self.layers = [Layer(*item) for item in header.get('layers', ())]
+        self.active_layer = header.get('active_layer')
+        background = header.get('background')
+        self.background = Background(*background) if background else None
+        self.chunks = header['chunks']
+
+    def chunks_in(self, bounds):
+        """ Returns the chunks which contain paths overlapping a region.
+
+        :param bounds: the region as ((minx, miny), (maxx, maxy))
+        :return: list of chunks (dicts from the header)
+        """
+        (x0, y0), (x1, y1) = bounds
+        return [chunk for chunk in self.chunks
+                if chunk['bounds'][2] >= x0 and chunk['bounds'][0] <= x1 and
+                chunk['bounds'][3] >= y0 and chunk['bounds'][1] <= y1]
+
+    def read_chunks(self, chunks):
+        """ Read the paths of chunks.
+
+        :param chunks: list of chunks (dicts from the header)
+        :return: list of tuples (position in the drawing order, Path)
+        """
+        items = []
+        with open(self.file_name, 'rb') as f:
+            for chunk in chunks:
+                f.seek(self.data_offset + chunk['offset'])
+                data = pickle.loads(zlib.decompress(f.read(chunk['length'])))
+                orders, uuids, pens, offsets, coords = data[:5]
+                layers = [self.layers[k].uuid for k in data[5]] if len(data) > 5 else [None] * len(orders)
+                coords.setflags(write=False)
+                for k, order in enumerate(orders):
+                    path = Path(self.styles[pens[k]], coords[offsets[k]:offsets[k + 1]], uuids[k], layers[k])
+                    items.append((order, path))
+        return items
+
+    def empty_model(self):
+        """ Returns a model with the pens and layers of the page, but without paths. """
+        model = SketchModel()
+        model.styles = StyleTable(self.styles.pens)
+        if self.layers:
+            model.layers = [layer.clone() for layer in self.layers]
+            model.active_layer = self.active_layer
+        model.background = self.background
+        return model
+
+    def load(self, bounds=None):
+        """ Read a model with the paths of all chunks or only of those overlapping a region.
+
+        :param bounds: the region as ((minx, miny), (maxx, maxy)); None for the whole sketch
+        :return: SketchModel
+        """
+        chunks = self.chunks if bounds is None else self.chunks_in(bounds)
+        items = sorted(self.read_chunks(chunks), key=lambda item: item[0])
+        model = self.empty_model()
+        model.paths = [path for _, path in items]
+        if bounds is None:
+            selection = set(self.selection)
+            model.selection = [path for path in model.paths if path.uuid in selection]
+        return model
+
+
+def load_region(file_name, bounds, page=0):
+    """ Load only the paths of a sketch file needed for rendering a region, e.g. with
+        the PillowRenderer or the TileRenderer. Pickled sketch files are read completely.
+
+    :param file_name: path of the .isk file
+    :param bounds: the region as ((minx, miny), (maxx, maxy))
+    :param page: the index of the page
+    :return: SketchModel
+    """
+    if is_chunked(file_name):
+        return ChunkedSketch(file_name, page).load(bounds)
+    with open(file_name, 'rb') as f:
+        return pickle.load(f)
+
+
+class ProgressiveLoader(object):
+    """
+    Loads the chunks of a sketch file one by one into the models of a History,
+    starting with those closest to a viewport. The paths are merged into the models
+    in their original drawing order; paths drawn in the meantime stay on top.
+    """
+
+    def __init__(self, sketch, history, viewport, on_load=None):
+        """
+
+        :param sketch: the ChunkedSketch
+        :param history: the History whose models receive the paths
+        :param viewport: the region to load first as ((minx, miny), (maxx, maxy));
+                         its chunks are loaded immediately
+        :param on_load: optional function called with the list of paths of each loaded chunk
+        """
+        self.sketch = sketch
+        self.history = history
+        self.on_load = on_load
+        # uuid -> position in the drawing order of the paths read so far
+        self.orders = {}
+
+        (x0, y0), (x1, y1) = viewport
+        cx, cy = (x0 + x1) / 2, (y0 + y1) / 2
+        visible = sketch.chunks_in(viewport)
+        ids = set(id(chunk) for chunk in visible)
+        self.pending = sorted((chunk for chunk in sketch.chunks if id(chunk) not in ids),
+                              key=lambda chunk: -_distance(chunk['bounds'], cx, cy))
+        self._merge(visible)
+
+    @property
+    def done(self):
+        return not self.pending
+
+    def _order(self, path):
+        return self.orders.get(path.uuid, self.sketch.num_paths)
+
+    def step(self):
+        """ Load the next chunk.
+
+        :return: True if there are more chunks to load
+        """
+        if self.pending:
+            self._merge([self.pending.pop()])
+        return bool(self.pending)
+
+    def finish(self):
+        """ Load all remaining chunks. """
+        chunks, self.pending = self.pending, []
+        self._merge(chunks[::-1])
+
+    def _merge(self, chunks):
+        if not chunks:
+            return
+        items = self.sketch.read_chunks(chunks)
+        for order, path in items:
+            self.orders[path.uuid] = order
+        paths = [path for _, path in items]
+        current = self.history.current()
+        self.history.update_all(lambda model: model.merge_paths(paths, self._order, notify=model is current))
+        if self.on_load:
+            self.on_load(paths)
+
+
+def _distance(bounds, x, y):
+    dx = max(bounds[0] - x, 0, x - bounds[2])
+    dy = max(bounds[1] - y, 0, y - bounds[3])
+    return math.hypot(dx, dy)
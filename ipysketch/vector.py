@@ -0,0 +1,279 @@
+import os
+import sys
+import zlib
+from xml.sax.saxutils import quoteattr
+
+import numpy as np
+
+from ipysketch.model import StyleTable, load_model
+
+SVG_HEADER = '''<?xml version="1.0" encoding="UTF-8"?>
+<svg xmlns="http://www.w3.org/2000/svg" width="%s" height="%s" viewBox="%s %s %s %s">
+<style>
+path{fill:none;stroke-linecap:round;stroke-linejoin:round}
+%s
+</style>
+<rect x="%s" y="%s" width="%s" height="%s" fill="%s"/>
+'''
+
+
+def simplify_coords(coords, tolerance):
+    """ Simplify a polyline with the Ramer-Douglas-Peucker algorithm.
+
+    :param coords: (N, 2) array of coordinates
+    :param tolerance: maximum distance of the removed points from the simplified line
+    :return: (M, 2) array with a subset of the coordinates, including the end points
+    """
+    if tolerance <= 0 or len(coords) < 3:
+        return coords
+
+    keep = np.zeros(len(coords), dtype=bool)
+    keep[0] = keep[-1] = True
+    stack = [(0, len(coords) - 1)]
+    while stack:
+        first, last = stack.pop()
+        if last - first < 2:
+            continue
+        start, end = coords[first], coords[last]
+        inner = coords[first + 1:last]
+        direction = end - start
+        length = np.hypot(*direction)
+        if length == 0:
+            distances = np.hypot(*(inner - start).T)
+        else:
+            distances = np.abs(direction[0] * (inner[:, 1] - start[1]) -
+                               direction[1] * (inner[:, 0] - start[0])) / length
+        k = int(np.argmax(distances))
+        if distances[k] > tolerance:
+            k += first + 1
+            keep[k] = True
+            stack.append((first, k))
+            stack.append((k, last))
+    return coords[keep]
+
+
+def quantize(coords, precision):
+    """ Round coordinates to the given number of decimal places and return them as
+        integer multiples of the resulting grid spacing.
+    """
+    return np.round(coords * 10 ** precision).astype(np.int64)
+
+
+def format_number(value, precision):
+    """ Format an integer multiple of 10**-precision as short decimal string. """
+    if precision <= 0:
+        return str(value)
+    text = '%.*f' % (precision, value / 10 ** precision)
+    text = text.rstrip('0').rstrip('.')
+    if text.startswith('0.'):
+        text = text[1:]
+    elif text.startswith('-0.'):
+        text = '-' + text[2:]
+    return text if text not in ('', '-') else '0'
+
+
+def svg_path_data(coords, precision=1):
+    """ Returns the SVG path data for a polyline: an absolute moveto followed by
+        relative linetos, with the numbers in their shortest form.
+
+    :param coords: (N, 2) array of coordinates
+    :param precision: number of decimal places of the coordinates
+    :return: str
+    """
+    q = quantize(coords, precision)
+    # Differences of the rounded coordinates, so that rounding errors do not add up
+    steps = np.diff(q, axis=0)
+    numbers = [format_number(v, precision) for v in steps.ravel().tolist()] or ['0', '0']
+    parts = ['M', format_number(int(q[0, 0]), precision)]
+    _append_number(parts, format_number(int(q[0, 1]), precision))
+    parts.append('l')
+    parts.append(numbers[0])
+    for number in numbers[1:]:
+        _append_number(parts, number)
+    return ''.join(parts)
+
+
+def _append_number(parts, number):
+    # A separator is only needed if the number does not start with a sign or a dot
+    # following a number that already contains a dot
+    if not (number[0] == '-' or (number[0] == '.' and '.' in parts[-1])):
+        parts.append(' ')
+    parts.append(number)
+
+
+def _styles_of(paths):
+    return StyleTable(path.pen for path in paths)
+
+
+def _extent(model, margin):
+    bbox = model.image_bbox()
+    x0, y0 = bbox.ul.x - margin, bbox.ul.y - margin
+    return x0, y0, bbox.lr.x - bbox.ul.x + 2 * margin, bbox.lr.y - bbox.ul.y + 2 * margin
+
+
+def export_svg(model, file_name, margin=20, precision=1, tolerance=0., background='white'):
+    """ Write the visible layers of a sketch as SVG file.
+
+    The paths are streamed to the file one by one. The pens are written once
+    as CSS classes, the coordinates as relative path data rounded to the given precision.
+    A background image is linked by its path relative to the SVG file, not embedded.
+
+    :param model: the SketchModel to export
+    :param file_name: path of the output file
+    :param margin: margin around the sketch
+    :param precision: number of decimal places of the coordinates
+    :param tolerance: if positive, drop points which deviate less than this from the simplified path
+    :param background: background color or None for a transparent background
+    :return:
+    """
+    if model.image_bbox() is None:
+        raise Exception('Cannot export an empty sketch')
+
+    paths = model.visible_paths()
+    styles = _styles_of(paths)
+    x0, y0, w, h = [format_number(int(v), precision)
+                    for v in quantize(np.array(_extent(model, margin)), precision)]
+    css = '\n'.join('.p%d{%s}' % (k, _svg_style(pen)) for k, pen in enumerate(styles.pens))
+
+    with open(file_name, 'w', encoding='utf-8') as f:
+        f.write(SVG_HEADER % (w, h, x0, y0, w, h, css, x0, y0, w, h, background or 'none'))
+        if model.background is not None:
+            f.write(_svg_image(model.background, os.path.dirname(os.path.abspath(file_name)), precision))
+        for path in paths:
+            f.write('<path class="p%d" d="%s"/>\n' % (
+                styles.index(path.pen), svg_path_data(simplify_coords(path.coords, tolerance), precision)))
+        f.write('</svg>\n')
+
+
+def _svg_image(background, directory, precision):
+    href = os.path.relpath(os.path.abspath(background.source), directory).replace(os.sep, '/')
+    x, y = [format_number(int(v), precision) for v in quantize(np.array(background.origin), precision)]
+    w, h = background.size
+    return '<image href=%s x="%s" y="%s" width="%d" height="%d"/>\n' % (quoteattr(href), x, y, w, h)
+
+
+def _svg_style(pen):
+    style = 'stroke:%s;stroke-width:%s' % (pen.color, pen.width)
+    if pen.dash:
+        style += ';stroke-dasharray:%s' % ','.join(str(d) for d in pen.dash)
+    return style
+
+
+def export_pdf(model, file_name, margin=20, precision=1, tolerance=0., background='white'):
+    """ Write the visible layers of a sketch as single page PDF file.
+
+    The paths are streamed into a compressed content stream one by one; the
+    pen is only set when it changes between paths. One sketch unit is one point.
+    A background image is not included, but the page covers its extent.
+
+    :param model: the SketchModel to export
+    :param file_name: path of the output file
+    :param margin: margin around the sketch
+    :param precision: number of decimal places of the coordinates
+    :param tolerance: if positive, drop points which deviate less than this from the simplified path
+    :param background: background color or None for no background
+    :return:
+    """
+    if model.image_bbox() is None:
+        raise Exception('Cannot export an empty sketch')
+
+    paths = model.visible_paths()
+    x0, y0, w, h = _extent(model, margin)
+    with open(file_name, 'wb') as f:
+        writer = _PDFWriter(f)
+        writer.object('<< /Type /Catalog /Pages 2 0 R >>')
+        writer.object('<< /Type /Pages /Kids [3 0 R] /Count 1 >>')
+        writer.object('<< /Type /Page /Parent 2 0 R /MediaBox [0 0 %.2f %.2f] /Contents 4 0 R >>' % (w, h))
+
+        writer.begin_stream()
+        # Flip the y-axis and move the upper left corner of the sketch to the top of the page
+        writer.write('1 0 0 -1 %s %s cm 1 J 1 j\n' % (_pdf_number(-x0), _pdf_number(y0 + h)))
+        if background:
+            writer.write('%s rg %s %s %s %s re f\n' % (_pdf_color(background), _pdf_number(x0), _pdf_number(y0),
+                                                      _pdf_number(w), _pdf_number(h)))
+        pen = None
+        for path in paths:
+            if path.pen != pen:
+                pen = path.pen
+                writer.write('%s RG %s w [%s] 0 d\n' % (_pdf_color(pen.color), pen.width,
+                                                      ' '.join(str(d) for d in pen.dash or ())))
+            writer.write(_pdf_path(simplify_coords(path.coords, tolerance), precision))
+        writer.end_stream()
+        writer.finish(root=1)
+
+
+def _pdf_number(value):
+    return ('%.2f' % value).rstrip('0').rstrip('.')
+
+
+def _pdf_color(color):
+    from PIL import ImageColor
+
+    return ' '.join('%.3g' % (c / 255.) for c in ImageColor.getrgb(color)[:3])
+
+
+def _pdf_path(coords, precision):
+    q = quantize(coords, precision)
+    numbers = [format_number(v, precision) for v in q.ravel().tolist()]
+    if len(numbers) == 2:
+        numbers += numbers
+    ops = ['%s %s m' % (numbers[0], numbers[1])]
+    ops.extend('%s %s l' % (numbers[k], numbers[k + 1]) for k in range(2, len(numbers), 2))
+    return ' '.join(ops) + ' S\n'
+
+
+class _PDFWriter(object):
+    """
+    Minimal PDF writer, which writes objects in sequence and keeps only their offsets.
+    The single content stream is compressed while it is written.
+    """
+
+    def __init__(self, f):
+        self.f = f
+        self.offsets = []
+        self._compressor = None
+        self._length = 0
+        self.f.write(b'%PDF-1.4\n')
+
+    def object(self, body):
+        self.offsets.append(self.f.tell())
+        self.f.write(('%d 0 obj\n%s\nendobj\n' % (len(self.offsets), body)).encode('latin-1'))
+
+    def begin_stream(self):
+        self.offsets.append(self.f.tell())
+        # The length is written as separate object after the stream
+        self.f.write(('%d 0 obj\n<< /Length %d 0 R /Filter /FlateDecode >>\nstream\n' %
+                      (len(self.offsets), len(self.offsets) + 1)).encode('latin-1'))
+        self._compressor = zlib.compressobj()
+        self._length = 0
+
+    def write(self, text):
+        data = self._compressor.compress(text.encode('latin-1'))
+        self._length += len(data)
+        self.f.write(data)
+
+    def end_stream(self):
+        data = self._compressor.flush()
+        self._length += len(data)
+        self.f.write(data)
+        self.f.write(b'\nendstream\nendobj\n')
+        self.object(str(self._length))
+
+    def finish(self, root):
+        xref = self.f.tell()
+        lines = ['xref', '0 %d' % (len(self.offsets) + 1), '0000000000 65535 f ']
+        lines.extend('%010d 00000 n ' % offset for offset in self.offsets)
+        lines.append('trailer\n<< /Size %d /Root %d 0 R >>' % (len(self.offsets) + 1, root))
+        lines.append('startxref\n%d\n%%%%EOF\n' % xref)
+        self.f.write('\n'.join(lines).encode('latin-1'))
+
+
+if __name__ == '__main__':
+    if len(sys.argv) != 2:
+        print('Usage: python -m ipysketch.vector <sketch name>')
+        sys.exit(1)
+    sketch_name = sys.argv[1]
+    sketch = load_model(sketch_name + '.isk')
+    export_svg(sketch, sketch_name + '.svg')
+    export_pdf(sketch, sketch_name + '.pdf')
+    print('Wrote %s.svg and %s.pdf' % (sketch_name, sketch_name))
@@ -37,7 +37,8 @@ setup(
                       'Shapely',
                       'numpy'
                       ],
-    python_requires=">=3.6",
+    extras_require={'arrow': ['pyarrow']},
+    python_requires=">=3.7",
     classifiers=['Operating System :: OS Independent',
                  'Programming Language :: Python :: 3',
                  ],
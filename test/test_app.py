@@ -80,6 +80,16 @@ class TestApplication(unittest.TestCase):
 
         self.assertEqual(0, len(app.model.paths))
 
+    def test_finished_path_is_rasterized(self):
+        canvas = self.app.canvas_controller.canvas
+
+        self.draw_round_triangle(canvas)
+        self.app.update()
+
+        path = self.app.model.paths[0]
+        self.assertIn(path, canvas.rasters[self.app.model.layer_of(path).uuid])
+        self.assertEqual((), canvas.find_withtag(path.uuid))
+
     def test_select_path(self):
         app = self.app
         canvas = app.canvas_controller.canvas
@@ -0,0 +1,136 @@
+import os
+import pickle
+import shutil
+import tempfile
+import unittest
+import xml.etree.ElementTree as ET
+from unittest.mock import patch
+
+from PIL import Image
+
+from ipysketch.background import BackgroundLayer, TilePyramid, draw_background, load_background
+from ipysketch.export import export_png
+from ipysketch.model import SketchModel, load_model, save_model
+from ipysketch.vector import export_svg
+
+
+class TestBackground(unittest.TestCase):
+
+    def setUp(self) -> None:
+        self.dir = tempfile.mkdtemp()
+        self.image_name = os.path.join(self.dir, 'scan.png')
+        image = Image.new('RGB', (1000, 600), 'white')
+        image.paste((255, 0, 0), (500, 0, 1000, 600))
+        image.save(self.image_name)
+
+    def tearDown(self) -> None:
+        shutil.rmtree(self.dir)
+
+    def test_pyramid(self):
+        pyramid = TilePyramid(self.image_name, tile_size=256)
+
+        self.assertEqual(3, pyramid.num_levels)
+        self.assertEqual({}, pyramid.levels)
+        self.assertEqual((250, 150), pyramid.level_image(2).size)
+        self.assertEqual([0, 2], sorted(pyramid.levels))
+        self.assertEqual((232, 88), pyramid.tile(0, 3, 2).size)
+        self.assertEqual([(1, 0), (2, 0)], pyramid.tiles_in(((300, 10), (600, 20))))
+        self.assertEqual([(0, 0)], pyramid.tiles_in(((300, 10), (600, 20)), level=2))
+        self.assertEqual(1, pyramid.level_for(0.3))
+
+    def test_jpeg_is_decoded_at_reduced_size(self):
+        jpeg_name = os.path.join(self.dir, 'scan.jpg')
+        Image.open(self.image_name).save(jpeg_name)
+        pyramid = TilePyramid(jpeg_name)
+
+        self.assertEqual((250, 150), pyramid.level_image(2).size)
+        self.assertNotIn(0, pyramid.levels)
+
+    def test_draw_background(self):
+        image = Image.new('RGB', (100, 100), 'black')
+        draw_background(image, load_background(self.image_name, origin=(-450, 0)), (0, -50), 0.5)
+
+        self.assertEqual((255, 255, 255), image.getpixel((5, 55)))
+        self.assertEqual((255, 0, 0), image.getpixel((95, 55)))
+        self.assertEqual((0, 0, 0), image.getpixel((5, 5)))
+
+    def test_export_png(self):
+        model = SketchModel()
+        model.set_background(load_background(self.image_name, origin=(100, 100)))
+        model.add_paths([[(0, 0), (50, 0)]])
+        png_name = os.path.join(self.dir, 'sketch.png')
+        export_png(model, png_name, margin=0)
+
+        image = Image.open(png_name).convert('RGB')
+        self.assertEqual((1100, 700), image.size)
+        self.assertEqual((255, 0, 0), image.getpixel((700, 300)))
+
+    def test_storage(self):
+        model = SketchModel()
+        model.set_background(load_background(self.image_name, origin=(10, 20)))
+        file_name = os.path.join(self.dir, 'sketch.isk')
+        save_model(model, file_name)
+
+        self.assertEqual(model.background, load_model(file_name).background)
+        self.assertEqual(model.background, pickle.loads(pickle.dumps(model)).background)
+        self.assertEqual((10, 20, 1010, 620), tuple(model.image_bbox().ul.xy + model.image_bbox().lr.xy))
+
+    def test_missing_image_is_skipped(self):
+        image = Image.new('RGB', (10, 10), 'black')
+        background = load_background(self.image_name)
+        os.remove(self.image_name)
+        draw_background(image, background)
+
+        self.assertEqual((0, 0, 0), image.getpixel((5, 5)))
+
+    def test_svg_image_position(self):
+        model = SketchModel()
+        model.set_background(load_background(self.image_name, origin=(100, 250)))
+        svg_name = os.path.join(self.dir, 'sketch.svg')
+        export_svg(model, svg_name)
+
+        image = ET.parse(svg_name).getroot().find('{http://www.w3.org/2000/svg}image')
+        self.assertEqual(('100', '250', '1000', '600'),
+                         (image.get('x'), image.get('y'), image.get('width'), image.get('height')))
+        self.assertEqual('scan.png', image.get('href'))
+
+    def test_layer_uses_level_of_scale(self):
+        canvas = _FakeCanvas()
+        layer = BackgroundLayer(canvas)
+        background = load_background(self.image_name, origin=(100, 0))
+        with patch('PIL.ImageTk.PhotoImage', lambda image, master: image):
+            layer.update(background, ((0, 0), (2000, 2000)))
+            self.assertEqual(12, len(layer.items))
+            self.assertEqual({0}, set(level for level, _, _ in layer.items))
+
+            layer.update(background, ((0, 0), (2000, 2000)), scale=0.25)
+            self.assertEqual([(2, 0, 0)], list(layer.items))
+            self.assertEqual(1, len(canvas.images))
+            (x, y), tile = next(iter(canvas.images.values()))
+            self.assertEqual((25, 0), (x, y))
+            self.assertEqual((250, 150), tile.size)
+
+
+class _FakeCanvas(object):
+    # Records the images of a BackgroundLayer instead of showing them
+
+    def __init__(self):
+        self.images = {}
+
+    def create_image(self, x, y, anchor, image, tags):
+        item = max(self.images, default=0) + 1
+        self.images[item] = (x, y), image
+        return item
+
+    def delete(self, item):
+        if item == 'background':
+            self.images = {}
+        else:
+            del self.images[item]
+
+    def tag_lower(self, tag):
+        pass
+
+
+if __name__ == '__main__':
+    unittest.main()
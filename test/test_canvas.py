@@ -0,0 +1,42 @@
+import unittest
+
+from ipysketch.canvas import ObjectVar, batch
+
+
+class Observer(object):
+
+    def __init__(self):
+        self.updates = 0
+
+    def update(self):
+        self.updates += 1
+
+
+class TestObjectVar(unittest.TestCase):
+
+    def test_unchanged_value_does_not_notify(self):
+        var = ObjectVar()
+        observer = Observer()
+        var.register(observer)
+        var.set(True)
+
+        var.set(True)
+
+        self.assertEqual(2, observer.updates)
+
+    def test_batch_updates_each_observer_once(self):
+        vars = [ObjectVar() for _ in range(3)]
+        observer = Observer()
+        for var in vars:
+            var.register(observer)
+
+        with batch():
+            for var in vars:
+                var.set(False)
+            vars[1].set(True)
+
+        self.assertEqual(3 + 1, observer.updates)
+
+
+if __name__ == '__main__':
+    unittest.main()
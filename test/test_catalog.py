@@ -0,0 +1,128 @@
+import os
+import shutil
+import tempfile
+import unittest
+from unittest.mock import patch
+
+from ipysketch.catalog import Catalog, CATALOG_NAME
+from ipysketch.document import Document
+from ipysketch.export import SavePipeline
+from ipysketch.model import Pen, SketchModel, save_model
+
+
+class TestCatalog(unittest.TestCase):
+
+    def setUp(self) -> None:
+        self.dir = tempfile.mkdtemp()
+        self.catalog = Catalog(self.dir)
+
+    def tearDown(self) -> None:
+        shutil.rmtree(self.dir)
+
+    def sketch(self, name, paths, pen=None):
+        model = SketchModel()
+        model.add_paths(paths, pens=pen)
+        file_name = os.path.join(self.dir, name + '.isk')
+        save_model(model, file_name)
+        return file_name
+
+    def test_update(self):
+        file_name = self.sketch('one', [[(0, 0), (100, 50)], [(10, 10), (20, 20), (30, 10)]],
+                                Pen(width=3, color='#ff0000'))
+        self.catalog.update(file_name)
+        entry = self.catalog.get('one')
+
+        self.assertTrue(os.path.exists(os.path.join(self.dir, CATALOG_NAME)))
+        self.assertEqual((1, 2, 5), (entry.pages, entry.strokes, entry.samples))
+        self.assertEqual([(3, '#ff0000', None)], entry.pens)
+        self.assertEqual(os.path.getmtime(file_name), entry.mtime)
+        self.assertEqual(64, len(entry.hash))
+        self.assertEqual((0, 0, 100, 50), entry.bbox)
+        self.assertEqual((110, 60), entry.thumbnail_image().size)
+
+    def test_refresh(self):
+        self.sketch('one', [[(0, 0), (1, 1)]])
+        os.mkdir(os.path.join(self.dir, 'lecture'))
+        self.sketch('lecture/two', [[(0, 0), (1, 1)], [(2, 2), (3, 3)]])
+
+        self.assertEqual((['lecture/two', 'one'], []), self.catalog.refresh())
+        self.assertEqual(([], []), self.catalog.refresh())
+        os.remove(os.path.join(self.dir, 'one.isk'))
+        self.assertEqual(([], ['one']), self.catalog.refresh())
+        self.assertEqual(1, len(self.catalog))
+
+    def test_find(self):
+        self.sketch('a', [[(0, 0), (1, 1)]])
+        self.sketch('b', [[(0, 0), (1, 1)], [(2, 2), (3, 3)]], Pen(color='#0000ff'))
+        self.sketch('c', [[(0, 0), (1, 1)]] * 3)
+        self.catalog.refresh()
+
+        self.assertEqual(['b'], [entry.name for entry in self.catalog.find(color='#0000ff')])
+        self.assertEqual(['c', 'b'], [entry.name for entry in
+                                      self.catalog.find(min_strokes=2, order_by='strokes', descending=True)])
+        self.assertEqual(['a'], [entry.name for entry in self.catalog.find(pattern='a*')])
+        self.assertEqual(2, len(self.catalog.find(limit=2)))
+        with self.assertRaises(Exception):
+            self.catalog.find(order_by='hash; DROP TABLE sketches')
+
+    def test_updated_on_save(self):
+        file_name = self.sketch('doc', [[(0, 0), (1, 1)]])
+        document = Document(file_name)
+        document.history(0).current().add_paths([[(5, 5), (6, 6)]])
+        document.add_page()
+        pipeline = SavePipeline(['.isk', '.png'], catalog=self.catalog)
+        try:
+            pipeline.save_document(document, os.path.join(self.dir, 'doc'))
+        finally:
+            pipeline.close()
+        entry = self.catalog.get('doc')
+
+        self.assertEqual((2, 2), (entry.pages, entry.strokes))
+        self.assertEqual(os.path.getmtime(file_name), entry.mtime)
+        self.assertEqual((0, 0, 6, 6), entry.bbox)
+
+    def test_unloaded_pages_are_not_read(self):
+        file_name = os.path.join(self.dir, 'doc.isk')
+        document = Document(file_name)
+        document.history(0).current().add_paths([[(0, 0), (10, 10)]], pens=Pen(color='#00ff00'))
+        document.add_page()
+        document.history(1).current().add_paths([[(20, 20), (30, 30), (40, 20)]])
+        pipeline = SavePipeline(['.isk'], catalog=self.catalog)
+        pipeline.save_document(document, os.path.join(self.dir, 'doc'))
+        pipeline.close()
+        thumbnail = self.catalog.get('doc').thumbnail
+
+        # Only the second page is loaded and changed
+        document = Document(file_name)
+        document.history(1).current().add_paths([[(50, 50), (60, 60)]])
+        with patch('ipysketch.catalog.load_model', side_effect=Exception('Page was read')):
+            pipeline.save_document(document, os.path.join(self.dir, 'doc'))
+            pipeline.close()
+        entry = self.catalog.get('doc')
+
+        self.assertEqual((2, 3, 7), (entry.pages, entry.strokes, entry.samples))
+        self.assertEqual((0, 0, 60, 60), entry.bbox)
+        self.assertEqual(['#00ff00', '#000000'], [color for _, color, _ in entry.pens])
+        self.assertEqual(thumbnail, entry.thumbnail)
+
+    def test_failed_update_does_not_fail_save(self):
+        file_name = self.sketch('broken', [[(0, 0), (1, 1)]])
+        model = SketchModel()
+        model.add_paths([[(0, 0), (1, 1)]])
+        pipeline = SavePipeline(['.isk'], catalog=self.catalog)
+        with patch.object(self.catalog, 'update', side_effect=Exception('database is locked')):
+            with self.assertWarns(UserWarning):
+                written = pipeline.save(model, os.path.join(self.dir, 'broken'))
+                pipeline.close()
+
+        self.assertEqual([file_name], written)
+        self.assertIsNone(self.catalog.get('broken'))
+
+    def test_thumbnail_is_scaled_down(self):
+        self.catalog.update(self.sketch('large', [[(0, 0), (1000, 500)]]))
+
+        self.assertEqual(128, self.catalog.get('large').thumbnail_image().size[0])
+
+
+if __name__ == '__main__':
+    unittest.main()
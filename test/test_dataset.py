@@ -0,0 +1,88 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+import numpy as np
+
+from ipysketch.dataset import convert_sketches, dataset_from_models, load_dataset, save_dataset
+from ipysketch.model import Pen, SketchModel, save_model
+
+try:
+    import pyarrow
+except ImportError:
+    pyarrow = None
+
+
+class TestDataset(unittest.TestCase):
+
+    def setUp(self) -> None:
+        self.dir = tempfile.mkdtemp()
+        self.model = SketchModel()
+        self.model.add_paths([[(0, 0), (10, 0), (10, 10)], [(5, 5), (6, 6)]])
+        self.model.add_paths([[(1, 2), (3, 4), (5, 6), (7, 8)]], pens=Pen(width=3, color='red', dash=(4, 2)))
+
+    def tearDown(self) -> None:
+        shutil.rmtree(self.dir)
+
+    def assert_dataset(self, dataset):
+        self.assertEqual(3, len(dataset))
+        self.assertEqual(9, dataset.num_samples)
+        self.assertEqual([0, 3, 5, 9], list(dataset.offsets))
+        np.testing.assert_array_equal([[5, 5], [6, 6]], dataset.path(1))
+        self.assertEqual(['a', 'b'], dataset.names)
+        self.assertEqual([0, 0, 1], list(dataset.sketch_ids))
+        self.assertEqual([1, 1, 3], list(dataset.pen_widths))
+        self.assertEqual([0, 0, 0xff0000], list(dataset.pen_colors))
+        self.assertEqual(['', '', '4,2'], list(dataset.pen_dashes))
+
+    def dataset(self):
+        second = SketchModel()
+        second.paths = self.model.paths[2:]
+        first = SketchModel()
+        first.paths = self.model.paths[:2]
+        return dataset_from_models([('a', 0, first), ('b', 0, second)])
+
+    def test_dataset_from_models(self):
+        dataset = self.dataset()
+
+        self.assert_dataset(dataset)
+        self.assertEqual(np.float32, dataset.coords.dtype)
+
+    def test_npz_is_memory_mapped(self):
+        file_name = os.path.join(self.dir, 'strokes.npz')
+        save_dataset(self.dataset(), file_name)
+        dataset = load_dataset(file_name)
+
+        self.assert_dataset(dataset)
+        self.assertIsInstance(dataset.coords, np.memmap)
+        self.assert_dataset(load_dataset(file_name, mmap=False))
+
+    @unittest.skipUnless(pyarrow, 'pyarrow is not installed')
+    def test_arrow(self):
+        file_name = os.path.join(self.dir, 'strokes.arrow')
+        save_dataset(self.dataset(), file_name)
+
+        self.assert_dataset(load_dataset(file_name))
+
+    def test_convert_sketches(self):
+        os.mkdir(os.path.join(self.dir, 'sketches'))
+        save_model(self.model, os.path.join(self.dir, 'sketches', 'one.isk'))
+        save_model(SketchModel(), os.path.join(self.dir, 'two.isk'))
+        file_name = os.path.join(self.dir, 'strokes.npz')
+        convert_sketches([os.path.join(self.dir, 'sketches'), os.path.join(self.dir, 'two.isk')], file_name,
+                         workers=2)
+        dataset = load_dataset(file_name)
+
+        self.assertEqual(3, len(dataset))
+        self.assertEqual(2, len(dataset.names))
+        self.assertTrue(dataset.names[0].endswith('one'))
+        self.assertEqual([0, 0, 0], list(dataset.sketch_ids))
+
+    def test_unknown_format(self):
+        with self.assertRaises(Exception):
+            save_dataset(self.dataset(), os.path.join(self.dir, 'strokes.csv'))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,46 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+from PIL import Image
+
+from ipysketch.deepzoom import export_deep_zoom, pyramid_levels
+from ipysketch.model import SketchModel, Point, Pen
+
+
+class TestDeepZoomExport(unittest.TestCase):
+
+    def setUp(self) -> None:
+        self.dir = tempfile.mkdtemp()
+        self.name = os.path.join(self.dir, 'sketch')
+        self.model = SketchModel()
+        self.model.start_path(Point(0, 0), Pen(color='#ff0000', width=4))
+        self.model.continue_path(Point(300, 100))
+        self.model.finish_path(Point(600, 200))
+
+    def tearDown(self) -> None:
+        shutil.rmtree(self.dir)
+
+    def test_writes_tile_pyramid(self):
+        dzi = export_deep_zoom(self.model, self.name, workers=1)
+
+        self.assertTrue(os.path.exists(dzi))
+        levels = pyramid_levels(640, 240)
+        self.assertEqual(levels, len(os.listdir(self.name + '_files')))
+        top = os.path.join(self.name + '_files', str(levels - 1))
+        self.assertEqual(sorted(['0_0.png', '1_0.png', '2_0.png']), sorted(os.listdir(top)))
+        tile = Image.open(os.path.join(top, '2_0.png'))
+        self.assertEqual((640 - 512, 240), tile.size)
+        self.assertEqual((255, 0, 0), Image.open(os.path.join(top, '0_0.png')).convert('RGB').getpixel((170, 70)))
+        self.assertEqual((1, 1), Image.open(os.path.join(self.name + '_files', '0', '0_0.png')).size)
+
+    def test_parallel_export(self):
+        export_deep_zoom(self.model, self.name, workers=2)
+
+        top = os.path.join(self.name + '_files', str(pyramid_levels(640, 240) - 1))
+        self.assertEqual(3, len(os.listdir(top)))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,94 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+from ipysketch.document import Document, page_name
+from ipysketch.export import SavePipeline
+from ipysketch.model import Point, load_model
+from ipysketch.storage import count_pages
+
+
+def draw_line(history, y):
+    history.new()
+    model = history.current()
+    model.start_path(Point(0, y))
+    model.finish_path(Point(100, y))
+
+
+class TestDocument(unittest.TestCase):
+
+    def setUp(self) -> None:
+        self.dir = tempfile.mkdtemp()
+        self.name = os.path.join(self.dir, 'sketch')
+        self.file_name = self.name + '.isk'
+
+    def tearDown(self) -> None:
+        shutil.rmtree(self.dir)
+
+    def create_document(self, num_pages):
+        document = Document(self.file_name)
+        for k in range(num_pages):
+            if k > 0:
+                document.activate(document.add_page())
+            for j in range(k + 1):
+                draw_line(document.history(), 10 * j)
+            document.touch()
+        pipeline = SavePipeline(('.isk', '.png'))
+        pipeline.save_document(document, self.name)
+        pipeline.close()
+        return document
+
+    def test_save_pages(self):
+        self.create_document(3)
+
+        self.assertEqual(3, count_pages(self.file_name))
+        self.assertEqual([1, 2, 3], [len(load_model(self.file_name, k).paths) for k in range(3)])
+        for k in range(3):
+            self.assertTrue(os.path.exists(page_name(self.name, k) + '.png'))
+        self.assertTrue(os.path.exists(self.name + '.png'))
+
+    def test_pages_are_loaded_lazily(self):
+        self.create_document(5)
+
+        document = Document(self.file_name, keep=1)
+        self.assertEqual(5, len(document))
+        self.assertEqual([False] * 5, [page.loaded for page in document.pages])
+
+        document.activate(3)
+        self.assertEqual(4, len(document.history().current().paths))
+        self.assertEqual([2, 4], document.neighbours())
+        self.assertEqual([False, False, False, True, False], [page.loaded for page in document.pages])
+
+        document.history(0)
+        document.activate(4)
+        self.assertEqual([False, False, False, True, True], [page.loaded for page in document.pages])
+
+    def test_unchanged_pages_are_copied(self):
+        self.create_document(3)
+
+        document = Document(self.file_name)
+        document.activate(1)
+        draw_line(document.history(), 50)
+        document.touch()
+        pipeline = SavePipeline(('.isk',))
+        pipeline.save_document(document, self.name)
+        pipeline.close()
+
+        self.assertEqual([1, 3, 3], [len(load_model(self.file_name, k).paths) for k in range(3)])
+        self.assertFalse(document.pages[1].modified)
+
+    def test_modified_pages_stay_in_memory(self):
+        self.create_document(4)
+
+        document = Document(self.file_name, keep=0)
+        draw_line(document.history(0), 50)
+        document.touch()
+        document.activate(3)
+
+        self.assertTrue(document.pages[0].loaded)
+        self.assertEqual(2, len(document.history(0).current().paths))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,142 @@
+import pickle
+import unittest
+
+from ipysketch.constants import *
+from ipysketch.events import EventBus, PATHS_ADDED, PATH_EXTENDED, PATH_FINISHED, PATHS_REMOVED, \
+    PATHS_TRANSFORMED, SELECTION_CHANGED, MODEL_REPLACED
+from ipysketch.index import PathIndex
+from ipysketch.model import SketchModel, History, Point
+from ipysketch.recording import HeadlessApplication, ReplayEvent
+from ipysketch.render import PillowRenderer
+
+
+class TestEventBus(unittest.TestCase):
+
+    def setUp(self) -> None:
+        self.scheduled = []
+        self.bus = EventBus(schedule=self.scheduled.append)
+        self.batches = []
+        self.bus.subscribe(self.batches.append)
+        self.model = SketchModel()
+        self.model.bus = self.bus
+
+    def test_events_are_batched(self):
+        self.model.start_path(Point(0, 0))
+        for x in range(1, 10):
+            self.model.continue_path(Point(x, 0))
+        self.model.finish_path(Point(10, 0))
+
+        self.assertEqual(1, len(self.scheduled))
+        self.assertEqual([], self.batches)
+        self.scheduled[0]()
+
+        events = self.batches[0]
+        self.assertEqual([PATHS_ADDED, PATH_EXTENDED, PATH_FINISHED], [event.kind for event in events])
+        self.assertIs(events[0].paths[0], events[2].old_paths[0])
+        self.assertIs(self.model.paths[0], events[2].paths[0])
+
+    def test_change_events(self):
+        self.model.add_paths([[(0, 0), (10, 0)], [(0, 20), (10, 20)]])
+        paths = list(self.model.paths)
+        self.model.selection = [paths[0]]
+        self.model.translate_paths([paths[0]], Point(5, 5))
+        self.model.erase_paths([paths[1]])
+        self.bus.flush()
+
+        kinds = [event.kind for event in self.batches[0]]
+        self.assertEqual([PATHS_ADDED, SELECTION_CHANGED, PATHS_TRANSFORMED, PATHS_REMOVED], kinds)
+        transformed = self.batches[0][2]
+        self.assertEqual([paths[0]], transformed.old_paths)
+        self.assertEqual([self.model.paths[0]], transformed.paths)
+        self.assertEqual([paths[1]], self.batches[0][3].paths)
+
+    def test_filter_by_kind(self):
+        removed = []
+        self.bus.subscribe(removed.extend, kinds=(PATHS_REMOVED,))
+        self.model.add_paths([[(0, 0), (10, 0)]])
+        self.model.erase_paths(self.model.paths)
+        self.bus.flush()
+
+        self.assertEqual([PATHS_REMOVED], [event.kind for event in removed])
+
+    def test_bus_is_not_pickled(self):
+        self.model.add_paths([[(0, 0), (10, 0)]])
+
+        self.assertIsNone(pickle.loads(pickle.dumps(self.model)).bus)
+        self.assertIs(self.bus, self.model.clone().bus)
+
+    def test_undo_replaces_model(self):
+        history = History(SketchModel(), bus=self.bus)
+        history.new()
+        history.current().add_paths([[(0, 0), (10, 0)]])
+        history.back()
+        self.bus.flush()
+
+        event = self.batches[0][-1]
+        self.assertEqual(MODEL_REPLACED, event.kind)
+        self.assertIs(history.current(), event.model)
+
+
+class TestControllerEvents(unittest.TestCase):
+
+    def test_eraser_emits_removal(self):
+        app = HeadlessApplication()
+        events = []
+        app.events.subscribe(events.extend)
+        controller = app.canvas_controller
+        controller.on_button_down(ReplayEvent(100, 100))
+        controller.on_button_up(ReplayEvent(200, 100))
+
+        app.action = ACTION_ERASE
+        controller.on_button_down(ReplayEvent(150, 100))
+        controller.on_button_up(ReplayEvent(150, 101))
+
+        self.assertEqual([PATHS_ADDED, PATH_FINISHED, PATHS_REMOVED], [event.kind for event in events])
+
+    def test_canvas_follows_model(self):
+        renderer = PillowRenderer()
+        app = HeadlessApplication(renderer=renderer)
+        app.trigger_dirty()
+        path, = app.model.add_paths([[(0, 0), (10, 0)]])
+
+        self.assertEqual([path.uuid], list(renderer.items))
+        self.assertTrue(app.dirty.get())
+
+        app.undo(None)
+        self.assertEqual({}, renderer.items)
+        app.redo(None)
+        app.model.selection = [app.model.paths[0]]
+        self.assertTrue(renderer.items[path.uuid][1])
+
+        app.model.configure_layer(app.model.active_layer, visible=False)
+        self.assertEqual({}, renderer.items)
+
+
+class TestPathIndex(unittest.TestCase):
+
+    def test_index_follows_model(self):
+        app = HeadlessApplication()
+        index = app.canvas_controller.index
+        app.trigger_dirty()
+        near, far = app.model.add_paths([[(0, 0), (10, 0)], [(1000, 1000), (1010, 1000)]])
+
+        self.assertEqual([near], index.candidates(Point(5, 5), Point(6, 5), ERASER_RADIUS))
+        app.trigger_dirty()
+        app.model.erase_paths([near])
+        self.assertEqual([], index.candidates(Point(5, 5), Point(6, 5), ERASER_RADIUS))
+
+        app.undo(None)
+        self.assertEqual(near.uuid, index.candidates(Point(5, 5), Point(6, 5), ERASER_RADIUS)[0].uuid)
+        app.model.configure_layer(app.model.active_layer, locked=True)
+        self.assertEqual([], index.candidates(Point(1000, 1000), Point(1000, 1000), ERASER_RADIUS))
+
+    def test_unfinished_paths_are_not_indexed(self):
+        model = SketchModel()
+        model.start_path(Point(0, 0))
+        index = PathIndex(model)
+
+        self.assertEqual({}, index.paths)
+
+
+if __name__ == '__main__':
+    unittest.main()
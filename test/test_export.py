@@ -0,0 +1,153 @@
+import os
+import shutil
+import tempfile
+import time
+import unittest
+
+import numpy as np
+from PIL import Image
+
+from ipysketch.export import SavePipeline, atomic_file, export_png
+from ipysketch.model import SketchModel, Point, Pen, load_model, save_model
+from ipysketch.raster import reduce_colors, save_png
+
+
+def slow_exporter(model, file_name):
+    time.sleep(0.2)
+    with open(file_name, 'w') as f:
+        f.write(str(len(model.paths)))
+
+
+def failing_exporter(model, file_name):
+    with open(file_name, 'w') as f:
+        f.write('partial')
+    raise ValueError('broken exporter')
+
+
+class TestSavePipeline(unittest.TestCase):
+
+    def setUp(self) -> None:
+        self.dir = tempfile.mkdtemp()
+        self.name = os.path.join(self.dir, 'sketch')
+        self.model = SketchModel()
+        self.model.start_path(Point(0, 0), Pen(color='#ff0000', width=4))
+        self.model.continue_path(Point(50, 30))
+        self.model.finish_path(Point(100, 60))
+
+    def tearDown(self) -> None:
+        shutil.rmtree(self.dir)
+
+    def test_writes_all_outputs(self):
+        pipeline = SavePipeline(('.isk', '.png', '.svg', '.pdf'))
+        written = pipeline.save(self.model, self.name)
+        pipeline.close()
+
+        self.assertEqual([self.name + suffix for suffix in ('.isk', '.png', '.svg', '.pdf')], written)
+        self.assertEqual(1, len(load_model(self.name + '.isk').paths))
+        self.assertEqual((140, 100), Image.open(self.name + '.png').size)
+        self.assertEqual(['sketch.isk', 'sketch.pdf', 'sketch.png', 'sketch.svg'], sorted(os.listdir(self.dir)))
+
+    def test_exporters_run_concurrently(self):
+        pipeline = SavePipeline({'.a': slow_exporter, '.b': slow_exporter, '.c': slow_exporter})
+        start = time.perf_counter()
+        pipeline.save(self.model, self.name)
+        elapsed = time.perf_counter() - start
+        pipeline.close()
+
+        self.assertLess(elapsed, 0.5)
+        with open(self.name + '.b') as f:
+            self.assertEqual('1', f.read())
+
+    def test_process_pool(self):
+        pipeline = SavePipeline(('.isk', '.svg'), processes=True)
+        pipeline.save(self.model, self.name)
+        pipeline.close()
+
+        self.assertEqual(1, len(load_model(self.name + '.isk').paths))
+
+    def test_failed_export_keeps_old_file(self):
+        with open(self.name + '.x', 'w') as f:
+            f.write('old')
+
+        pipeline = SavePipeline({'.x': failing_exporter, '.isk': save_model})
+        with self.assertRaises(Exception):
+            pipeline.save(self.model, self.name)
+        pipeline.close()
+
+        with open(self.name + '.x') as f:
+            self.assertEqual('old', f.read())
+        self.assertEqual(['sketch.isk', 'sketch.x'], sorted(os.listdir(self.dir)))
+
+    def test_empty_model_removes_images(self):
+        pipeline = SavePipeline()
+        pipeline.save(self.model, self.name)
+        pipeline.save(SketchModel(), self.name)
+        pipeline.close()
+
+        self.assertEqual(['sketch.isk'], os.listdir(self.dir))
+
+    def test_atomic_file(self):
+        file_name = os.path.join(self.dir, 'file.txt')
+        with atomic_file(file_name) as temp_name:
+            self.assertFalse(os.path.exists(file_name))
+            with open(temp_name, 'w') as f:
+                f.write('done')
+        with open(file_name) as f:
+            self.assertEqual('done', f.read())
+
+    def test_atomic_file_permissions(self):
+        reference = os.path.join(self.dir, 'reference.txt')
+        open(reference, 'w').close()
+        file_name = os.path.join(self.dir, 'file.txt')
+        with atomic_file(file_name) as temp_name:
+            open(temp_name, 'w').close()
+        self.assertEqual(os.stat(reference).st_mode, os.stat(file_name).st_mode)
+
+        os.chmod(file_name, 0o640)
+        with atomic_file(file_name) as temp_name:
+            open(temp_name, 'w').close()
+        self.assertEqual(0o640, os.stat(file_name).st_mode & 0o777)
+
+
+class TestPNGEncoding(unittest.TestCase):
+
+    def setUp(self) -> None:
+        self.dir = tempfile.mkdtemp()
+        self.file_name = os.path.join(self.dir, 'image.png')
+
+    def tearDown(self) -> None:
+        shutil.rmtree(self.dir)
+
+    def test_sketch_is_written_as_palette(self):
+        model = SketchModel()
+        model.add_paths([[(0, 0), (100, 50)], [(0, 50), (100, 0)]], pens=[Pen(color='#ff0000', width=3), Pen()])
+        export_png(model, self.file_name)
+
+        image = Image.open(self.file_name)
+        self.assertEqual('P', image.mode)
+        self.assertEqual(3, len(image.convert('RGB').getcolors()))
+
+    def test_color_types(self):
+        gradient = np.repeat(np.arange(256, dtype=np.uint8)[None, :, None], 3, axis=2).repeat(4, axis=0)
+        self.assertEqual('L', reduce_colors(Image.fromarray(gradient))[0].mode)
+        noise = np.random.RandomState(0).randint(0, 256, (32, 32, 3)).astype(np.uint8)
+        self.assertEqual('RGB', reduce_colors(Image.fromarray(noise))[0].mode)
+
+        image = Image.new('RGBA', (20, 20), (255, 255, 255, 0))
+        image.paste((0, 0, 255, 255), (5, 5, 10, 10))
+        indexed, options = reduce_colors(image)
+        self.assertEqual(('P', 1), (indexed.mode, options['bits']))
+        self.assertEqual(2, len(options['transparency']))
+
+    def test_encoding_is_lossless(self):
+        image = Image.new('RGBA', (64, 64), (255, 255, 255, 0))
+        for k, color in enumerate(((255, 0, 0, 255), (0, 128, 0, 128), (10, 20, 30, 255))):
+            image.paste(color, (k * 10, 0, k * 10 + 30, 64))
+        for effort in ('fast', 'default', 'max'):
+            save_png(image, self.file_name, effort)
+            np.testing.assert_array_equal(np.asarray(image), np.asarray(Image.open(self.file_name).convert('RGBA')))
+        self.assertRaises(Exception, save_png, image, self.file_name, 'extreme')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,128 @@
+import os
+import pickle
+import tempfile
+import unittest
+
+from ipysketch.constants import *
+from ipysketch.model import SketchModel, Point, load_model, save_model
+from ipysketch.recording import HeadlessApplication, draw_stroke
+
+
+def layered_model():
+    """ A model with a path on the bottom layer, one on the top layer and another one on the bottom layer. """
+    model = SketchModel()
+    bottom = model.active_layer
+    model.add_paths([[(0, 0), (100, 0)]])
+    top = model.add_layer('Notes').uuid
+    model.add_paths([[(0, 10), (100, 10)]])
+    model.active_layer = bottom
+    model.add_paths([[(0, 20), (100, 20)]])
+    return model, bottom, top
+
+
+class TestLayers(unittest.TestCase):
+
+    def test_visible_paths_are_stacked_by_layer(self):
+        model, bottom, top = layered_model()
+
+        self.assertEqual([0, 20, 10], [path.coords[0, 1] for path in model.visible_paths()])
+        model.configure_layer(top, visible=False)
+        self.assertEqual([0, 20], [path.coords[0, 1] for path in model.visible_paths()])
+        model.move_layer(top, 0)
+        model.configure_layer(top, visible=True)
+        self.assertEqual([10, 0, 20], [path.coords[0, 1] for path in model.visible_paths()])
+
+    def test_hidden_and_locked_layers_are_not_editable(self):
+        model, bottom, top = layered_model()
+        model.selection = list(model.paths)
+
+        model.configure_layer(bottom, locked=True)
+        self.assertEqual([10], [path.coords[0, 1] for path in model.editable_paths()])
+        self.assertEqual([10], [path.coords[0, 1] for path in model.selection])
+        model.configure_layer(top, visible=False)
+        self.assertEqual([], model.editable_paths())
+
+    def test_layer_changes_are_undoable(self):
+        app = HeadlessApplication()
+        draw_stroke(app, ((100, 100), (200, 100)))
+        app.change_layers(lambda model: model.configure_layer(model.active_layer, visible=False))
+        layer = app.change_layers(lambda model: model.add_layer('Notes'))
+
+        self.assertEqual(['Layer 1', 'Notes'], [layer.name for layer in app.model.layers])
+        self.assertEqual(layer.uuid, app.model.active_layer)
+        app.undo(None)
+        self.assertEqual(1, len(app.model.layers))
+        self.assertFalse(app.model.layer().visible)
+        app.undo(None)
+        self.assertTrue(app.model.layer().visible)
+        self.assertEqual(1, len(app.model.paths))
+
+    def test_eraser_skips_locked_layer(self):
+        app = HeadlessApplication()
+        draw_stroke(app, ((100, 100), (200, 100)))
+        app.model.configure_layer(app.model.active_layer, locked=True)
+        app.model.add_layer()
+        draw_stroke(app, ((100, 120), (200, 120)))
+
+        app.action = ACTION_ERASE
+        draw_stroke(app, ((150, 90), (150, 110), (150, 130)))
+
+        self.assertEqual(1, len(app.model.paths))
+        self.assertEqual(100, app.model.paths[0].coords[0, 1])
+
+    def test_no_drawing_on_hidden_layer(self):
+        app = HeadlessApplication()
+        app.model.configure_layer(app.model.active_layer, visible=False)
+        draw_stroke(app, ((100, 100), (150, 100), (200, 100)))
+
+        self.assertEqual(0, len(app.model.paths))
+
+    def test_remove_layer_removes_its_paths(self):
+        model, bottom, top = layered_model()
+
+        model.remove_layer(bottom)
+        self.assertEqual([top], [layer.uuid for layer in model.layers])
+        self.assertEqual([10], [path.coords[0, 1] for path in model.paths])
+        self.assertEqual(top, model.active_layer)
+        self.assertRaises(Exception, model.remove_layer, top)
+
+
+class TestLayerStorage(unittest.TestCase):
+
+    def setUp(self) -> None:
+        fd, self.file_name = tempfile.mkstemp(suffix='.isk')
+        os.close(fd)
+
+    def tearDown(self) -> None:
+        os.remove(self.file_name)
+
+    def test_roundtrip(self):
+        model, bottom, top = layered_model()
+        model.configure_layer(top, locked=True)
+        save_model(model, self.file_name)
+
+        loaded = load_model(self.file_name)
+        self.assertEqual(['Layer 1', 'Notes'], [layer.name for layer in loaded.layers])
+        self.assertTrue(loaded.layer(top).locked)
+        self.assertEqual(bottom, loaded.active_layer)
+        self.assertEqual([bottom, top, bottom], [path.layer for path in loaded.paths])
+
+    def test_pickle(self):
+        model, bottom, top = layered_model()
+
+        loaded = pickle.loads(pickle.dumps(model))
+        self.assertEqual([0, 20, 10], [path.coords[0, 1] for path in loaded.visible_paths()])
+
+    def test_paths_without_layer(self):
+        model = SketchModel()
+        model.start_path(Point(0, 0))
+        model.finish_path(Point(10, 10))
+        model.paths[0].layer = None
+        top = model.add_layer().uuid
+
+        model.move_layer(top, 0)
+        self.assertEqual(model.layers[1].uuid, model.paths[0].layer)
+
+
+if __name__ == '__main__':
+    unittest.main()
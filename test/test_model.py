@@ -0,0 +1,333 @@
+import pickle
+import unittest
+from unittest.mock import patch
+
+import numpy as np
+
+from ipysketch.model import REFERENCE_SIZE_ESTIMATE, History, SketchModel, SpilledModel, Path, Point, Pen, \
+    filter_paths_swept, smooth_paths, tessellate
+
+
+class TestHistory(unittest.TestCase):
+
+    def test_spills_models_beyond_memory_budget(self):
+        history = History(SketchModel(), memory_budget=1000)
+        for k in range(10):
+            history.new()
+            model = history.current()
+            model.start_path(Point(k, k))
+            model.continue_path(Point(k + 1, k))
+            model.finish_path(Point(k + 2, k))
+
+        spilled = [m for m in history.models if isinstance(m, SpilledModel)]
+        self.assertTrue(spilled)
+        self.assertFalse(isinstance(history.models[-1], SpilledModel))
+
+        for k in range(10):
+            history.back()
+        self.assertEqual(0, len(history.current().paths))
+
+        history.forward()
+        self.assertEqual(1, len(history.current().paths))
+        self.assertEqual(0, history.current().paths[0].points[0].x)
+
+    def test_resident_size_stays_within_budget(self):
+        budget = 30000
+        history = History(SketchModel(), memory_budget=budget)
+
+        def check():
+            # Each path in memory counts once, however many models share it
+            resident = [m for m in history.models if not isinstance(m, SpilledModel)]
+            paths = {id(path): path for m in resident for path in m.paths}
+            size = sum(path.nbytes for path in paths.values()) + \
+                REFERENCE_SIZE_ESTIMATE * sum(len(m.paths) for m in resident)
+            self.assertLessEqual(size, budget)
+
+        for k in range(40):
+            history.new()
+            check()
+            model = history.current()
+            model.add_paths([[(k, j) for j in range(20)]])
+            if k % 3 == 2:
+                model.erase_paths(model.paths[:1])
+            if k % 10 == 9:
+                # Undo and redo reload spilled models as unshared copies
+                for step in [history.back] * 6 + [history.forward] * 6:
+                    step()
+                    check()
+
+    def test_spill_file_is_compacted(self):
+        history = History(SketchModel(), memory_budget=1000)
+        with patch('ipysketch.model.SPILL_COMPACT_MIN', 0):
+            for k in range(30):
+                history.new()
+                history.current().add_paths([[(k, k), (k + 1, k)]])
+                if k % 5 == 4:
+                    # Branching off drops the spilled models after the current one
+                    for _ in range(4):
+                        history.back()
+            lengths = [spilled.length for spilled in history._spilled.values()]
+            history._spill_file.seek(0, 2)
+
+            self.assertLessEqual(history._spill_file.tell(), 2 * sum(lengths) + max(lengths))
+            self.assertEqual(6, len(history.current().paths))
+            history.back()
+            self.assertEqual(5, len(history.current().paths))
+
+        history.close()
+        self.assertIsNone(history._spill_file)
+        self.assertEqual(5, len(history.current().paths))
+        history.back()
+        self.assertEqual(4, len(history.current().paths))
+
+    def test_unlimited_budget_keeps_models(self):
+        history = History(SketchModel(), memory_budget=None)
+        for k in range(5):
+            history.new()
+
+        self.assertFalse(any(isinstance(m, SpilledModel) for m in history.models))
+
+    def test_transaction_creates_one_entry(self):
+        history = History(SketchModel())
+        history.begin()
+        for k in range(3):
+            history.new()
+            history.current().start_path(Point(k, k))
+        history.commit()
+
+        self.assertEqual(2, len(history.models))
+        self.assertEqual(3, len(history.current().paths))
+
+    def test_abort_discards_changes(self):
+        history = History(SketchModel())
+        history.begin()
+        history.new()
+        history.current().start_path(Point(0, 0))
+        history.abort()
+
+        self.assertEqual(1, len(history.models))
+        self.assertEqual(0, len(history.current().paths))
+
+
+class TestStyleTable(unittest.TestCase):
+
+    def test_paths_share_equal_pens(self):
+        model = SketchModel()
+        for k in range(10):
+            model.start_path(Point(k, k), Pen(color='#ff0000', width=2))
+            model.finish_path(Point(k + 1, k))
+
+        self.assertEqual(1, len(model.styles))
+        self.assertIs(model.paths[0].pen, model.paths[-1].pen)
+        self.assertIs(model.paths[0].pen, model.clone().paths[0].pen)
+
+    def test_pickle_roundtrip(self):
+        model = SketchModel()
+        model.start_path(Point(0, 0), Pen(color='#ff0000', width=2))
+        model.finish_path(Point(1, 1))
+        model.start_path(Point(2, 2), Pen(color='#0000ff', width=4))
+        model.finish_path(Point(3, 3))
+        model.selection = [model.paths[1]]
+
+        loaded = pickle.loads(pickle.dumps(model))
+
+        self.assertEqual(2, len(loaded.styles))
+        self.assertEqual('#0000ff', loaded.paths[1].pen.color)
+        self.assertEqual(model.paths[1].uuid, loaded.paths[1].uuid)
+        self.assertIs(loaded.paths[1], loaded.selection[0])
+
+
+class TestPath(unittest.TestCase):
+
+    def test_clone_shares_finished_paths(self):
+        model = SketchModel()
+        model.start_path(Point(0, 0))
+        model.continue_path(Point(1, 0))
+        model.finish_path(Point(2, 0))
+
+        clone = model.clone()
+
+        self.assertIs(model.paths[0], clone.paths[0])
+        self.assertFalse(model.paths[0].coords.flags.writeable)
+
+    def test_translate_creates_new_path(self):
+        model = SketchModel()
+        model.start_path(Point(0, 0))
+        model.finish_path(Point(2, 0))
+        path = model.paths[0]
+        clone = model.clone()
+
+        clone.translate_paths(clone.paths, Point(10, 5))
+
+        self.assertEqual(0, model.paths[0].points[0].x)
+        self.assertEqual(10, clone.paths[0].points[0].x)
+        self.assertEqual(path.uuid, clone.paths[0].uuid)
+        with self.assertRaises(Exception):
+            path.append(Point(3, 0))
+
+
+class TestEraserHitTest(unittest.TestCase):
+
+    def test_sweep_between_samples_hits_path(self):
+        model = SketchModel()
+        model.start_path(Point(0, 50))
+        model.finish_path(Point(100, 50))
+        model.start_path(Point(0, 200))
+        model.finish_path(Point(100, 200))
+
+        # Neither end of the sweep is close to the first path
+        found = filter_paths_swept(model.paths, Point(50, 0), Point(50, 100), radius=7)
+
+        self.assertEqual([model.paths[0]], found)
+
+    def test_distance_to_segment(self):
+        model = SketchModel()
+        model.start_path(Point(0, 0))
+        model.finish_path(Point(100, 0))
+
+        self.assertTrue(filter_paths_swept(model.paths, Point(50, 5), Point(50, 5), radius=7))
+        self.assertFalse(filter_paths_swept(model.paths, Point(50, 9), Point(60, 9), radius=7))
+
+
+class TestCutPaths(unittest.TestCase):
+
+    def test_cut_splits_path(self):
+        model = SketchModel()
+        model.start_path(Point(0, 0))
+        for x in range(10, 100, 10):
+            model.continue_path(Point(x, 0))
+        model.finish_path(Point(100, 0))
+        model.start_path(Point(0, 50))
+        model.finish_path(Point(100, 50))
+        path = model.paths[0]
+
+        removed, added = model.cut_paths([path], Point(50, -20), Point(50, 20), radius=7)
+
+        self.assertEqual([path], removed)
+        self.assertEqual(2, len(added))
+        self.assertEqual(added + [model.paths[-1]], model.paths)
+        self.assertLess(added[0].bounds()[1][0], 45)
+        self.assertGreater(added[1].bounds()[0][0], 55)
+        self.assertNotEqual(path.uuid, added[0].uuid)
+        self.assertIs(path.pen, added[1].pen)
+        # The pieces end at the boundary of the erased area
+        np.testing.assert_allclose([[43, 0], [57, 0]], [added[0].coords[-1], added[1].coords[0]], atol=1e-6)
+
+    def test_cut_two_point_line(self):
+        model = SketchModel()
+        model.add_paths([[(0, 0), (100, 0)]])
+
+        _, added = model.cut_paths(model.paths, Point(50, -20), Point(50, 20), radius=5)
+
+        self.assertEqual(2, len(added))
+        np.testing.assert_allclose([[0, 0], [45, 0]], added[0].coords, atol=1e-6)
+        np.testing.assert_allclose([[55, 0], [100, 0]], added[1].coords, atol=1e-6)
+
+    def test_untouched_path_is_kept(self):
+        model = SketchModel()
+        model.start_path(Point(0, 0))
+        model.finish_path(Point(100, 0))
+
+        removed, added = model.cut_paths(model.paths, Point(50, 20), Point(60, 20), radius=7)
+
+        self.assertEqual(([], []), (removed, added))
+
+
+class TestBulkPaths(unittest.TestCase):
+
+    def test_add_stacked_paths(self):
+        coords = np.arange(20, dtype=float).reshape(10, 2)
+        pens = [Pen(color='red'), Pen(color='blue'), Pen(color='red')]
+        model = SketchModel()
+        paths = model.add_paths(coords, [0, 4, 5, 10], pens)
+
+        self.assertEqual([4, 1, 5], [len(path) for path in paths])
+        self.assertIs(paths[0].pen, paths[2].pen)
+        self.assertFalse(paths[0].coords.flags.writeable)
+        np.testing.assert_array_equal(coords[5:], paths[2].coords)
+
+        stacked, offsets, pen_indices, table = model.path_arrays()
+        np.testing.assert_array_equal(coords, stacked)
+        np.testing.assert_array_equal([0, 4, 5, 10], offsets)
+        np.testing.assert_array_equal([0, 1, 0], pen_indices)
+        self.assertEqual([Pen(color='red'), Pen(color='blue')], table)
+
+    def test_add_list_of_paths(self):
+        model = SketchModel()
+        model.add_paths([[(0, 0), (10, 0)], np.array([[5., 5.]])], pens=Pen(width=3))
+
+        self.assertEqual(2, len(model.paths))
+        self.assertEqual(3, model.paths[1].pen.width)
+        self.assertEqual(1, len(model.styles))
+
+    def test_invalid_offsets(self):
+        with self.assertRaises(Exception):
+            SketchModel().add_paths(np.zeros((4, 2)), [0, 2, 2, 4])
+
+
+class TestSmoothPaths(unittest.TestCase):
+
+    def test_matches_cubic_interpolation(self):
+        from scipy.interpolate import interp1d
+
+        rng = np.random.default_rng(0)
+        paths = [np.cumsum(rng.normal(size=(n, 2)) * 5, axis=0) for n in (1, 4, 5, 12, 30)]
+        paths[3][4] = paths[3][3]
+        offsets = np.concatenate(([0], np.cumsum([len(path) for path in paths])))
+        coords, new_offsets = smooth_paths(np.concatenate(paths), offsets)
+
+        for k, path in enumerate(paths):
+            smoothed = coords[new_offsets[k]:new_offsets[k + 1]]
+            if len(path) <= 4:
+                np.testing.assert_array_equal(path, smoothed)
+                continue
+            values = path[:-1][np.concatenate(([True], np.any(np.diff(path[:-1], axis=0) != 0, axis=1)))]
+            sigma = np.concatenate(([0.], np.cumsum(np.hypot(*np.diff(values, axis=0).T))))
+            expected = interp1d(sigma, values, kind='cubic', axis=0)(np.arange(0, sigma[-1], 1.))
+            np.testing.assert_allclose(expected, smoothed, atol=1e-6)
+
+    def test_add_paths_smooths_like_drawing(self):
+        coords = [(0, 0), (10, 5), (20, 0), (30, 5), (40, 0), (40, 0)]
+        model = SketchModel()
+        model.start_path(Point(*coords[0]))
+        for x, y in coords[1:-1]:
+            model.continue_path(Point(x, y))
+        model.finish_path(Point(*coords[-1]))
+        added = model.add_paths([coords], smooth=True)[0]
+
+        np.testing.assert_allclose(model.paths[0].coords, added.coords)
+
+
+class TestTessellation(unittest.TestCase):
+
+    def test_parabolic_segments(self):
+        coords = np.array([(0., 0.), (10., 10.), (20., 0.)])
+        polyline = tessellate(coords)
+
+        self.assertEqual((0, 0), tuple(polyline[0]))
+        self.assertEqual((20, 0), tuple(polyline[-1]))
+        # The points lie on the parabola with the middle point as control point
+        np.testing.assert_allclose(polyline[:, 0] * (1 - polyline[:, 0] / 20), polyline[:, 1])
+        self.assertEqual(6, len(polyline))
+
+    def test_straight_lines_are_not_subdivided(self):
+        coords = np.array([(x, 2. * x) for x in range(10)])
+
+        self.assertEqual(9, len(tessellate(coords)))
+        np.testing.assert_array_equal(coords[:2], tessellate(coords[:2]))
+
+    def test_cached_on_finished_paths(self):
+        path = Path(coords=[(0, 0), (10, 10), (20, 0), (30, 10)])
+        self.assertIs(path.tessellation(), path.tessellation())
+        self.assertFalse(path.tessellation().flags.writeable)
+
+        drawing = Path()
+        for point in ((0, 0), (10, 10), (20, 0)):
+            drawing.append(point)
+        self.assertIsNone(drawing._tessellation)
+        drawing.tessellation()
+        self.assertIsNone(drawing._tessellation)
+
+
+if __name__ == '__main__':
+    unittest.main()
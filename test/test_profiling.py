@@ -0,0 +1,44 @@
+import unittest
+from types import SimpleNamespace
+
+from ipysketch.profiling import RollingHistogram, LatencyProfiler
+
+
+class TestRollingHistogram(unittest.TestCase):
+
+    def test_window_drops_old_samples(self):
+        hist = RollingHistogram(window=3)
+        for value in (100, 1, 2, 3):
+            hist.add(value)
+
+        self.assertEqual(3, len(hist))
+        self.assertEqual(3, hist.percentile(100))
+
+    def test_counts(self):
+        hist = RollingHistogram(buckets=(1, 10))
+        for value in (0.5, 5, 50):
+            hist.add(value)
+
+        self.assertEqual([1, 1, 1], hist.counts())
+
+
+class TestLatencyProfiler(unittest.TestCase):
+
+    def test_splits_canvas_and_model_time(self):
+        profiler = LatencyProfiler()
+
+        profiler.begin_event('move', SimpleNamespace(time=1000))
+        profiler.begin_canvas()
+        profiler.count_items(2)
+        profiler.end_canvas()
+        profiler.end_event()
+
+        summary = profiler.summary()
+        self.assertEqual(1, summary['move.total']['count'])
+        self.assertEqual(2, summary['move.items']['max'])
+        self.assertEqual(0, summary['move.lag']['max'])
+        self.assertLessEqual(summary['move.canvas']['max'], summary['move.total']['max'])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,93 @@
+import os
+import tempfile
+import unittest
+from unittest.mock import patch
+
+from ipysketch.constants import *
+from ipysketch.model import Pen
+from ipysketch.recording import InputRecorder, HeadlessApplication, draw_stroke, \
+    save_session, load_session, replay
+
+
+class TestRecording(unittest.TestCase):
+
+    def setUp(self) -> None:
+        fd, self.file_name = tempfile.mkstemp(suffix='.isr')
+        os.close(fd)
+
+    def tearDown(self) -> None:
+        os.remove(self.file_name)
+
+    def test_save_and_load_session(self):
+        records = [(0, 'a', ACTION_DRAW), (0, 'p', '#ff0000', 4), (0, 'd', 10, 20),
+                   (16, 'm', 11, 21), (33, 'u', 12, 22), (40, 'z')]
+
+        save_session(records, self.file_name)
+
+        self.assertEqual(records, load_session(self.file_name))
+
+    def test_replay_headless(self):
+        app = HeadlessApplication()
+        app.recorder = InputRecorder()
+        app.pen = Pen(color='#ff0000', width=4)
+        draw_stroke(app, ((100, 100), (110, 120), (120, 140), (200, 200)))
+        app.action = ACTION_ERASE
+        draw_stroke(app, ((110, 121), (111, 121)))
+        app.action = ACTION_DRAW
+        draw_stroke(app, ((300, 300), (320, 330), (340, 350), (360, 360), (380, 390)))
+        app.recorder.save(self.file_name)
+
+        replayed = HeadlessApplication()
+        replay(load_session(self.file_name), replayed)
+
+        self.assertEqual(1, len(replayed.model.paths))
+        self.assertEqual('#ff0000', replayed.model.paths[0].pen.color)
+        self.assertEqual([(p.x, p.y) for p in app.model.paths[0].points],
+                         [(p.x, p.y) for p in replayed.model.paths[0].points])
+
+
+class TestGestures(unittest.TestCase):
+
+    def test_eraser_drag_is_one_undo_step(self):
+        app = HeadlessApplication()
+        for y in (100, 120, 140):
+            draw_stroke(app, ((100, y), (150, y), (200, y), (250, y), (300, y)))
+        num_models = len(app.history.models)
+
+        app.action = ACTION_ERASE
+        draw_stroke(app, ((150, 90), (150, 110), (150, 130), (150, 150)))
+
+        self.assertEqual(0, len(app.model.paths))
+        self.assertEqual(num_models + 1, len(app.history.models))
+        app.undo(None)
+        self.assertEqual(3, len(app.model.paths))
+
+    def test_eraser_miss_creates_no_undo_step(self):
+        app = HeadlessApplication()
+        draw_stroke(app, ((100, 100), (150, 100), (200, 100), (250, 100), (300, 100)))
+        num_models = len(app.history.models)
+
+        app.action = ACTION_ERASE
+        draw_stroke(app, ((150, 300), (150, 310)))
+
+        self.assertEqual(num_models, len(app.history.models))
+
+    def test_segment_eraser_without_cut_creates_no_undo_step(self):
+        app = HeadlessApplication()
+        draw_stroke(app, ((100, 100), (150, 100), (200, 100), (250, 100), (300, 100)))
+        num_models = len(app.history.models)
+        app.dirty.set(False)
+
+        app.action = ACTION_ERASE
+        app.erase_mode = ERASE_SEGMENTS
+        # The path is found as candidate, but the eraser does not come close enough to cut it
+        with patch('ipysketch.controller.filter_paths_swept', return_value=app.model.paths):
+            draw_stroke(app, ((150, 300), (150, 310)))
+
+        self.assertEqual(num_models, len(app.history.models))
+        self.assertFalse(app.dirty.get())
+        self.assertEqual(1, len(app.model.paths))
+
+
+if __name__ == '__main__':
+    unittest.main()
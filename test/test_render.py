@@ -0,0 +1,62 @@
+import unittest
+
+from ipysketch.constants import *
+from ipysketch.model import Pen
+from ipysketch.recording import HeadlessApplication, draw_stroke
+from ipysketch.render import PillowRenderer, NullRenderer
+
+
+class TestRenderers(unittest.TestCase):
+
+    def test_pillow_renderer_draws_paths(self):
+        renderer = PillowRenderer(width=300, height=300)
+        app = HeadlessApplication(renderer=renderer)
+        app.pen = Pen(color='#ff0000', width=4)
+
+        draw_stroke(app, ((100, 100), (150, 120), (200, 140), (250, 200)))
+
+        image = renderer.image()
+        self.assertEqual((300, 300), image.size)
+        self.assertEqual((255, 0, 0), image.getpixel((150, 120)))
+
+        app.action = ACTION_ERASE
+        draw_stroke(app, ((100, 100), (101, 100)))
+
+        self.assertEqual(0, len(app.model.paths))
+        self.assertEqual((255, 255), renderer.image().convert('L').getextrema())
+
+    def test_null_renderer_counts_operations(self):
+        renderer = NullRenderer()
+        app = HeadlessApplication(renderer=renderer)
+
+        draw_stroke(app, ((100, 100), (150, 120), (200, 140), (250, 200)))
+
+        # One update per model event: the path is started, extended twice and finished
+        self.assertEqual(4, renderer.counts['update_paths'])
+        self.assertEqual(1, len(app.model.paths))
+
+    def test_finished_paths_are_baked(self):
+        renderer = BakingRenderer()
+        app = HeadlessApplication(renderer=renderer)
+
+        draw_stroke(app, ((100, 100), (150, 120), (200, 140), (250, 200)))
+        draw_stroke(app, ((100, 200), (150, 220), (200, 240)))
+
+        self.assertEqual(app.model.paths, renderer.baked)
+        self.assertEqual(2, renderer.counts['bake_paths'])
+
+
+class BakingRenderer(NullRenderer):
+    # Records the paths handed to the raster cache
+
+    def __init__(self):
+        super().__init__()
+        self.baked = []
+
+    def bake_paths(self, model, paths):
+        self.counts['bake_paths'] += 1
+        self.baked.extend(paths)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,51 @@
+import os
+import subprocess
+import sys
+import time
+import unittest
+
+HEAVY_MODULES = ('scipy', 'shapely', 'ipywidgets', 'PIL', 'pkg_resources')
+
+# Upper bound for the time from process start to the first frame of the sketch pad
+MAX_TIME_TO_FIRST_FRAME = 3.
+
+
+def has_display():
+    return sys.platform in ('win32', 'darwin') or bool(os.environ.get('DISPLAY'))
+
+
+def time_to_first_frame(name='startup-benchmark'):
+    """ Start the sketch pad in a new process and measure the time until its window
+        has been drawn for the first time.
+
+    :param name: the name of the sketch to open
+    :return: time in seconds
+    """
+    code = ('from ipysketch.app import Application\n'
+            'app = Application(%r)\n'
+            'app.update()\n'
+            'app.destroy()\n' % name)
+    start = time.perf_counter()
+    subprocess.run([sys.executable, '-c', code], check=True)
+    return time.perf_counter() - start
+
+
+class TestStartup(unittest.TestCase):
+
+    def test_heavy_modules_are_loaded_lazily(self):
+        code = ('import sys\n'
+                'import ipysketch.app\n'
+                'print(",".join(m for m in %r if m in sys.modules))' % (HEAVY_MODULES,))
+
+        output = subprocess.run([sys.executable, '-c', code], check=True,
+                                stdout=subprocess.PIPE, universal_newlines=True).stdout
+
+        self.assertEqual('', output.strip())
+
+    @unittest.skipUnless(has_display(), 'needs a display')
+    def test_time_to_first_frame(self):
+        self.assertLess(time_to_first_frame(), MAX_TIME_TO_FIRST_FRAME)
+
+
+if __name__ == '__main__':
+    print('Time to first frame: %.3f s' % time_to_first_frame())
@@ -0,0 +1,100 @@
+import os
+import pickle
+import tempfile
+import unittest
+
+import numpy as np
+
+from ipysketch.model import SketchModel, History, Pen, Point, load_model, save_model
+from ipysketch.storage import ChunkedSketch, ProgressiveLoader, is_chunked, load_region
+
+
+def grid_model(num_x, num_y, spacing=200):
+    """ A model with one short path per grid cell, in row-major drawing order. """
+    model = SketchModel()
+    coords = [[(x * spacing, y * spacing), (x * spacing + 50, y * spacing + 20)]
+              for y in range(num_y) for x in range(num_x)]
+    model.add_paths(coords, pens=[Pen(color='#ff0000'), Pen(width=3)] * (num_x * num_y // 2))
+    return model
+
+
+class TestChunkedStorage(unittest.TestCase):
+
+    def setUp(self) -> None:
+        fd, self.file_name = tempfile.mkstemp(suffix='.isk')
+        os.close(fd)
+
+    def tearDown(self) -> None:
+        os.remove(self.file_name)
+
+    def test_roundtrip(self):
+        model = grid_model(10, 10)
+        model.selection = [model.paths[3]]
+        save_model(model, self.file_name)
+
+        self.assertTrue(is_chunked(self.file_name))
+        loaded = load_model(self.file_name)
+        self.assertEqual([path.uuid for path in model.paths], [path.uuid for path in loaded.paths])
+        np.testing.assert_array_equal(model.paths[57].coords, loaded.paths[57].coords)
+        self.assertEqual(model.paths[57].pen, loaded.paths[57].pen)
+        self.assertIs(loaded.paths[3], loaded.selection[0])
+        self.assertEqual(2, len(loaded.styles))
+
+    def test_region_reads_only_needed_chunks(self):
+        save_model(grid_model(20, 20), self.file_name)
+
+        sketch = ChunkedSketch(self.file_name)
+        self.assertEqual(64, len(sketch.chunks))
+        self.assertEqual(1, len(sketch.chunks_in(((0, 0), (100, 100)))))
+        region = load_region(self.file_name, ((0, 0), (100, 100)))
+        self.assertEqual(9, len(region.paths))
+
+    def test_legacy_pickle(self):
+        model = grid_model(2, 2)
+        with open(self.file_name, 'wb') as f:
+            pickle.dump(model, f)
+
+        self.assertFalse(is_chunked(self.file_name))
+        self.assertEqual(4, len(load_model(self.file_name).paths))
+
+
+class TestProgressiveLoader(unittest.TestCase):
+
+    def setUp(self) -> None:
+        fd, self.file_name = tempfile.mkstemp(suffix='.isk')
+        os.close(fd)
+        self.model = grid_model(20, 20)
+        save_model(self.model, self.file_name)
+
+    def tearDown(self) -> None:
+        os.remove(self.file_name)
+
+    def test_viewport_is_loaded_first(self):
+        history = History(SketchModel())
+        loader = ProgressiveLoader(ChunkedSketch(self.file_name), history, ((0, 0), (800, 600)))
+
+        self.assertEqual(9 + 9 + 6 + 6, len(history.current().paths))
+        self.assertFalse(loader.done)
+
+        while loader.step():
+            pass
+        self.assertEqual([path.uuid for path in self.model.paths],
+                         [path.uuid for path in history.current().paths])
+
+    def test_drawn_paths_stay_on_top(self):
+        history = History(SketchModel())
+        loader = ProgressiveLoader(ChunkedSketch(self.file_name), history, ((0, 0), (100, 100)))
+        history.new()
+        history.current().start_path(Point(0, 0))
+        history.current().finish_path(Point(10, 10))
+
+        loader.finish()
+
+        self.assertEqual(401, len(history.current().paths))
+        self.assertEqual(400, len(history.models[0].paths))
+        self.assertEqual(self.model.paths[0].uuid, history.current().paths[0].uuid)
+        self.assertEqual((10, 10), tuple(history.current().paths[-1].coords[-1]))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,77 @@
+import os
+import re
+import shutil
+import tempfile
+import unittest
+import xml.etree.ElementTree as ET
+import zlib
+
+import numpy as np
+
+from ipysketch.model import SketchModel, Point, Pen
+from ipysketch.vector import export_pdf, export_svg, simplify_coords, svg_path_data
+
+
+class TestPathData(unittest.TestCase):
+
+    def test_relative_quantized(self):
+        coords = np.array([[0.55, 1.0], [0.05, -2.25], [1.5, 0.5]])
+        self.assertEqual('M.6 1l-.6-3.2 1.5 2.7', svg_path_data(coords, precision=1))
+        self.assertEqual('M1 1l-1-3 2 2', svg_path_data(coords, precision=0))
+
+    def test_single_point(self):
+        self.assertEqual('M3 4l0 0', svg_path_data(np.array([[3., 4.]])))
+
+    def test_simplify(self):
+        coords = np.array([[0., 0.], [1., 0.1], [2., -0.1], [3., 5.], [4., 0.]])
+        np.testing.assert_array_equal([[0, 0], [2, -0.1], [3, 5], [4, 0]], simplify_coords(coords, 0.5))
+        np.testing.assert_array_equal(coords, simplify_coords(coords, 0))
+
+
+class TestVectorExport(unittest.TestCase):
+
+    def setUp(self) -> None:
+        self.dir = tempfile.mkdtemp()
+        self.model = SketchModel()
+        for k in range(3):
+            self.model.start_path(Point(0, 10 * k), Pen(color='#ff0000', width=4))
+            self.model.finish_path(Point(100, 10 * k))
+        self.model.start_path(Point(0, 50), Pen(color='#0000ff', width=2, dash=(4, 2)))
+        self.model.finish_path(Point(100, 50))
+
+    def tearDown(self) -> None:
+        shutil.rmtree(self.dir)
+
+    def test_svg(self):
+        file_name = os.path.join(self.dir, 'sketch.svg')
+        export_svg(self.model, file_name)
+
+        root = ET.parse(file_name).getroot()
+        ns = {'svg': 'http://www.w3.org/2000/svg'}
+        self.assertEqual('-20 -20 140 90', root.get('viewBox'))
+        paths = root.findall('svg:path', ns)
+        self.assertEqual(['p0', 'p0', 'p0', 'p1'], [path.get('class') for path in paths])
+        self.assertEqual('M0 10l100 0', paths[1].get('d'))
+        self.assertIn('stroke-dasharray:4,2', root.find('svg:style', ns).text)
+
+    def test_pdf(self):
+        file_name = os.path.join(self.dir, 'sketch.pdf')
+        export_pdf(self.model, file_name)
+
+        with open(file_name, 'rb') as f:
+            data = f.read()
+        self.assertTrue(data.startswith(b'%PDF'))
+        # All offsets of the cross reference table point to their objects
+        xref = int(re.search(rb'startxref\n(\d+)', data).group(1))
+        offsets = re.findall(rb'(\d{10}) 00000 n', data[xref:])
+        for k, offset in enumerate(offsets):
+            self.assertTrue(data[int(offset):].startswith(b'%d 0 obj' % (k + 1)))
+
+        content = zlib.decompress(re.search(rb'stream\n(.*)\nendstream', data, re.S).group(1)).decode()
+        # The pen is set only when it changes
+        self.assertEqual(2, content.count(' RG '))
+        self.assertIn('0 10 m 100 10 l S', content)
+
+
+if __name__ == '__main__':
+    unittest.main()